@@ -0,0 +1,115 @@
+"""Authorization from the JWT claims
+
+Tokens carry the role (user_type, is_admin) and the account status
+(active) of their owner, so the handlers know who is calling without
+loading the User row. The principal cache holds principals loaded from
+the database, with a short TTL. It serves tokens issued before the claims
+existed and the checks that need fresh data (fresh=True). Its entries
+are dropped when an account changes.
+"""
+import threading
+import time
+from collections import namedtuple
+from functools import wraps
+from flask import jsonify
+from flask_jwt_extended import current_user, jwt_required
+from models import db, User
+
+# name / email / address ne sont connus que des principaux chargés en base
+Principal = namedtuple(
+    'Principal', 'id user_type is_admin active name email address',
+    defaults=(None, None, None)
+)
+
+def user_claims(user):
+    """Claims added to the tokens of a user"""
+    return {'user_type': user.user_type, 'active': user.active}
+
+def admin_claims():
+    return {'user_type': 'admin', 'is_admin': True, 'active': True}
+
+def principal_from_claims(jwt_data):
+    is_admin = jwt_data.get('is_admin', False)
+    if 'user_type' not in jwt_data and not is_admin:
+        return None
+    return Principal(
+        id=int(jwt_data['sub']),
+        user_type=jwt_data.get('user_type', 'admin'),
+        is_admin=is_admin,
+        active=jwt_data.get('active', True)
+    )
+
+class PrincipalCache:
+    """User principals loaded from the database, kept ttl seconds"""
+
+    def __init__(self, ttl=60, max_entries=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry and now - entry[1] < self.ttl:
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        row = db.session.query(User.id, User.user_type, User.active, User.name, User.email, User.address)\
+            .filter(User.id == user_id)\
+            .first()
+        principal = Principal(row.id, row.user_type, False, row.active, row.name, row.email, row.address) if row else None
+        with self._lock:
+            if len(self._entries) >= self.max_entries:
+                self._entries.clear()
+            self._entries[user_id] = (principal, now)
+        return principal
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses, 'ttl': self.ttl}
+
+principal_cache = PrincipalCache()
+
+def load_principal(jwt_header, jwt_data):
+    """user_lookup_loader of the JWT manager: the principal behind current_user"""
+    principal = principal_from_claims(jwt_data)
+    if principal is None:
+        # Jeton émis avant les claims de rôle
+        principal = principal_cache.get(int(jwt_data['sub']))
+    return principal
+
+def auth_required(*user_types, admin=False, fresh=False):
+    """jwt_required() plus the role and account checks, the principal is current_user
+
+    user_types restricts the view to these kinds of users, admin to the
+    administrators. fresh re-reads the role and status through the
+    principal cache instead of trusting the claims (sensitive writes).
+    """
+    def decorator(view):
+        @wraps(view)
+        @jwt_required()
+        def wrapper(*args, **kwargs):
+            principal = current_user
+            if fresh and not principal.is_admin:
+                principal = principal_cache.get(principal.id)
+                if principal is None:
+                    return jsonify({'error': 'Utilisateur introuvable'}), 401
+
+            if not principal.active:
+                return jsonify({'error': 'Compte désactivé'}), 403
+            if admin and not principal.is_admin:
+                return jsonify({'error': 'Accès non autorisé'}), 403
+            if user_types and principal.user_type not in user_types:
+                return jsonify({'error': 'Non autorisé'}), 403
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,112 @@
+"""Benchmark of the checkout for 1, 10 and 100-line carts
+
+Times the previous checkout (one Order added and one Cart row deleted
+per line, through the session) against checkout.checkout_cart (one
+header, bulk insert of the lines, bulk delete of the cart), and reports
+the number of SQL statements of each. Runs on a SQLite database of a
+temporary directory, never on instance/legumes.db.
+
+    python bench_checkout.py
+    python bench_checkout.py --runs 20 --lines 1 10 100 500
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+TMP_DIR = tempfile.mkdtemp(prefix='eswika-bench-')
+os.environ.update({
+    'DATABASE_URL': 'sqlite:///' + os.path.join(TMP_DIR, 'bench.db'),
+    'IMAGE_STORE_PATH': os.path.join(TMP_DIR, 'images'),
+    'CATALOG_CACHE_VERSION_FILE': os.path.join(TMP_DIR, 'catalog_version'),
+    'CART_SWEEPER_ENABLED': 'false',
+})
+
+from sqlalchemy import event
+from main import app
+from models import db, Cart, Order, Product, User
+from checkout import checkout_cart
+
+class StatementCounter:
+    """Counts the statements sent to the database"""
+
+    def __init__(self):
+        self.count = 0
+
+    def _count(self, *args):
+        self.count += 1
+
+    def __enter__(self):
+        event.listen(db.engine, 'before_cursor_execute', self._count)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(db.engine, 'before_cursor_execute', self._count)
+
+def legacy_checkout(user_id, delivery_address):
+    """The checkout used before checkout.checkout_cart"""
+    cart_items = Cart.query.filter_by(user_id=user_id).all()
+    for cart_item in cart_items:
+        order = Order(
+            buyer_id=user_id,
+            product_id=cart_item.product_id,
+            quantity=cart_item.quantity,
+            total_price=cart_item.total_price,
+            delivery_address=delivery_address
+        )
+        db.session.add(order)
+        db.session.delete(cart_item)
+    db.session.commit()
+
+def bulk_checkout(user_id, delivery_address):
+    checkout_cart(user_id, delivery_address)
+    db.session.commit()
+
+def setup(max_lines):
+    """A customer and max_lines products of a farmer"""
+    farmer = User(email='farmer@bench.local', password='x', user_type='farmer', name='Farmer')
+    customer = User(email='customer@bench.local', password='x', user_type='customer', name='Customer')
+    db.session.add_all([farmer, customer])
+    db.session.flush()
+    products = [
+        Product(name=f'Produit {number}', price=2.5, quantity=10 ** 6, unit='kg',
+                seller_id=farmer.id, validated_by_admin=True)
+        for number in range(max_lines)
+    ]
+    db.session.add_all(products)
+    db.session.commit()
+    return customer.id, [product.id for product in products]
+
+def fill_cart(user_id, product_ids):
+    db.session.execute(db.insert(Cart), [
+        {'user_id': user_id, 'product_id': product_id, 'quantity': 2, 'total_price': 5.0}
+        for product_id in product_ids
+    ])
+    db.session.commit()
+    # Session vide : les deux chemins chargent le panier eux-mêmes
+    db.session.expunge_all()
+
+def measure(function, user_id, product_ids, runs):
+    timings = []
+    for _ in range(runs):
+        fill_cart(user_id, product_ids)
+        with StatementCounter() as counter:
+            start = time.perf_counter()
+            function(user_id, '1 rue du Marché')
+            timings.append(time.perf_counter() - start)
+    return statistics.mean(timings) * 1000, counter.count
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--lines', type=int, nargs='+', default=[1, 10, 100])
+    args = parser.parse_args()
+
+    with app.app_context():
+        user_id, product_ids = setup(max(args.lines))
+        print(f"{'lines':>6}{'old ms':>10}{'queries':>9}{'new ms':>10}{'queries':>9}")
+        for lines in args.lines:
+            old_ms, old_queries = measure(legacy_checkout, user_id, product_ids[:lines], args.runs)
+            new_ms, new_queries = measure(bulk_checkout, user_id, product_ids[:lines], args.runs)
+            print(f'{lines:>6}{old_ms:>10.2f}{old_queries:>9}{new_ms:>10.2f}{new_queries:>9}')
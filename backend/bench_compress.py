@@ -0,0 +1,85 @@
+"""Micro-benchmark of the upload compression
+
+Times the previous compression loop (quality 95 down to 5 by steps of
+5) against image_processing.compress_image on the sample images of
+static/images, and reports the number of JPEG encodes of each.
+--large adds a 4032x3024 noisy image, the worst case of a phone photo.
+
+    python bench_compress.py
+    python bench_compress.py --large --runs 5
+"""
+import argparse
+import os
+import statistics
+import time
+from io import BytesIO
+from PIL import Image
+import image_processing
+
+basedir = os.path.abspath(os.path.dirname(__file__))
+SAMPLES_DIR = os.path.join(basedir, 'static', 'images')
+
+class EncodeCounter:
+    """Counts the JPEG encodes made through Image.save"""
+
+    def __init__(self):
+        self.count = 0
+        self._save = Image.Image.save
+
+    def __enter__(self):
+        counter = self
+
+        def save(img, fp, format=None, **params):
+            counter.count += 1
+            return counter._save(img, fp, format=format, **params)
+
+        Image.Image.save = save
+        return self
+
+    def __exit__(self, *exc):
+        Image.Image.save = self._save
+
+def legacy_compress_image(image_data, max_size_kb=500):
+    """The compression loop used before image_processing.compress_image"""
+    img = Image.open(BytesIO(image_data))
+    quality = 95
+    output = BytesIO()
+    while quality > 5:
+        output = BytesIO()
+        img.save(output, format='JPEG', quality=quality)
+        if len(output.getvalue()) <= max_size_kb * 1024:
+            break
+        quality -= 5
+    return output.getvalue()
+
+def sample_images(large=False):
+    for name in sorted(os.listdir(SAMPLES_DIR)):
+        path = os.path.join(SAMPLES_DIR, name)
+        if os.path.isfile(path) and name.lower().endswith(('.jpg', '.jpeg', '.png')):
+            with open(path, 'rb') as f:
+                yield name, f.read()
+    if large:
+        output = BytesIO()
+        Image.effect_noise((4032, 3024), 64).convert('RGB').save(output, format='PNG')
+        yield '4032x3024 noisy', output.getvalue()
+
+def measure(function, image_data, runs):
+    timings = []
+    for _ in range(runs):
+        with EncodeCounter() as counter:
+            start = time.perf_counter()
+            function(image_data)
+            timings.append(time.perf_counter() - start)
+    return statistics.mean(timings) * 1000, counter.count
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--large', action='store_true')
+    args = parser.parse_args()
+
+    print(f"{'image':<32}{'old ms':>10}{'encodes':>9}{'new ms':>10}{'encodes':>9}")
+    for name, image_data in sample_images(args.large):
+        old_ms, old_encodes = measure(legacy_compress_image, image_data, args.runs)
+        new_ms, new_encodes = measure(image_processing.compress_image, image_data, args.runs)
+        print(f'{name[:31]:<32}{old_ms:>10.1f}{old_encodes:>9}{new_ms:>10.1f}{new_encodes:>9}')
@@ -0,0 +1,166 @@
+"""Load test of the database settings under mixed traffic
+
+Serves the app with a threaded werkzeug server while client threads
+send a mix of cart additions, cart reads and catalog reads, and reports
+the throughput, the p95 latency of each kind and the failed requests
+("database is locked" comes back as a 500). Each SQLite setting runs in
+its own process on a fresh database of a temporary directory, never on
+instance/legumes.db: DELETE/FULL (the previous defaults) and WAL/NORMAL.
+With DATABASE_URL set (e.g. postgresql+psycopg://...), runs once
+against that database instead, which must be an empty scratch database.
+
+    python bench_load.py
+    python bench_load.py --clients 32 --seconds 20
+    DATABASE_URL=postgresql+psycopg://eswika@localhost/eswika_bench python bench_load.py
+"""
+import argparse
+import http.client
+import json
+import logging
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+SQLITE_MODES = {
+    'DELETE/FULL': {'SQLITE_JOURNAL_MODE': 'DELETE', 'SQLITE_SYNCHRONOUS': 'FULL'},
+    'WAL/NORMAL': {'SQLITE_JOURNAL_MODE': 'WAL', 'SQLITE_SYNCHRONOUS': 'NORMAL'},
+}
+
+# Part de chaque type de requête dans le trafic
+MIX = {'cart_add': 2, 'cart_read': 3, 'catalog': 5}
+
+def request(port, method, path, token, body=None):
+    connection = http.client.HTTPConnection('127.0.0.1', port)
+    headers = {'Authorization': f'Bearer {token}'}
+    if body is not None:
+        headers['Content-Type'] = 'application/json'
+    start = time.perf_counter()
+    connection.request(method, path, body=json.dumps(body) if body is not None else None, headers=headers)
+    response = connection.getresponse()
+    response.read()
+    elapsed = time.perf_counter() - start
+    connection.close()
+    return response.status, elapsed
+
+def setup(app, clients, products):
+    """clients customers with their tokens and products of a farmer"""
+    from flask_jwt_extended import create_access_token
+    from auth import user_claims
+    from models import db, Product, User
+
+    with app.app_context():
+        farmer = User(email='farmer@bench.local', password='x', user_type='farmer', name='Farmer')
+        customers = [
+            User(email=f'customer{number}@bench.local', password='x', user_type='customer', name=f'Customer {number}')
+            for number in range(clients)
+        ]
+        db.session.add(farmer)
+        db.session.add_all(customers)
+        db.session.flush()
+        db.session.add_all(
+            Product(name=f'Produit {number}', price=2.5, quantity=10 ** 6, unit='kg',
+                    seller_id=farmer.id, validated_by_admin=True)
+            for number in range(products)
+        )
+        db.session.commit()
+        product_ids = [product_id for product_id, in db.session.execute(db.select(Product.id))]
+        tokens = [
+            create_access_token(identity=str(customer.id), additional_claims=user_claims(customer))
+            for customer in customers
+        ]
+    return tokens, product_ids
+
+def client(port, token, product_ids, deadline, results, lock):
+    while time.perf_counter() < deadline:
+        kind, = random.choices(list(MIX), weights=list(MIX.values()))
+        if kind == 'cart_add':
+            body = {'product_id': random.choice(product_ids), 'quantity': 1}
+            status, elapsed = request(port, 'POST', '/api/cart/add', token, body)
+        elif kind == 'cart_read':
+            status, elapsed = request(port, 'GET', '/api/cart', token)
+        else:
+            status, elapsed = request(port, 'GET', '/api/products', token)
+        with lock:
+            results.append((kind, status, elapsed * 1000))
+
+def run(clients, seconds, products):
+    """One load run in this process, prints one JSON line of results"""
+    # Import ici : la configuration de la base est lue à l'import de main
+    from werkzeug.serving import make_server
+    from main import app
+
+    tokens, product_ids = setup(app, clients, products)
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    results = []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+    workers = [
+        threading.Thread(target=client, args=(server.server_port, token, product_ids, deadline, results, lock))
+        for token in tokens
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    server.shutdown()
+
+    report = {
+        'requests': len(results) / seconds,
+        'errors': sum(1 for kind, status, elapsed in results if status >= 500),
+    }
+    for kind in MIX:
+        timings = [elapsed for name, status, elapsed in results if name == kind]
+        report[kind] = statistics.quantiles(timings, n=20)[18] if len(timings) > 1 else 0
+    print(json.dumps(report))
+
+def scratch_env():
+    """Images and catalog version of a run in a new temporary directory"""
+    tmp_dir = tempfile.mkdtemp(prefix='eswika-bench-')
+    return tmp_dir, {
+        'IMAGE_STORE_PATH': os.path.join(tmp_dir, 'images'),
+        'CATALOG_CACHE_VERSION_FILE': os.path.join(tmp_dir, 'catalog_version'),
+        'CART_SWEEPER_ENABLED': 'false',
+    }
+
+def run_in_process(label, env, args):
+    """Run the load in a child process with env, so the engine is built with its settings"""
+    output = subprocess.run(
+        [sys.executable, __file__, '--run',
+         '--clients', str(args.clients), '--seconds', str(args.seconds), '--products', str(args.products)],
+        env={**os.environ, **env}, capture_output=True, text=True, check=True
+    ).stdout
+    report = json.loads(output.strip().splitlines()[-1])
+    print(f"{label:>12}{report['requests']:>9.1f}{report['cart_add']:>10.1f}"
+          f"{report['cart_read']:>10.1f}{report['catalog']:>10.1f}{report['errors']:>8}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--products', type=int, default=50)
+    parser.add_argument('--run', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        run(args.clients, args.seconds, args.products)
+        sys.exit()
+
+    print(f"{'database':>12}{'req/s':>9}{'add p95':>10}{'cart p95':>10}{'cat. p95':>10}{'errors':>8}")
+    if os.environ.get('DATABASE_URL'):
+        # Base fournie (PostgreSQL) : un seul passage, les PRAGMA SQLite ne s'appliquent pas
+        tmp_dir, env = scratch_env()
+        run_in_process(os.environ['DATABASE_URL'].split(':', 1)[0], env, args)
+    else:
+        for label, settings in SQLITE_MODES.items():
+            tmp_dir, env = scratch_env()
+            env['DATABASE_URL'] = 'sqlite:///' + os.path.join(tmp_dir, 'bench.db')
+            run_in_process(label, {**env, **settings}, args)
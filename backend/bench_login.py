@@ -0,0 +1,138 @@
+"""Benchmark of the catalog latency during a login storm
+
+Serves the app with a threaded werkzeug server and measures the p50 /
+p95 latency of GET /api/products alone, then while N threads log in
+without pause. Runs once with the password hashes in the request
+threads (the previous login) and once through passwords.PasswordHasher.
+Runs on a SQLite database of a temporary directory, never on
+instance/legumes.db.
+
+    python bench_login.py
+    python bench_login.py --threads 4 16 64 --requests 200
+"""
+import argparse
+import http.client
+import json
+import logging
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+TMP_DIR = tempfile.mkdtemp(prefix='eswika-bench-')
+os.environ.update({
+    'DATABASE_URL': 'sqlite:///' + os.path.join(TMP_DIR, 'bench.db'),
+    'IMAGE_STORE_PATH': os.path.join(TMP_DIR, 'images'),
+    'CATALOG_CACHE_VERSION_FILE': os.path.join(TMP_DIR, 'catalog_version'),
+    'CART_SWEEPER_ENABLED': 'false',
+    # Assez de place pour que la tempête ne soit pas refusée en 503
+    'PASSWORD_HASH_QUEUE': '1024',
+    'PASSWORD_HASH_TIMEOUT': '120',
+})
+
+from werkzeug.serving import make_server
+from main import app, password_hasher
+from models import db, Product, User
+
+PASSWORD = 'marché-du-samedi'
+
+def setup(users, products):
+    """users customers sharing one password and products of a farmer"""
+    password_hash = password_hasher.hash(PASSWORD)
+    farmer = User(email='farmer@bench.local', password=password_hash, user_type='farmer', name='Farmer')
+    db.session.add(farmer)
+    db.session.flush()
+    db.session.add_all(
+        User(email=f'customer{number}@bench.local', password=password_hash,
+             user_type='customer', name=f'Customer {number}')
+        for number in range(users)
+    )
+    db.session.add_all(
+        Product(name=f'Produit {number}', price=2.5, quantity=100, unit='kg',
+                seller_id=farmer.id, validated_by_admin=True)
+        for number in range(products)
+    )
+    db.session.commit()
+
+def request(port, method, path, body=None):
+    connection = http.client.HTTPConnection('127.0.0.1', port)
+    headers = {'Content-Type': 'application/json'} if body is not None else {}
+    start = time.perf_counter()
+    connection.request(method, path, body=json.dumps(body) if body is not None else None, headers=headers)
+    response = connection.getresponse()
+    response.read()
+    elapsed = time.perf_counter() - start
+    connection.close()
+    return response.status, elapsed
+
+def catalog_latency(port, requests):
+    timings = []
+    for _ in range(requests):
+        status, elapsed = request(port, 'GET', '/api/products')
+        assert status == 200, status
+        timings.append(elapsed * 1000)
+    percentiles = statistics.quantiles(timings, n=20)
+    return statistics.median(timings), percentiles[18]
+
+def login_storm(port, threads, stop, logins):
+    """threads threads logging in until stop is set, counting the answers by status"""
+    def log_in(number):
+        body = {'email': f'customer{number}@bench.local', 'password': PASSWORD}
+        while not stop.is_set():
+            status, _ = request(port, 'POST', '/api/login', body)
+            with lock:
+                logins[status] = logins.get(status, 0) + 1
+
+    lock = threading.Lock()
+    workers = [threading.Thread(target=log_in, args=(number,), daemon=True) for number in range(threads)]
+    for worker in workers:
+        worker.start()
+    return workers
+
+def measure(port, threads, requests):
+    stop = threading.Event()
+    logins = {}
+    start = time.perf_counter()
+    workers = login_storm(port, threads, stop, logins)
+    # Laisse la tempête s'installer avant de mesurer
+    time.sleep(0.5)
+    p50, p95 = catalog_latency(port, requests)
+    stop.set()
+    for worker in workers:
+        worker.join()
+    duration = time.perf_counter() - start
+    return p50, p95, sum(logins.values()) / duration, logins
+
+def inline_hashing():
+    """Hash in the request thread, as login did before PasswordHasher"""
+    password_hasher._run = lambda function, *args: function(*args)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, nargs='+', default=[8, 32])
+    parser.add_argument('--requests', type=int, default=100)
+    parser.add_argument('--products', type=int, default=200)
+    args = parser.parse_args()
+
+    with app.app_context():
+        setup(max(args.threads), args.products)
+
+    # Pas une ligne de journal par requête
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_port
+
+    pooled_run = password_hasher._run
+    print(f"{'hashing':>8}{'logins':>8}{'p50 ms':>10}{'p95 ms':>10}{'login/s':>10}  statuses")
+    for mode in ('inline', 'pool'):
+        password_hasher._run = pooled_run
+        if mode == 'inline':
+            inline_hashing()
+        p50, p95 = catalog_latency(port, args.requests)
+        print(f'{mode:>8}{0:>8}{p50:>10.2f}{p95:>10.2f}{0:>10.1f}')
+        for threads in args.threads:
+            p50, p95, rate, logins = measure(port, threads, args.requests)
+            print(f'{mode:>8}{threads:>8}{p50:>10.2f}{p95:>10.2f}{rate:>10.1f}  {logins}')
+    server.shutdown()
@@ -0,0 +1,122 @@
+"""Benchmark of the stock reservation under concurrent buyers
+
+Threads take one unit at a time from the same product until it is sold
+out, through the previous read-modify-write path (read
+Product.quantity, check it in Python, decrement, commit) and through
+stock.reserve (one conditional UPDATE). Reports the units sold, the
+oversold units (sold beyond the initial stock), the lost updates (sold
+units missing from the stock), the failed commits and the sales per
+second. Runs on a SQLite database of a temporary directory, never on
+instance/legumes.db.
+
+    python bench_stock.py
+    python bench_stock.py --stock 2000 --threads 4 16 64
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+TMP_DIR = tempfile.mkdtemp(prefix='eswika-bench-')
+os.environ.update({
+    'DATABASE_URL': 'sqlite:///' + os.path.join(TMP_DIR, 'bench.db'),
+    'IMAGE_STORE_PATH': os.path.join(TMP_DIR, 'images'),
+    'CATALOG_CACHE_VERSION_FILE': os.path.join(TMP_DIR, 'catalog_version'),
+    'CART_SWEEPER_ENABLED': 'false',
+})
+
+from sqlalchemy.exc import OperationalError
+from main import app
+from models import db, Product, User
+import stock
+
+def legacy_take(product_id, quantity):
+    """The stock check of add_to_cart before stock.reserve"""
+    product = db.session.get(Product, product_id)
+    if product.quantity < quantity:
+        return False
+    product.quantity -= quantity
+    return True
+
+def reserve_take(product_id, quantity):
+    return stock.reserve(product_id, quantity)
+
+def setup():
+    farmer = User(email='farmer@bench.local', password='x', user_type='farmer', name='Farmer')
+    db.session.add(farmer)
+    db.session.commit()
+    return farmer.id
+
+def new_product(seller_id, quantity):
+    product = Product(name='Tomates', price=2.5, quantity=quantity, unit='kg',
+                      seller_id=seller_id, validated_by_admin=True)
+    db.session.add(product)
+    db.session.commit()
+    return product.id
+
+def buyer(take, product_id, start, counts, lock):
+    """Take one unit until the product is sold out"""
+    sold = errors = 0
+    with app.app_context():
+        start.wait()
+        while True:
+            try:
+                if not take(product_id, 1):
+                    db.session.rollback()
+                    break
+                db.session.commit()
+                sold += 1
+            except OperationalError:
+                # "database is locked" : la requête aurait répondu 500
+                db.session.rollback()
+                errors += 1
+    with lock:
+        counts['sold'] += sold
+        counts['errors'] += errors
+
+def measure(take, seller_id, initial_stock, threads):
+    with app.app_context():
+        product_id = new_product(seller_id, initial_stock)
+
+    counts = {'sold': 0, 'errors': 0}
+    lock = threading.Lock()
+    start = threading.Barrier(threads + 1)
+    workers = [
+        threading.Thread(target=buyer, args=(take, product_id, start, counts, lock))
+        for _ in range(threads)
+    ]
+    for worker in workers:
+        worker.start()
+    start.wait()
+    began = time.perf_counter()
+    for worker in workers:
+        worker.join()
+    duration = time.perf_counter() - began
+
+    with app.app_context():
+        remaining = db.session.get(Product, product_id).quantity
+    sold = counts['sold']
+    return {
+        'sold': sold,
+        'oversold': max(sold - initial_stock, 0),
+        'lost': sold - (initial_stock - remaining),
+        'errors': counts['errors'],
+        'rate': sold / duration,
+    }
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--stock', type=int, default=500)
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 8, 32])
+    args = parser.parse_args()
+
+    with app.app_context():
+        seller_id = setup()
+
+    print(f"{'path':>8}{'threads':>9}{'sold':>7}{'oversold':>10}{'lost':>7}{'errors':>8}{'sales/s':>10}")
+    for threads in args.threads:
+        for name, take in (('legacy', legacy_take), ('reserve', reserve_take)):
+            result = measure(take, seller_id, args.stock, threads)
+            print(f"{name:>8}{threads:>9}{result['sold']:>7}{result['oversold']:>10}"
+                  f"{result['lost']:>7}{result['errors']:>8}{result['rate']:>10.1f}")
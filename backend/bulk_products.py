@@ -0,0 +1,294 @@
+"""Bulk import, update and export of a farmer's products
+
+Rows are read one at a time from the request stream (CSV with a header
+line, or NDJSON) and written in batches of BATCH_SIZE, each batch in its
+own transaction. Memory does not grow with the size of the file. A row
+is matched to an existing product of the farmer by id or by sku, and
+otherwise creates a product (pending validation, like create_product).
+A row that cannot be used is reported with its line number, and the
+other rows are imported.
+
+The images of an import are either image_url values or files of a ZIP
+archive named in the image column. An image_url is an absolute http(s)
+URL (or a path of this server): it is not fetched, the clients load it
+as it is, without the resized versions of the stored images. The export
+streams the catalog in the same format, so it can be edited and
+imported back.
+"""
+import csv
+import io
+import json
+import math
+import zipfile
+from models import db, Product
+
+BATCH_SIZE = 500
+# Au-delà, les erreurs sont comptées mais pas détaillées
+MAX_REPORTED_ERRORS = 100
+MAX_IMAGE_BYTES = 20 * 1024 * 1024
+
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+EXPORT_COLUMNS = (
+    'id', 'sku', 'name', 'description', 'price', 'quantity', 'unit',
+    'peeling_available', 'peeling_price', 'image_url', 'validated_by_admin'
+)
+IMPORT_FIELDS = ('name', 'description', 'price', 'quantity', 'unit', 'peeling_available', 'peeling_price', 'image_url', 'image')
+PATCH_FIELDS = ('price', 'quantity')
+REQUIRED_FIELDS = ('name', 'price', 'quantity', 'unit')
+
+class RowError(Exception):
+    """Row that cannot be imported, message is shown to the user"""
+
+def detect_format(mimetype, filename=None):
+    if mimetype in ('application/x-ndjson', 'application/jsonl') or (filename or '').endswith(('.ndjson', '.jsonl')):
+        return 'ndjson'
+    if mimetype in ('text/csv', 'application/csv') or (filename or '').endswith('.csv'):
+        return 'csv'
+    return None
+
+def read_rows(stream, fmt):
+    """(line number, dict) for each row of a binary stream, RowError for unreadable lines"""
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='' if fmt == 'csv' else None)
+    if fmt == 'csv':
+        reader = csv.DictReader(text)
+        for row in reader:
+            # Cellules vides : champ non fourni
+            yield reader.line_num, {key: value for key, value in row.items() if key and value not in (None, '')}
+        return
+
+    for number, line in enumerate(text, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            yield number, RowError('JSON non valide')
+            continue
+        if not isinstance(row, dict):
+            yield number, RowError('Objet JSON attendu')
+            continue
+        yield number, {key: value for key, value in row.items() if value is not None}
+
+def _number(row, name, cast):
+    value = row[name]
+    if isinstance(value, bool) or (isinstance(value, float) and cast is int and not value.is_integer()):
+        raise RowError(f'{name} non valide')
+    try:
+        number = cast(value)
+    except (TypeError, ValueError):
+        raise RowError(f'{name} non valide')
+    if number < 0 or not math.isfinite(number):
+        raise RowError(f'{name} non valide')
+    return number
+
+def _boolean(row, name):
+    value = row[name]
+    if isinstance(value, bool):
+        return value
+    if str(value).lower() in ('true', '1', 'yes', 'oui'):
+        return True
+    if str(value).lower() in ('false', '0', 'no', 'non'):
+        return False
+    raise RowError(f'{name} non valide')
+
+def _text(row, name, max_length):
+    value = str(row[name]).strip()
+    if not value or len(value) > max_length:
+        raise RowError(f'{name} non valide')
+    return value
+
+def _image_url(row):
+    value = _text(row, 'image_url', Product.__table__.columns['image_url'].type.length)
+    # Pas de javascript:, data: ... dans les <img> des clients
+    if not value.lower().startswith(('http://', 'https://', '/')):
+        raise RowError('image_url non valide')
+    return value
+
+def clean_row(row, fields):
+    """Values of the product columns given in a row: id, sku and fields"""
+    values = {}
+    if 'id' in row:
+        values['id'] = _number(row, 'id', int)
+    for name in ('sku',) + tuple(fields):
+        if name not in row:
+            continue
+        if name in ('price', 'peeling_price'):
+            values[name] = _number(row, name, float)
+        elif name == 'quantity':
+            values[name] = _number(row, name, int)
+        elif name == 'peeling_available':
+            values[name] = _boolean(row, name)
+        elif name == 'description':
+            values[name] = str(row[name])
+        elif name == 'image':
+            values[name] = str(row[name])
+        elif name == 'image_url':
+            values[name] = _image_url(row)
+        else:
+            values[name] = _text(row, name, Product.__table__.columns[name].type.length)
+    return values
+
+class ProductImporter:
+    """Upserts the rows of one farmer in batches
+
+    create=False only updates existing products (bulk PATCH). load_image
+    turns the image column into an image_hash.
+    """
+
+    def __init__(self, seller_id, fields=IMPORT_FIELDS, create=True, load_image=None, batch_size=BATCH_SIZE):
+        self.seller_id = seller_id
+        self.fields = fields
+        self.create = create
+        self.load_image = load_image
+        self.batch_size = batch_size
+        self.created = 0
+        self.updated = 0
+        self.error_count = 0
+        self.errors = []
+
+    def _error(self, line, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line, 'error': message})
+
+    def run(self, rows):
+        batch = []
+        for line, row in rows:
+            try:
+                if isinstance(row, RowError):
+                    raise row
+                values = clean_row(row, self.fields)
+                if 'image' in values:
+                    if self.load_image is None:
+                        raise RowError("Archive d'images manquante")
+                    values['image_hash'] = self.load_image(values.pop('image'))
+            except RowError as e:
+                self._error(line, str(e))
+                continue
+            batch.append((line, values))
+            if len(batch) >= self.batch_size:
+                self._write(batch)
+                batch = []
+        if batch:
+            self._write(batch)
+        return self.summary()
+
+    def summary(self):
+        return {
+            'created': self.created,
+            'updated': self.updated,
+            'error_count': self.error_count,
+            'errors': self.errors
+        }
+
+    def _write(self, batch):
+        ids = {values['id'] for _, values in batch if 'id' in values}
+        skus = {values['sku'] for _, values in batch if 'sku' in values}
+        # Deux requêtes : un OR empêcherait d'utiliser la clé primaire et ix_product_seller_id_sku
+        existing = db.session.query(Product.id, Product.sku)\
+            .filter(Product.seller_id == self.seller_id, Product.id.in_(ids))\
+            .all()
+        existing += db.session.query(Product.id, Product.sku)\
+            .filter(Product.seller_id == self.seller_id, Product.sku.in_(skus))\
+            .all()
+        known_ids = {row.id for row in existing}
+        id_by_sku = {row.sku: row.id for row in existing if row.sku}
+
+        updates, inserts, new_by_sku, lines = [], [], {}, []
+        for line, values in batch:
+            product_id = values.pop('id', None)
+            if product_id is not None and product_id not in known_ids:
+                self._error(line, 'Produit introuvable')
+                continue
+            product_id = product_id or id_by_sku.get(values.get('sku'))
+            if not self.create:
+                if product_id is None:
+                    self._error(line, 'Produit introuvable' if 'sku' in values else 'id ou sku requis')
+                    continue
+                # Le sku d'une mise à jour partielle sert à trouver le produit, pas à le renommer
+                values.pop('sku', None)
+            if product_id is not None:
+                if values:
+                    updates.append({'id': product_id, **values})
+            elif values.get('sku') in new_by_sku:
+                # Même sku plus haut dans le lot : la dernière ligne l'emporte
+                new_by_sku[values['sku']].update(values)
+            else:
+                missing = [name for name in REQUIRED_FIELDS if name not in values]
+                if missing:
+                    self._error(line, f"Champs requis manquants : {', '.join(missing)}")
+                    continue
+                product = {
+                    'seller_id': self.seller_id,
+                    'peeling_available': False,
+                    'peeling_price': 0,
+                    'validated_by_admin': False,
+                    **values
+                }
+                inserts.append(product)
+                if 'sku' in values:
+                    new_by_sku[values['sku']] = product
+            lines.append(line)
+
+        try:
+            if updates:
+                db.session.execute(db.update(Product), updates)
+            if inserts:
+                db.session.execute(db.insert(Product), inserts)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            for line in lines:
+                self._error(line, "Erreur lors de l'enregistrement du lot")
+            return
+        self.updated += len(updates)
+        self.created += len(inserts)
+
+class ArchiveImages:
+    """load_image reading the images of a ZIP archive, each stored once"""
+
+    def __init__(self, archive, store_image):
+        try:
+            self.zip = zipfile.ZipFile(archive)
+        except zipfile.BadZipFile:
+            raise RowError('Archive ZIP non valide')
+        self.store_image = store_image
+        self._hashes = {}
+
+    def __call__(self, name):
+        if name not in self._hashes:
+            try:
+                info = self.zip.getinfo(name)
+            except KeyError:
+                raise RowError(f"Image absente de l'archive : {name}")
+            if info.file_size > MAX_IMAGE_BYTES:
+                raise RowError(f'Image trop grande : {name}')
+            self._hashes[name] = self.store_image(self.zip.read(info))
+        return self._hashes[name]
+
+def export_rows(seller_id, fmt):
+    """Chunks of the farmer's catalog in fmt, read with a server-side cursor"""
+    columns = [getattr(Product, name) for name in EXPORT_COLUMNS]
+    rows = db.session.query(*columns)\
+        .filter(Product.seller_id == seller_id)\
+        .order_by(Product.id)\
+        .execution_options(yield_per=BATCH_SIZE)
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer) if fmt == 'csv' else None
+    if writer:
+        writer.writerow(EXPORT_COLUMNS)
+    for number, row in enumerate(rows, 1):
+        if writer:
+            writer.writerow(row)
+        else:
+            buffer.write(json.dumps(dict(zip(EXPORT_COLUMNS, row)), ensure_ascii=False))
+            buffer.write('\n')
+        if number % BATCH_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
@@ -0,0 +1,113 @@
+import logging
+import threading
+from datetime import timedelta
+from models import db, Cart, utcnow
+import stock
+
+logger = logging.getLogger(__name__)
+
+def refresh_expiry(user_id, minutes):
+    """Extend the reservation of every line of a cart (called on cart activity)"""
+    db.session.execute(
+        db.update(Cart)
+        .where(Cart.user_id == user_id)
+        .values(expires_at=utcnow() + timedelta(minutes=minutes))
+        .execution_options(synchronize_session=False)
+    )
+
+class CartSweeper:
+    """Background thread giving the stock of expired cart lines back
+
+    Expired lines are found through the index on Cart.expires_at and
+    released in batches, each batch in its own transaction. Several
+    workers may sweep at the same time: a line is only released by the
+    worker whose DELETE actually removed it.
+    """
+
+    def __init__(self, app, interval=60, batch_size=100, reservation_minutes=30, on_release=None):
+        self.app = app
+        self.interval = interval
+        self.batch_size = batch_size
+        self.reservation_minutes = reservation_minutes
+        self.on_release = on_release
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.sweeps = 0
+        self.lines_released = 0
+        self.units_reclaimed = 0
+        self.last_sweep_at = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='cart-sweeper', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                with self.app.app_context():
+                    self.sweep()
+            except Exception:
+                logger.exception('Cart sweep failed')
+
+    def sweep(self):
+        """Release every expired cart line, return (lines, units) released"""
+        now = utcnow()
+
+        # Lignes antérieures aux réservations : elles expirent à partir de maintenant
+        db.session.execute(
+            db.update(Cart)
+            .where(Cart.expires_at.is_(None))
+            .values(expires_at=now + timedelta(minutes=self.reservation_minutes))
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+
+        lines = units = 0
+        while True:
+            expired = db.session.query(Cart.id, Cart.product_id, Cart.quantity)\
+                .filter(Cart.expires_at <= now)\
+                .order_by(Cart.expires_at)\
+                .limit(self.batch_size)\
+                .all()
+
+            for line in expired:
+                # La ligne a pu être prolongée ou commandée entre-temps
+                deleted = db.session.execute(
+                    db.delete(Cart)
+                    .where(Cart.id == line.id, Cart.expires_at <= now)
+                    .execution_options(synchronize_session=False)
+                ).rowcount
+                if deleted:
+                    stock.release(line.product_id, line.quantity)
+                    lines += 1
+                    units += line.quantity
+            db.session.commit()
+
+            if len(expired) < self.batch_size:
+                break
+
+        if lines and self.on_release:
+            self.on_release()
+
+        with self._lock:
+            self.sweeps += 1
+            self.lines_released += lines
+            self.units_reclaimed += units
+            self.last_sweep_at = now
+        return lines, units
+
+    def stats(self):
+        with self._lock:
+            return {
+                'sweeps': self.sweeps,
+                'lines_released': self.lines_released,
+                'units_reclaimed': self.units_reclaimed,
+                'last_sweep_at': self.last_sweep_at.isoformat() if self.last_sweep_at else None,
+                'interval': self.interval,
+                'reservation_minutes': self.reservation_minutes
+            }
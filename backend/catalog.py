@@ -0,0 +1,119 @@
+import base64
+import json
+from datetime import datetime
+from flask import url_for
+from models import db, Product
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+def product_image_fields(product):
+    """Image reference returned in product listings instead of the raw image"""
+    if not product.image_hash:
+        return {'image_url': product.image_url, 'image_version': None}
+
+    return {
+        'image_url': url_for('get_product_image', product_id=product.id, v=product.image_hash),
+        'image_version': product.image_hash
+    }
+
+# Champs exposés par le catalogue : nom -> (colonnes à charger, valeur)
+PRODUCT_FIELDS = {
+    'id': ((), lambda p: p.id),
+    'name': ((Product.name,), lambda p: p.name),
+    'description': ((Product.description,), lambda p: p.description),
+    'price': ((Product.price,), lambda p: p.price),
+    'quantity': ((Product.quantity,), lambda p: p.quantity),
+    'unit': ((Product.unit,), lambda p: p.unit),
+    'seller_id': ((Product.seller_id,), lambda p: p.seller_id),
+    'peeling_available': ((Product.peeling_available,), lambda p: p.peeling_available),
+    'peeling_price': ((Product.peeling_price,), lambda p: p.peeling_price),
+    'image_url': ((Product.image_hash, Product.image_url), lambda p: product_image_fields(p)['image_url']),
+    'image_version': ((Product.image_hash,), lambda p: p.image_hash),
+    'validated_by_admin': ((Product.validated_by_admin,), lambda p: p.validated_by_admin),
+    'validation_date': (
+        (Product.validation_date,),
+        lambda p: p.validation_date.isoformat() if p.validation_date else None
+    ),
+}
+
+# Ordres de tri paginables : nom -> colonne, le sens est donné par un éventuel '-'
+SORT_COLUMNS = {
+    'created_at': Product.created_at,
+    'price': Product.price,
+}
+
+def parse_fields(raw_fields):
+    """Fields requested with ?fields=a,b,c (all of them by default)"""
+    if not raw_fields:
+        return list(PRODUCT_FIELDS)
+
+    fields = [field.strip() for field in raw_fields.split(',') if field.strip()]
+    unknown = [field for field in fields if field not in PRODUCT_FIELDS]
+    if unknown:
+        raise ValueError(f'Champs inconnus: {", ".join(unknown)}')
+    return fields
+
+def parse_sort(raw_sort):
+    """Sort column and direction from ?sort=price, ?sort=-created_at, ..."""
+    descending = raw_sort.startswith('-')
+    name = raw_sort.lstrip('-')
+    if name not in SORT_COLUMNS:
+        raise ValueError(f'Tri non valide: {raw_sort}')
+    return SORT_COLUMNS[name], descending
+
+def columns_for(fields, *extra):
+    """Columns to load for the requested fields, the image blob is never one of them"""
+    columns = [Product.id]
+    for column in extra:
+        if column not in columns:
+            columns.append(column)
+    for field in fields:
+        for column in PRODUCT_FIELDS[field][0]:
+            if column not in columns:
+                columns.append(column)
+    return columns
+
+def serialize_product(product, fields):
+    return {field: PRODUCT_FIELDS[field][1](product) for field in fields}
+
+def encode_cursor(value, product_id):
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    raw = json.dumps([value, product_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor, column):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        value, product_id = json.loads(raw)
+        if value is not None and column is Product.created_at:
+            value = datetime.fromisoformat(value)
+        return value, int(product_id)
+    except (ValueError, TypeError):
+        raise ValueError('Curseur non valide')
+
+def keyset_page(query, column, descending, cursor, limit):
+    """One page of query ordered by (column, id), continuing after cursor
+
+    Returns the products of the page and the cursor of the next one
+    (None on the last page). Works on an index instead of OFFSET, so
+    every page costs the same whatever its position in the catalog.
+    """
+    key = db.tuple_(column, Product.id)
+    if cursor:
+        after = db.tuple_(*decode_cursor(cursor, column))
+        query = query.filter(key < after if descending else key > after)
+
+    if descending:
+        query = query.order_by(column.desc(), Product.id.desc())
+    else:
+        query = query.order_by(column.asc(), Product.id.asc())
+
+    products = query.limit(limit + 1).all()
+    if len(products) <= limit:
+        return products, None
+
+    products = products[:limit]
+    last = products[-1]
+    return products, encode_cursor(getattr(last, column.key), last.id)
@@ -0,0 +1,103 @@
+import itertools
+import os
+import tempfile
+import threading
+import uuid
+from collections import OrderedDict
+
+class LocalVersion:
+    """Catalog version counter of this process only (single worker, tests)"""
+
+    def __init__(self):
+        self._counter = itertools.count(1)
+        self._version = 0
+
+    def current(self):
+        return self._version
+
+    def bump(self):
+        self._version = next(self._counter)
+
+class FileVersion:
+    """Catalog version shared by every worker through a small file
+
+    Each bump writes a new random token atomically, so concurrent bumps
+    from several workers can never produce the same version twice.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def current(self):
+        try:
+            with open(self.path) as f:
+                return f.read()
+        except FileNotFoundError:
+            return ''
+
+    def bump(self):
+        directory = os.path.dirname(self.path) or '.'
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+        with os.fdopen(fd, 'w') as tmp:
+            tmp.write(uuid.uuid4().hex)
+        os.replace(tmp_path, self.path)
+
+VERSION_BACKENDS = {
+    'local': lambda config: LocalVersion(),
+    'file': lambda config: FileVersion(config['CATALOG_CACHE_VERSION_FILE']),
+}
+
+class CatalogCache:
+    """LRU cache of serialized catalog responses, keyed by catalog version
+
+    Writes that change what the catalog shows call invalidate(), which
+    bumps the version: entries built for older versions are never served
+    again and age out of the LRU.
+    """
+
+    def __init__(self, version, max_entries=256):
+        self.version = version
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_build(self, key, build):
+        # Version lue avant la construction : une écriture concurrente
+        # change la version et rend l'entrée construite inaccessible
+        cache_key = (self.version.current(), key)
+        with self._lock:
+            if cache_key in self._entries:
+                self._entries.move_to_end(cache_key)
+                self.hits += 1
+                return self._entries[cache_key]
+            self.misses += 1
+
+        value = build()
+
+        with self._lock:
+            self._entries[cache_key] = value
+            self._entries.move_to_end(cache_key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+    def invalidate(self):
+        self.version.bump()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'version': self.version.current(),
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+def create_catalog_cache(config):
+    """Build the catalog cache configured by CATALOG_CACHE_* in the app config"""
+    version = VERSION_BACKENDS[config['CATALOG_CACHE_BACKEND']](config)
+    return CatalogCache(version, config['CATALOG_CACHE_SIZE'])
@@ -0,0 +1,90 @@
+import math
+from models import db, Cart, Order, OrderHeader, Product, utcnow
+import rollups
+
+class CheckoutError(Exception):
+    """Cart that cannot be turned into an order, message is shown to the user"""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+def checkout_cart(user_id, delivery_address, status='pending', payment_id=None, expected_total=None):
+    """Turn a user's cart into one order header and its order lines
+
+    The stock was reserved when the lines were added to the cart, so a
+    single query checks that every reservation is still held (product
+    still there, line not expired). Lines are then bulk inserted, the
+    dashboard rollups updated and the cart bulk deleted. Runs in the caller's transaction, which must
+    commit or roll back. payment_id links the lines to the payment paying
+    for them, expected_total is its amount: a cart changed since the
+    payment was created is refused.
+
+    Returns the header and the ids of the order lines.
+    """
+    now = utcnow()
+    lines = db.session.query(
+        Cart.id, Cart.product_id, Cart.quantity, Cart.total_price, Cart.expires_at,
+        Product.id.label('existing_product_id'), Product.seller_id
+    ).outerjoin(Product, Product.id == Cart.product_id)\
+     .filter(Cart.user_id == user_id)\
+     .all()
+
+    if not lines:
+        raise CheckoutError('Panier vide')
+    if any(line.existing_product_id is None for line in lines):
+        raise CheckoutError('Un produit du panier n\'existe plus')
+    if any(line.expires_at is not None and line.expires_at <= now.replace(tzinfo=None) for line in lines):
+        raise CheckoutError('Votre panier a expiré, veuillez le vérifier', 409)
+
+    total_price = sum(line.total_price for line in lines)
+    if expected_total is not None and not math.isclose(total_price, expected_total, abs_tol=0.005):
+        raise CheckoutError('Le panier a changé pendant le paiement', 409)
+
+    header = OrderHeader(
+        buyer_id=user_id,
+        delivery_address=delivery_address,
+        total_price=total_price,
+        line_count=len(lines),
+        created_at=now
+    )
+    db.session.add(header)
+    db.session.flush()
+
+    # executemany sans RETURNING : avec RETURNING ordonné, SQLite insère ligne par ligne
+    db.session.execute(
+        db.insert(Order),
+        [{
+            'header_id': header.id,
+            'buyer_id': user_id,
+            'product_id': line.product_id,
+            'quantity': line.quantity,
+            'total_price': line.total_price,
+            'delivery_address': delivery_address,
+            'status': status,
+            'payment_id': payment_id,
+            'created_at': now
+        } for line in lines]
+    )
+    order_ids = db.session.scalars(
+        db.select(Order.id).where(Order.header_id == header.id).order_by(Order.id)
+    ).all()
+    rollups.record_orders([
+        rollups.Sale(line.seller_id, line.product_id, status, line.quantity, line.total_price, now)
+        for line in lines
+    ])
+
+    # Suppression conditionnelle : le balayeur a pu libérer une ligne entre-temps
+    deleted = db.session.execute(
+        db.delete(Cart)
+        .where(
+            Cart.id.in_([line.id for line in lines]),
+            db.or_(Cart.expires_at.is_(None), Cart.expires_at > now)
+        )
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if deleted != len(lines):
+        raise CheckoutError('Votre panier a expiré, veuillez le vérifier', 409)
+
+    return header, order_ids
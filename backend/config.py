@@ -1,7 +1,67 @@
 import os
+from datetime import timedelta
+
+basedir = os.path.abspath(os.path.dirname(__file__))
 
 class Config:
     SECRET_KEY = 'votre-clé-secrète-très-sécurisée'
-    SQLALCHEMY_DATABASE_URI = 'sqlite:///legumes.db'
+    # Base de données : SQLite par défaut, PostgreSQL avec DATABASE_URL=postgresql+psycopg://...
+    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'sqlite:///legumes.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
-    JWT_SECRET_KEY = 'jwt-secret-key'
\ No newline at end of file
+    JWT_SECRET_KEY = 'jwt-secret-key'
+    JWT_ACCESS_TOKEN_EXPIRES = timedelta(hours=2)
+    # Stockage des images produits (voir image_store.py)
+    IMAGE_STORE = os.environ.get('IMAGE_STORE', 'filesystem')
+    IMAGE_STORE_PATH = os.environ.get('IMAGE_STORE_PATH', os.path.join(basedir, 'static', 'images'))
+    # Pool de processus pour la compression des images (None = nombre de CPU)
+    IMAGE_WORKERS = int(os.environ['IMAGE_WORKERS']) if os.environ.get('IMAGE_WORKERS') else None
+    IMAGE_PROCESSING_TIMEOUT = float(os.environ.get('IMAGE_PROCESSING_TIMEOUT', 30))
+    # Cache du catalogue public : 'local' (un seul worker) ou 'file' (partagé entre workers)
+    CATALOG_CACHE_BACKEND = os.environ.get('CATALOG_CACHE_BACKEND', 'file')
+    CATALOG_CACHE_VERSION_FILE = os.environ.get('CATALOG_CACHE_VERSION_FILE', os.path.join(basedir, 'instance', 'catalog.version'))
+    CATALOG_CACHE_SIZE = int(os.environ.get('CATALOG_CACHE_SIZE', 256))
+    # Réservations du panier : le stock des lignes inactives est rendu par un thread de fond
+    CART_RESERVATION_MINUTES = int(os.environ.get('CART_RESERVATION_MINUTES', 30))
+    CART_SWEEPER_ENABLED = os.environ.get('CART_SWEEPER_ENABLED', 'true').lower() == 'true'
+    CART_SWEEP_INTERVAL = int(os.environ.get('CART_SWEEP_INTERVAL', 60))
+    CART_SWEEP_BATCH_SIZE = int(os.environ.get('CART_SWEEP_BATCH_SIZE', 100))
+    # Hachage des mots de passe (voir passwords.py) : méthode werkzeug, threads, file d'attente max
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', 2))
+    PASSWORD_HASH_QUEUE = int(os.environ.get('PASSWORD_HASH_QUEUE', 32))
+    PASSWORD_HASH_TIMEOUT = float(os.environ.get('PASSWORD_HASH_TIMEOUT', 10))
+    # Paiements (voir payments.py) : prestataire, threads, délai max d'un paiement en attente (s)
+    PAYMENT_PROVIDER = os.environ.get('PAYMENT_PROVIDER', 'fake')
+    PAYMENT_WORKERS = int(os.environ.get('PAYMENT_WORKERS', 4))
+    PAYMENT_INTENT_TIMEOUT = int(os.environ.get('PAYMENT_INTENT_TIMEOUT', 120))
+    # Prestataire factice : latence (s), variation (s) et taux d'échec des appels
+    PAYMENT_FAKE_LATENCY = float(os.environ.get('PAYMENT_FAKE_LATENCY', 0.5))
+    PAYMENT_FAKE_JITTER = float(os.environ.get('PAYMENT_FAKE_JITTER', 0.2))
+    PAYMENT_FAKE_FAILURE_RATE = float(os.environ.get('PAYMENT_FAKE_FAILURE_RATE', 0))
+    # Idempotency-Key (voir idempotency.py) : conservation des réponses, verrou d'une requête
+    # abandonnée et attente max d'un doublon concurrent (s), entrées en mémoire
+    IDEMPOTENCY_KEY_TTL = int(os.environ.get('IDEMPOTENCY_KEY_TTL', 24 * 3600))
+    IDEMPOTENCY_LOCK_TIMEOUT = int(os.environ.get('IDEMPOTENCY_LOCK_TIMEOUT', 60))
+    IDEMPOTENCY_WAIT_TIMEOUT = float(os.environ.get('IDEMPOTENCY_WAIT_TIMEOUT', 10))
+    IDEMPOTENCY_CACHE_SIZE = int(os.environ.get('IDEMPOTENCY_CACHE_SIZE', 10000))
+    # Durée de vie (s) des principaux chargés en base, voir auth.py
+    PRINCIPAL_CACHE_TTL = int(os.environ.get('PRINCIPAL_CACHE_TTL', 60))
+    # Délai max (s) avant qu'un worker voie une révocation faite par un autre, voir revocation.py
+    REVOCATION_REFRESH_INTERVAL = float(os.environ.get('REVOCATION_REFRESH_INTERVAL', 2))
+    # Répliques en lecture seule (URLs séparées par des virgules), voir routing.py
+    DATABASE_REPLICA_URLS = os.environ.get('DATABASE_REPLICA_URLS', '')
+    READ_YOUR_WRITES_SECONDS = int(os.environ.get('READ_YOUR_WRITES_SECONDS', 10))
+    # > 0 : copie périodique d'un primaire SQLite vers les répliques SQLite (environnement local)
+    REPLICA_SYNC_INTERVAL = int(os.environ.get('REPLICA_SYNC_INTERVAL', 0))
+    # SQLite (voir database.py) : WAL, attente du verrou en ms, mmap en octets, cache en Kio si négatif
+    SQLITE_JOURNAL_MODE = os.environ.get('SQLITE_JOURNAL_MODE', 'WAL')
+    SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')
+    SQLITE_BUSY_TIMEOUT = int(os.environ.get('SQLITE_BUSY_TIMEOUT', 5000))
+    SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+    SQLITE_CACHE_SIZE = int(os.environ.get('SQLITE_CACHE_SIZE', -64000))
+    # Pool de connexions des autres bases (PostgreSQL)
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 10))
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 20))
+    DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', 30))
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+    DB_POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING', 'true').lower() == 'true'
@@ -0,0 +1,49 @@
+"""Database engine configuration
+
+The backend is chosen by DATABASE_URL (SQLite by default). SQLite
+connections get their PRAGMAs on connect: WAL lets readers work while a
+writer commits, and busy_timeout makes a second writer wait for the
+lock instead of failing with "database is locked". PostgreSQL gets the
+pool settings instead (psycopg must be installed).
+"""
+from sqlalchemy import event
+
+def is_sqlite(uri):
+    return uri.startswith('sqlite')
+
+def engine_options(config):
+    """SQLALCHEMY_ENGINE_OPTIONS for the configured backend"""
+    if is_sqlite(config['SQLALCHEMY_DATABASE_URI']):
+        # timeout : attente du verrou côté pilote, en plus du PRAGMA busy_timeout
+        return {'connect_args': {'timeout': config['SQLITE_BUSY_TIMEOUT'] / 1000}}
+
+    return {
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+        'pool_pre_ping': config['DB_POOL_PRE_PING'],
+    }
+
+def sqlite_pragmas(config):
+    return {
+        'journal_mode': config['SQLITE_JOURNAL_MODE'],
+        'synchronous': config['SQLITE_SYNCHRONOUS'],
+        'busy_timeout': config['SQLITE_BUSY_TIMEOUT'],
+        'mmap_size': config['SQLITE_MMAP_SIZE'],
+        'cache_size': config['SQLITE_CACHE_SIZE'],
+    }
+
+def configure_engine(engine, config):
+    """Apply the per-connection settings of the backend to engine"""
+    if engine.dialect.name != 'sqlite':
+        return
+
+    pragmas = sqlite_pragmas(config)
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name}={value}')
+        cursor.close()
@@ -0,0 +1,40 @@
+"""Generate the missing image derivatives (thumb, card, full in JPEG and WebP)
+
+Backfill for the products uploaded before derivatives existed. Run it
+after migrate_images.py, products whose image is still in the database
+are skipped.
+
+    python generate_derivatives.py
+"""
+from main import app, image_store
+from models import db, Product
+from image_processing import IMAGE_SIZES, IMAGE_FORMATS, derivative_key, save_derivatives
+
+def missing_derivatives(digest):
+    return any(
+        image_store.path(derivative_key(digest, size, fmt)) is None
+        for size in IMAGE_SIZES
+        for fmt in IMAGE_FORMATS
+    )
+
+def generate_derivatives():
+    generated = 0
+    digests = db.session.query(Product.image_hash)\
+        .filter(Product.image_hash.isnot(None))\
+        .distinct()
+
+    for (digest,) in digests:
+        path = image_store.path(digest)
+        if path is None or not missing_derivatives(digest):
+            continue
+
+        with open(path, 'rb') as f:
+            save_derivatives(image_store, digest, f.read())
+        generated += 1
+
+    return generated
+
+if __name__ == '__main__':
+    with app.app_context():
+        generated = generate_derivatives()
+        print(f'Dérivés générés pour {generated} image(s)')
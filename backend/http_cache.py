@@ -0,0 +1,76 @@
+import hashlib
+from datetime import UTC
+from functools import wraps
+from flask import request, make_response
+from streaming import wants_ndjson
+
+def make_etag(*parts):
+    """Strong ETag from the values the response body depends on"""
+    return hashlib.sha1(repr(parts).encode()).hexdigest()
+
+def latest(*values):
+    """Most recent of the given datetimes, ignoring None"""
+    values = [value for value in values if value is not None]
+    return max(values) if values else None
+
+def _http_date(value):
+    # Les dates sont stockées en UTC naïf, HTTP n'a qu'une précision à la seconde
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=UTC)
+    return value.replace(microsecond=0)
+
+def is_not_modified(etag, last_modified=None):
+    """Whether the client copy is still fresh (If-None-Match wins over If-Modified-Since)"""
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    if last_modified is not None and request.if_modified_since is not None:
+        return _http_date(last_modified) <= request.if_modified_since
+    return False
+
+def conditional(validators, private=True, collection=False):
+    """Answer GET requests with 304 when the client copy is still fresh
+
+    validators(*args, **kwargs) is called with the view arguments and
+    returns (etag parts, last modified datetime or None), computed from
+    cheap aggregates (counts, max(updated_at)) so the body is neither
+    loaded nor serialized for a 304. It may return None to skip the
+    conditional handling (e.g. invalid token, left to the view).
+
+    collection=True for lists whose rows can be deleted: max(updated_at)
+    then goes back in time, so If-Modified-Since would wrongly answer
+    304. Only the ETag (built from the count) is used, and no
+    Last-Modified is sent.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            result = validators(*args, **kwargs)
+            if result is None:
+                return view(*args, **kwargs)
+
+            parts, last_modified = result
+            if collection:
+                last_modified = None
+            # Le JSON et le NDJSON d'une même ressource ont des ETag différents
+            etag = make_etag(request.path, sorted(request.args.items(multi=True)), wants_ndjson(), *parts)
+
+            if is_not_modified(etag, last_modified):
+                response = make_response('', 304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+
+            response.set_etag(etag)
+            if last_modified is not None:
+                response.last_modified = _http_date(last_modified)
+            # Toujours revalider : la réponse change dès qu'une écriture a lieu
+            response.cache_control.no_cache = True
+            response.vary.add('Accept')
+            if private:
+                response.cache_control.private = True
+            else:
+                response.cache_control.public = True
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,218 @@
+"""Idempotency-Key support for the mutating endpoints
+
+A client retrying a request sends the same Idempotency-Key header. The
+first request claims the key (one INSERT in the idempotency_key table).
+When it is done, its response is stored in the row and kept in memory.
+A repeated request gets the stored response back, with the
+Idempotent-Replayed header, and the view does not run again. A
+duplicate arriving while the first request still runs waits for it
+(up to IDEMPOTENCY_WAIT_TIMEOUT seconds). Keys are scoped to the user
+and checked against a fingerprint of the request: reusing a key for
+another request is an error. The rows expire after IDEMPOTENCY_KEY_TTL
+seconds.
+
+Server errors (5xx, exceptions) release the key, so that the retry runs
+the request again.
+"""
+import hashlib
+import threading
+import time
+from collections import namedtuple
+from datetime import timedelta
+from functools import wraps
+from flask import Response, jsonify, make_response, request
+from flask_jwt_extended import get_jwt_identity
+from sqlalchemy.exc import IntegrityError
+from models import db, IdempotencyKey, utcnow
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+# En-têtes rejoués avec la réponse
+STORED_HEADERS = ('Content-Type', 'Location')
+
+StoredResponse = namedtuple('StoredResponse', 'fingerprint status_code body headers')
+
+class KeyInUse(Exception):
+    """The first request with this key was still running after wait_timeout"""
+
+def request_fingerprint():
+    digest = hashlib.sha256()
+    for part in (request.method, request.path, request.get_data()):
+        digest.update(part if isinstance(part, bytes) else part.encode())
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+class IdempotencyStore:
+    """Claims the keys and stores the responses, with the finished ones cached in memory"""
+
+    def __init__(self, ttl=86400, lock_timeout=60, wait_timeout=10, cache_size=10000, purge_interval=60):
+        self.ttl = ttl
+        self.lock_timeout = lock_timeout
+        self.wait_timeout = wait_timeout
+        self.cache_size = cache_size
+        self.purge_interval = purge_interval
+        self._cache = {}
+        self._lock = threading.Lock()
+        self._next_purge = 0
+        self.replays = 0
+
+    def _cached(self, cache_key):
+        with self._lock:
+            entry = self._cache.get(cache_key)
+        if entry and entry[1] > time.monotonic():
+            return entry[0]
+        return None
+
+    def _remember(self, cache_key, stored):
+        with self._lock:
+            if len(self._cache) >= self.cache_size:
+                self._cache.clear()
+            self._cache[cache_key] = (stored, time.monotonic() + self.ttl)
+
+    def handle(self, user_id, key, fingerprint, run):
+        """Response of the request, run() is called only by the request holding the key"""
+        cache_key = (user_id, key)
+        stored = self._cached(cache_key) or self._claim_or_wait(user_id, key, fingerprint)
+        if stored is not None:
+            if stored.fingerprint != fingerprint:
+                return jsonify({'error': 'Idempotency-Key déjà utilisée pour une autre requête'}), 422
+            self.replays += 1
+            response = Response(stored.body, stored.status_code, stored.headers)
+            response.headers['Idempotent-Replayed'] = 'true'
+            return response
+
+        try:
+            response = make_response(run())
+        except Exception:
+            db.session.rollback()
+            self._release(user_id, key)
+            raise
+        if response.status_code >= 500:
+            db.session.rollback()
+            self._release(user_id, key)
+            return response
+
+        stored = StoredResponse(
+            fingerprint, response.status_code, response.get_data(),
+            {name: response.headers[name] for name in STORED_HEADERS if name in response.headers}
+        )
+        db.session.execute(
+            db.update(IdempotencyKey)
+            .where(IdempotencyKey.user_id == user_id, IdempotencyKey.key == key)
+            .values(status_code=stored.status_code, body=stored.body, headers=stored.headers)
+        )
+        db.session.commit()
+        self._remember(cache_key, stored)
+        return response
+
+    def _claim_or_wait(self, user_id, key, fingerprint):
+        """None once the key is claimed, else the stored response of the first request"""
+        deadline = time.monotonic() + self.wait_timeout
+        delay = 0.02
+        while True:
+            if self._claim(user_id, key, fingerprint):
+                return None
+
+            row = db.session.execute(
+                db.select(IdempotencyKey.fingerprint, IdempotencyKey.status_code,
+                          IdempotencyKey.body, IdempotencyKey.headers)
+                .where(IdempotencyKey.user_id == user_id, IdempotencyKey.key == key)
+            ).first()
+            # Fin de la transaction de lecture, pour voir la réponse au prochain tour
+            db.session.rollback()
+            if row is None:
+                continue  # libérée entre-temps
+            stored = StoredResponse(row.fingerprint, row.status_code, row.body, row.headers or {})
+            if stored.status_code is not None:
+                self._remember((user_id, key), stored)
+                return stored
+            if stored.fingerprint != fingerprint:
+                return stored
+            if time.monotonic() >= deadline:
+                raise KeyInUse()
+            time.sleep(delay)
+            delay = min(delay * 2, 0.5)
+
+    def _claim(self, user_id, key, fingerprint):
+        now = utcnow()
+        self._purge(now)
+        values = {
+            'fingerprint': fingerprint,
+            'status_code': None,
+            'body': None,
+            'headers': None,
+            'locked_at': now,
+            'expires_at': now + timedelta(seconds=self.ttl),
+        }
+        try:
+            db.session.execute(db.insert(IdempotencyKey).values(user_id=user_id, key=key, **values))
+            db.session.commit()
+            return True
+        except IntegrityError:
+            db.session.rollback()
+
+        # Clé expirée pas encore purgée, ou verrou d'un worker tombé pendant la requête
+        taken = db.session.execute(
+            db.update(IdempotencyKey)
+            .where(
+                IdempotencyKey.user_id == user_id,
+                IdempotencyKey.key == key,
+                db.or_(
+                    IdempotencyKey.expires_at <= now,
+                    db.and_(
+                        IdempotencyKey.status_code.is_(None),
+                        IdempotencyKey.locked_at <= now - timedelta(seconds=self.lock_timeout)
+                    )
+                )
+            )
+            .values(**values)
+        ).rowcount
+        db.session.commit()
+        return bool(taken)
+
+    def _release(self, user_id, key):
+        db.session.execute(
+            db.delete(IdempotencyKey)
+            .where(
+                IdempotencyKey.user_id == user_id,
+                IdempotencyKey.key == key,
+                IdempotencyKey.status_code.is_(None)
+            )
+        )
+        db.session.commit()
+
+    def _purge(self, now):
+        if time.monotonic() < self._next_purge:
+            return
+        self._next_purge = time.monotonic() + self.purge_interval
+        db.session.execute(db.delete(IdempotencyKey).where(IdempotencyKey.expires_at <= now))
+        db.session.commit()
+
+    def stats(self):
+        with self._lock:
+            cached = len(self._cache)
+        return {'cached': cached, 'replays': self.replays, 'ttl': self.ttl}
+
+idempotency_store = IdempotencyStore()
+
+def idempotent(view):
+    """Make a view idempotent for the requests carrying an Idempotency-Key header
+
+    Goes under auth_required: keys are scoped to the caller.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get(HEADER)
+        if key is None:
+            return view(*args, **kwargs)
+        if not key or len(key) > MAX_KEY_LENGTH:
+            return jsonify({'error': 'En-tête Idempotency-Key non valide'}), 400
+        try:
+            return idempotency_store.handle(
+                int(get_jwt_identity()), key, request_fingerprint(), lambda: view(*args, **kwargs)
+            )
+        except KeyInUse:
+            response = jsonify({'error': 'Une requête avec cette Idempotency-Key est déjà en cours'})
+            response.headers['Retry-After'] = '1'
+            return response, 409
+    return wrapper
@@ -0,0 +1,135 @@
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from PIL import Image, ImageOps
+
+# Plus grande dimension conservée pour l'image d'origine (photos d'appareil)
+MAX_IMAGE_DIMENSION = 2048
+# Bornes de la recherche dichotomique sur la qualité JPEG
+MIN_QUALITY = 40
+MAX_QUALITY = 90
+
+# Dérivés générés à l'upload : nom -> plus grande dimension (None = taille d'origine)
+IMAGE_SIZES = {
+    'thumb': 200,
+    'card': 600,
+    'full': None,
+}
+
+IMAGE_FORMATS = {
+    'jpeg': {'format': 'JPEG', 'mimetype': 'image/jpeg', 'quality': 85},
+    'webp': {'format': 'WEBP', 'mimetype': 'image/webp', 'quality': 80},
+}
+
+def derivative_key(digest, size, fmt):
+    """Store key of a derivative of the image identified by digest"""
+    return f'{digest}.{size}.{fmt}'
+
+def _open_image(image_data, max_dimension=None):
+    img = Image.open(BytesIO(image_data))
+    if max_dimension:
+        # Décodage JPEG à échelle réduite, bien plus rapide qu'un décodage complet
+        img.draft('RGB', (max_dimension, max_dimension))
+    img = ImageOps.exif_transpose(img)
+    if img.mode not in ('RGB', 'L'):
+        img = img.convert('RGB')
+    if max_dimension and max(img.size) > max_dimension:
+        img.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+    return img
+
+def _encode_jpeg(img, quality):
+    output = BytesIO()
+    img.save(output, format='JPEG', quality=quality)
+    return output.getvalue()
+
+def compress_image(image_data, max_size_kb=500, max_dimension=MAX_IMAGE_DIMENSION):
+    """Compress image to a maximum size
+
+    The image is upright according to its EXIF orientation and downscaled
+    to max_dimension, then the highest quality that fits is found by
+    binary search: at most 1 + log2(MAX_QUALITY - MIN_QUALITY) encodes.
+    """
+    return _compress(_open_image(image_data, max_dimension), max_size_kb * 1024)
+
+def _compress(img, max_size):
+    best = _encode_jpeg(img, MAX_QUALITY)
+    if len(best) <= max_size:
+        return best
+
+    low, high = MIN_QUALITY, MAX_QUALITY - 1
+    while low <= high:
+        quality = (low + high) // 2
+        output = _encode_jpeg(img, quality)
+        if len(output) <= max_size:
+            best = output
+            low = quality + 1
+        else:
+            high = quality - 1
+            if quality == MIN_QUALITY:
+                # Même la qualité minimale dépasse : on garde la plus petite version
+                best = output
+
+    return best
+
+def make_derivatives(image_data, source=None):
+    """Resize an image to every IMAGE_SIZES entry, in every IMAGE_FORMATS format
+
+    image_data is the stored (compressed) JPEG: it is the full JPEG as it
+    is, not encoded a second time. The other derivatives are encoded from
+    source, the decoded image (image_data decoded when not given). A full
+    WebP is kept only when smaller than the JPEG, the image endpoint
+    falls back to the JPEG otherwise.
+
+    Returns a dict {(size, fmt): bytes}.
+    """
+    if source is None:
+        source = _open_image(image_data)
+
+    derivatives = {}
+    for size, max_dimension in IMAGE_SIZES.items():
+        img = source
+        if max_dimension and max(img.size) > max_dimension:
+            img = img.copy()
+            img.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+
+        for fmt, options in IMAGE_FORMATS.items():
+            if max_dimension is None and fmt == 'jpeg':
+                derivatives[(size, fmt)] = image_data
+                continue
+            output = BytesIO()
+            img.save(output, format=options['format'], quality=options['quality'])
+            if max_dimension is None and output.tell() >= len(image_data):
+                continue
+            derivatives[(size, fmt)] = output.getvalue()
+
+    return derivatives
+
+def process_upload(image_data, max_size_kb=500):
+    """Compress an uploaded image and build its derivatives
+
+    Runs in the image worker pool, returns (compressed image, derivatives).
+    The upload is decoded once, for the compression and the derivatives.
+    """
+    source = _open_image(image_data, MAX_IMAGE_DIMENSION)
+    compressed = _compress(source, max_size_kb * 1024)
+    return compressed, make_derivatives(compressed, source)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def image_pool(max_workers=None):
+    """Process pool running the image work outside the Flask workers"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # forkserver : les workers ne copient pas le processus Flask (threads, connexions ouvertes)
+            _pool = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('forkserver'))
+    return _pool
+
+def save_derivatives(store, digest, image_data, derivatives=None):
+    """Write the derivatives of an image to the image store, generating them if needed"""
+    if derivatives is None:
+        derivatives = make_derivatives(image_data)
+    for (size, fmt), data in derivatives.items():
+        store.put(derivative_key(digest, size, fmt), data)
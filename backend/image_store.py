@@ -0,0 +1,98 @@
+import hashlib
+import os
+import tempfile
+
+def image_digest(image_data):
+    """sha256 of the image bytes, used as storage key, ETag and version"""
+    return hashlib.sha256(image_data).hexdigest()
+
+def image_mimetype(image_data):
+    """Guess the content type of an image from its magic bytes"""
+    if image_data.startswith(b'\x89PNG'):
+        return 'image/png'
+    if image_data[:4] == b'RIFF' and image_data[8:12] == b'WEBP':
+        return 'image/webp'
+    if image_data[:6] in (b'GIF87a', b'GIF89a'):
+        return 'image/gif'
+    return 'image/jpeg'
+
+class ImageStore:
+    """Interface of the product image stores
+
+    Images are addressed by their digest, derivatives by a key starting
+    with the digest of their source (see image_processing.derivative_key).
+    """
+
+    def save(self, image_data):
+        """Store the image and return its digest"""
+        digest = image_digest(image_data)
+        self.put(digest, image_data)
+        return digest
+
+    def put(self, key, image_data):
+        raise NotImplementedError
+
+    def path(self, key):
+        """Local file path of a stored image, or None if it is not stored"""
+        raise NotImplementedError
+
+    def delete(self, digest):
+        """Remove an image and its derivatives"""
+        raise NotImplementedError
+
+class FileSystemImageStore(ImageStore):
+    """Content-addressed directory: <root>/<digest[:2]>/<digest>
+
+    Identical uploads share the same file.
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def _path(self, key):
+        return os.path.join(self.root, key[:2], key)
+
+    def put(self, key, image_data):
+        path = self._path(key)
+        if os.path.exists(path):
+            return
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Écriture atomique : un lecteur ne voit jamais de fichier partiel
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                tmp.write(image_data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def path(self, key):
+        path = self._path(key)
+        return path if os.path.exists(path) else None
+
+    def delete(self, digest):
+        directory = os.path.join(self.root, digest[:2])
+        if not os.path.isdir(directory):
+            return
+
+        for name in os.listdir(directory):
+            if name == digest or name.startswith(digest + '.'):
+                try:
+                    os.unlink(os.path.join(directory, name))
+                except FileNotFoundError:
+                    pass
+
+IMAGE_STORES = {
+    'filesystem': FileSystemImageStore,
+}
+
+def create_image_store(config):
+    """Build the image store selected by IMAGE_STORE in the app config"""
+    store_class = IMAGE_STORES[config['IMAGE_STORE']]
+    return store_class(config['IMAGE_STORE_PATH'])
+
+def read_mimetype(path):
+    with open(path, 'rb') as f:
+        return image_mimetype(f.read(12))
@@ -1,19 +1,98 @@
-from datetime import datetime, UTC
-from flask import Flask, request, jsonify
+import math
+from datetime import date, datetime, UTC
+from flask import Flask, Response, request, jsonify, send_file, stream_with_context, url_for, abort
 from flask_cors import CORS
-from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity
-from werkzeug.security import generate_password_hash, check_password_hash
+from flask_jwt_extended import JWTManager, create_access_token, current_user, get_jwt, get_jwt_identity
 from config import Config
-from models import PaymentMethod, PaymentStatus, db, User, Product, Order, Admin, Cart, Payment
+from models import PaymentMethod, PaymentStatus, db, User, Product, Order, Admin, Cart, Payment, utcnow
+from schema import ORDER_PAYMENT_MIGRATION, applied_at, upgrade_schema
+from database import configure_engine, engine_options
+from routing import WRITE_HEADER, ReplicaSync, recent_writers, replica_binds
+from passwords import HasherBusy, create_password_hasher
+from payments import create_payment_processor, new_transaction_id
+from auth import admin_claims, auth_required, load_principal, principal_cache, user_claims
+from revocation import revocation_list, revoke_token, revoke_user
+from idempotency import idempotency_store, idempotent
+from image_store import create_image_store, image_digest, image_mimetype, read_mimetype
+from catalog import (
+    DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, columns_for, keyset_page, parse_fields, parse_sort,
+    product_image_fields, serialize_product
+)
+from catalog_cache import create_catalog_cache
+from http_cache import conditional, latest
+from streaming import ndjson_response, wants_ndjson
+import stock
+from checkout import CheckoutError, checkout_cart
+from cart_reservations import CartSweeper, refresh_expiry
+from search import ensure_search_index, search_products
+import rollups
+from bulk_products import (
+    FORMATS, PATCH_FIELDS, ArchiveImages, ProductImporter, RowError, detect_format, export_rows, read_rows
+)
+from image_processing import IMAGE_SIZES, derivative_key, image_pool, process_upload, save_derivatives
 
 app = Flask(__name__)
 app.config.from_object(Config)
-CORS(app)
+CORS(app, expose_headers=[WRITE_HEADER])
 jwt = JWTManager(app)
+jwt.user_lookup_loader(load_principal)
+principal_cache.ttl = app.config['PRINCIPAL_CACHE_TTL']
+revocation_list.refresh_interval = app.config['REVOCATION_REFRESH_INTERVAL']
+idempotency_store.ttl = app.config['IDEMPOTENCY_KEY_TTL']
+idempotency_store.lock_timeout = app.config['IDEMPOTENCY_LOCK_TIMEOUT']
+idempotency_store.wait_timeout = app.config['IDEMPOTENCY_WAIT_TIMEOUT']
+idempotency_store.cache_size = app.config['IDEMPOTENCY_CACHE_SIZE']
+
+@jwt.token_in_blocklist_loader
+def token_revoked(jwt_header, jwt_payload):
+    return revocation_list.is_revoked(jwt_payload)
+
+@jwt.revoked_token_loader
+def revoked_token(jwt_header, jwt_payload):
+    return jsonify({'error': 'Session expirée, veuillez vous reconnecter'}), 401
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config)
+app.config['SQLALCHEMY_BINDS'] = replica_binds(app.config['DATABASE_REPLICA_URLS'])
+recent_writers.window = app.config['READ_YOUR_WRITES_SECONDS']
+app.after_request(recent_writers.mark)
 db.init_app(app)
+with app.app_context():
+    for engine in db.engines.values():
+        configure_engine(engine, app.config)
+    replica_sync = None
+    if app.config['REPLICA_SYNC_INTERVAL'] > 0 and app.config['SQLALCHEMY_BINDS']:
+        replica_sync = ReplicaSync(
+            db.engine.url.database,
+            [db.engines[key].url.database for key in app.config['SQLALCHEMY_BINDS']],
+            interval=app.config['REPLICA_SYNC_INTERVAL']
+        )
+image_store = create_image_store(app.config)
+password_hasher = create_password_hasher(app.config)
+payment_processor = create_payment_processor(app)
+catalog_cache = create_catalog_cache(app.config)
+cart_sweeper = CartSweeper(
+    app,
+    interval=app.config['CART_SWEEP_INTERVAL'],
+    batch_size=app.config['CART_SWEEP_BATCH_SIZE'],
+    reservation_minutes=app.config['CART_RESERVATION_MINUTES'],
+    on_release=catalog_cache.invalidate
+)
+
+# Durée de cache des images demandées avec leur version (?v=<hash>)
+IMAGE_CACHE_MAX_AGE = 365 * 24 * 3600
 
-# with app.app_context():
-#     db.create_all()
+@app.errorhandler(HasherBusy)
+def hasher_busy(error):
+    response = jsonify({'error': 'Serveur occupé, veuillez réessayer dans quelques instants'})
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
+def check_password(model, account, password):
+    """Check an account's password, storing a new hash if the hash parameters changed"""
+    valid, new_hash = password_hasher.verify_and_rehash(account.password, password)
+    if new_hash:
+        db.session.execute(db.update(model).where(model.id == account.id).values(password=new_hash))
+        db.session.commit()
+    return valid
 
 # Routes d'authentification
 @app.route('/api/register', methods=['POST'])
@@ -22,8 +101,10 @@ def register():
     
     if User.query.filter_by(email=data['email']).first():
         return jsonify({'error': 'Email déjà utilisé'}), 400
+    # Connexion rendue au pool pendant le hachage
+    db.session.close()
         
-    hashed_password = generate_password_hash(data['password'])
+    hashed_password = password_hasher.hash(data['password'])
     
     new_user = User(
         email=data['email'],
@@ -35,6 +116,7 @@ def register():
     )
     
     db.session.add(new_user)
+    rollups.record_user(new_user.user_type)
     db.session.commit()
     
     return jsonify({'message': 'Utilisateur créé avec succès'}), 200
@@ -43,9 +125,16 @@ def register():
 def login():
     data = request.get_json()
     user = User.query.filter_by(email=data['email']).first()
+    # Connexion rendue au pool pendant le hachage, user reste lisible
+    db.session.close()
     
-    if user and check_password_hash(user.password, data['password']):
-        access_token = create_access_token(identity=str(user.id), expires_delta=timedelta(hours=2))
+    if user and check_password(User, user, data['password']):
+        if not user.active:
+            return jsonify({'error': 'Compte désactivé'}), 403
+        access_token = create_access_token(
+            identity=str(user.id),
+            additional_claims=user_claims(user)
+        )
         return jsonify({
             'token': access_token,
             'user_type': user.user_type,
@@ -54,12 +143,19 @@ def login():
         
     return jsonify({'error': 'Email ou mot de passe incorrect'}), 401
 
+@app.route('/api/logout', methods=['POST'])
+@auth_required()
+def logout():
+    revoke_token(get_jwt())
+    db.session.commit()
+    revocation_list.mark_stale()
+    return jsonify({'message': 'Déconnexion réussie'})
+
 #to test the user
 @app.route('/api/check-auth', methods=['GET'])
-@jwt_required()
+@auth_required()
 def check_auth():
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
+    user = principal_cache.get(current_user.id)
     if not user:
         return jsonify({'error': 'User not found'}), 404
     
@@ -72,7 +168,7 @@ def check_auth():
     })
 
 @app.route('/api/products/<int:product_id>', methods=['PUT'])
-@jwt_required()
+@auth_required()
 def update_product(product_id):
     current_user_id = get_jwt_identity()
     # print(current_user_id)
@@ -87,10 +183,11 @@ def update_product(product_id):
         setattr(product, key, value)
     
     db.session.commit()
+    catalog_cache.invalidate()
     return jsonify({'message': 'Produit mis à jour avec succès'})
 
 @app.route('/api/products/<int:product_id>', methods=['DELETE'])
-@jwt_required()
+@auth_required()
 def delete_product(product_id):
     current_user_id = get_jwt_identity()
     product = Product.query.get_or_404(product_id)
@@ -98,25 +195,48 @@ def delete_product(product_id):
     if product.seller_id != int(current_user_id):
         return jsonify({'error': 'Non autorisé'}), 403
         
+    image_hash = product.image_hash
     db.session.delete(product)
     db.session.commit()
+    catalog_cache.invalidate()
+
+    # Les fichiers sont partagés entre produits ayant la même image
+    if image_hash and not Product.query.filter_by(image_hash=image_hash).first():
+        image_store.delete(image_hash)
+
     return jsonify({'message': 'Produit supprimé avec succès'})
 
+def valid_quantity(quantity):
+    return isinstance(quantity, int) and not isinstance(quantity, bool) and quantity > 0
+
 # Routes des commandes
+def visible_orders(current_user_id):
+    if current_user.user_type == 'farmer':
+        # Les agriculteurs voient les commandes de leurs produits
+        return Order.query.join(Product).filter(Product.seller_id == current_user_id)
+    # Les clients et commerçants voient leurs propres commandes
+    return Order.query.filter_by(buyer_id=current_user_id)
+
+def orders_validators():
+    current_user_id = get_jwt_identity()
+    count, last_modified = visible_orders(current_user_id)\
+        .with_entities(db.func.count(Order.id), db.func.max(Order.updated_at))\
+        .one()
+    return (current_user_id, count, last_modified), last_modified
+
 @app.route('/api/orders', methods=['GET'])
-@jwt_required()
+@auth_required()
+@conditional(orders_validators, collection=True)
 def get_orders():
     current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
-    
-    if user.user_type == 'farmer':
-        # Les agriculteurs voient les commandes de leurs produits
-        orders = Order.query.join(Product).filter(Product.seller_id == current_user_id).all()
-    else:
-        # Les clients et commerçants voient leurs propres commandes
-        orders = Order.query.filter_by(buyer_id=current_user_id).all()
+    query = visible_orders(current_user_id)
+    if wants_ndjson():
+        return ndjson_response(query.order_by(Order.id), serialize_order)
     
-    return jsonify([{
+    return jsonify([serialize_order(o) for o in query.all()])
+
+def serialize_order(o):
+    return {
         'id': o.id,
         'product_id': o.product_id,
         'quantity': o.quantity,
@@ -125,17 +245,22 @@ def get_orders():
         'status': o.status,
         'delivery_address': o.delivery_address,
         'created_at': o.created_at.isoformat()
-    } for o in orders])
+    }
 
 @app.route('/api/orders', methods=['POST'])
-@jwt_required()
+@auth_required(fresh=True)
+@idempotent
 def create_order():
     current_user_id = get_jwt_identity()
     data = request.get_json()
     
+    if not valid_quantity(data.get('quantity')):
+        return jsonify({'error': 'Quantité non valide'}), 400
+    
     product = Product.query.get_or_404(data['product_id'])
     
-    if product.quantity < data['quantity']:
+    # Réservation atomique du stock
+    if not stock.reserve(product.id, data['quantity']):
         return jsonify({'error': 'Quantité insuffisante'}), 400
         
     total_price = product.price * data['quantity']
@@ -148,14 +273,17 @@ def create_order():
         quantity=data['quantity'],
         total_price=total_price,
         peeling_requested=data.get('peeling_requested', False),
-        delivery_address=data['delivery_address']
+        delivery_address=data['delivery_address'],
+        status='pending',
+        created_at=utcnow()
     )
     
-    # Mettre à jour la quantité du produit
-    product.quantity -= data['quantity']
-    
     db.session.add(new_order)
+    rollups.record_orders([rollups.Sale(
+        product.seller_id, product.id, new_order.status, new_order.quantity, total_price, new_order.created_at
+    )])
     db.session.commit()
+    catalog_cache.invalidate()
     
     return jsonify({'message': 'Commande créée avec succès'}), 201
 
@@ -163,11 +291,30 @@ def create_order():
 ###################################################################
 #  CART APIS
 ###################################################################
+def cart_validators():
+    current_user_id = get_jwt_identity()
+    # Le panier affiche aussi le nom et le prix des produits
+    count, cart_modified, product_modified = Cart.query.filter_by(user_id=current_user_id)\
+        .join(Product)\
+        .with_entities(db.func.count(Cart.id), db.func.max(Cart.updated_at), db.func.max(Product.updated_at))\
+        .one()
+    last_modified = latest(cart_modified, product_modified)
+    return (current_user_id, count, cart_modified, product_modified), last_modified
+
 @app.route('/api/cart', methods=['GET'])
-@jwt_required()
+@auth_required()
+@conditional(cart_validators, collection=True)
 def get_cart():
     current_user_id = get_jwt_identity()
-    cart_items = Cart.query.filter_by(user_id=current_user_id).all()
+    # Produits et vendeurs chargés dans la même requête, sans les colonnes inutiles
+    cart_items = Cart.query.filter_by(user_id=current_user_id)\
+        .options(
+            db.joinedload(Cart.product)
+            .load_only(Product.name, Product.price, Product.seller_id)
+            .joinedload(Product.seller)
+            .load_only(User.name)
+        )\
+        .all()
     
     return jsonify([{
         'id': item.id,
@@ -181,14 +328,18 @@ def get_cart():
     } for item in cart_items])
 
 @app.route('/api/cart/add', methods=['POST'])
-@jwt_required()
+@auth_required()
+@idempotent
 def add_to_cart():
     current_user_id = get_jwt_identity()
     data = request.get_json()
     
-    # Verify product exists and has enough quantity
+    if not valid_quantity(data.get('quantity')):
+        return jsonify({'error': 'Quantité non valide'}), 400
+    
+    # Verify product exists and reserve the stock atomically
     product = Product.query.get_or_404(data['product_id'])
-    if product.quantity < data['quantity']:
+    if not stock.reserve(product.id, data['quantity']):
         return jsonify({'error': 'Quantité insuffisante en stock'}), 400
     
     # Check if product already in cart
@@ -199,11 +350,7 @@ def add_to_cart():
     
     if existing_item:
         # Update quantity if product already in cart
-        new_quantity = existing_item.quantity + data['quantity']
-        if product.quantity < new_quantity:
-            return jsonify({'error': 'Quantité insuffisante en stock'}), 400
-            
-        existing_item.quantity = new_quantity
+        existing_item.quantity += data['quantity']
         existing_item.update_total_price()
     else:
         # Create new cart item
@@ -215,14 +362,14 @@ def add_to_cart():
         )
         db.session.add(cart_item)
     
-    # Update product quantity
-    product.quantity -= data['quantity']
+    refresh_expiry(current_user_id, app.config['CART_RESERVATION_MINUTES'])
     db.session.commit()
+    catalog_cache.invalidate()
     
     return jsonify({'message': 'Produit ajouté au panier'}), 201
 
 @app.route('/api/cart/<int:cart_item_id>', methods=['PUT'])
-@jwt_required()
+@auth_required()
 def update_cart_item(cart_item_id):
     current_user_id = get_jwt_identity()
     cart_item = Cart.query.get_or_404(cart_item_id)
@@ -231,23 +378,26 @@ def update_cart_item(cart_item_id):
         return jsonify({'error': 'Non autorisé'}), 403
     
     data = request.get_json()
-    product = Product.query.get(cart_item.product_id)
     
     if 'quantity' in data:
+        if not valid_quantity(data['quantity']):
+            return jsonify({'error': 'Quantité non valide'}), 400
+        
+        # Reserve or release the difference atomically
         quantity_diff = data['quantity'] - cart_item.quantity
-        if product.quantity < quantity_diff:
+        if not stock.adjust(cart_item.product_id, quantity_diff):
             return jsonify({'error': 'Stock insuffisant'}), 400
         
-        # Update product quantity
-        product.quantity -= quantity_diff
         cart_item.quantity = data['quantity']
         cart_item.update_total_price()
     
+    refresh_expiry(current_user_id, app.config['CART_RESERVATION_MINUTES'])
     db.session.commit()
+    catalog_cache.invalidate()
     return jsonify({'message': 'Panier mis à jour'})
 
 @app.route('/api/cart/<int:cart_item_id>', methods=['DELETE'])
-@jwt_required()
+@auth_required()
 def remove_from_cart(cart_item_id):
     current_user_id = get_jwt_identity()
     cart_item = Cart.query.get_or_404(cart_item_id)
@@ -256,41 +406,35 @@ def remove_from_cart(cart_item_id):
         return jsonify({'error': 'Non autorisé'}), 403
     
     # Return the quantity to the product
-    product = Product.query.get(cart_item.product_id)
-    if product:
-        product.quantity += cart_item.quantity
+    stock.release(cart_item.product_id, cart_item.quantity)
     
     db.session.delete(cart_item)
     db.session.commit()
+    catalog_cache.invalidate()
     
     return jsonify({'message': 'Article supprimé du panier'})
 
 @app.route('/api/cart/checkout', methods=['POST'])
-@jwt_required()
+@auth_required(fresh=True)
+@idempotent
 def checkout():
     current_user_id = get_jwt_identity()
     data = request.get_json()
-    cart_items = Cart.query.filter_by(user_id=current_user_id).all()
-    
-    if not cart_items:
-        return jsonify({'error': 'Panier vide'}), 400
     
     try:
-        # Create orders from cart items
-        for cart_item in cart_items:
-            order = Order(
-                buyer_id=current_user_id,
-                product_id=cart_item.product_id,
-                quantity=cart_item.quantity,
-                total_price=cart_item.total_price,
-                delivery_address=data['delivery_address']
-            )
-            db.session.add(order)
-            db.session.delete(cart_item)
+        # One order header, its lines bulk inserted, the cart bulk deleted
+        header, order_ids = checkout_cart(current_user_id, data['delivery_address'])
         
         db.session.commit()
-        return jsonify({'message': 'Commande créée avec succès'}), 201
+        return jsonify({
+            'message': 'Commande créée avec succès',
+            'order_id': header.id,
+            'order_ids': order_ids
+        }), 201
         
+    except CheckoutError as e:
+        db.session.rollback()
+        return jsonify({'error': e.message}), e.status_code
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': 'Erreur lors de la création de la commande'}), 500
@@ -298,7 +442,8 @@ def checkout():
 from datetime import datetime, timedelta
 
 @app.route('/api/payment/process', methods=['POST'])
-@jwt_required()
+@auth_required(fresh=True)
+@idempotent
 def process_payment():
     current_user_id = get_jwt_identity()
     data = request.get_json()
@@ -308,14 +453,26 @@ def process_payment():
         payment_method = PaymentMethod(data['payment_method'])
     except ValueError:
         return jsonify({'error': 'Méthode de paiement non valide'}), 400
-    
-    # Get cart items
-    cart_items = Cart.query.filter_by(user_id=current_user_id).all()
-    if not cart_items:
-        return jsonify({'error': 'Panier vide'}), 400
+    if 'delivery_address' not in data:
+        return jsonify({'error': 'Adresse de livraison manquante'}), 400
+
+    # Pas de prestataire pour le paiement à la livraison
+    provider = payment_processor.provider(payment_method)
+    if provider:
+        error = provider.validate(data)
+        if error:
+            return jsonify({'error': error}), 400
     
     # Calculate total amount
-    total_amount = sum(item.total_price for item in cart_items)
+    line_count, total_amount = Cart.query.filter_by(user_id=current_user_id)\
+        .with_entities(db.func.count(Cart.id), db.func.sum(Cart.total_price))\
+        .one()
+    if not line_count:
+        return jsonify({'error': 'Panier vide'}), 400
+    pending = Payment.query.filter_by(user_id=current_user_id, payment_status=PaymentStatus.PENDING.value).first()
+    # Un paiement resté en attente au-delà de PAYMENT_INTENT_TIMEOUT ne bloque plus le client
+    if pending and not payment_processor.expire(pending):
+        return jsonify({'error': 'Un paiement est déjà en cours'}), 409
     
     # Create payment record
     payment = Payment(
@@ -324,179 +481,228 @@ def process_payment():
         payment_method=payment_method.value
     )
     
+    if provider is None:
+        return process_cash_on_delivery(payment, data)
+
+    # Le prestataire est appelé par le pool de paiement, le client suit le statut
+    payment.transaction_id = new_transaction_id(provider.prefix)
+    payment.payment_status = PaymentStatus.PENDING.value
+    db.session.add(payment)
+    db.session.commit()
+    payment_processor.submit(payment.id, data['delivery_address'], provider.details(data))
+
+    status_url = url_for('get_payment_status', payment_id=payment.id)
+    response = jsonify({
+        'message': 'Paiement en cours de traitement',
+        'payment_id': payment.id,
+        'transaction_id': payment.transaction_id,
+        'status': payment.payment_status,
+        'status_url': status_url
+    })
+    response.headers['Location'] = status_url
+    return response, 202
+
+def process_cash_on_delivery(payment, data):
+    """Cash on delivery: the orders are created now and paid on delivery"""
+    payment.transaction_id = new_transaction_id('COD')
+    payment.payment_status = PaymentStatus.AWAITING_DELIVERY.value
+    
     try:
-        # Process payment based on method
-        if payment_method == PaymentMethod.CREDIT_CARD:
-            result = process_credit_card_payment(data, total_amount)
-        elif payment_method == PaymentMethod.PAYPAL:
-            result = process_paypal_payment(data, total_amount)
-        elif payment_method == PaymentMethod.CASH_ON_DELIVERY:
-            result = process_cash_on_delivery(data, total_amount)
-            
-        if not result['success']:
-            return jsonify({'error': result['message']}), 400
-            
-        payment.transaction_id = result.get('transaction_id')
-        payment.payment_status = (PaymentStatus.AWAITING_DELIVERY.value 
-                                if payment_method == PaymentMethod.CASH_ON_DELIVERY 
-                                else PaymentStatus.COMPLETED.value)
-        
+        db.session.add(payment)
+        db.session.flush()
         # Move cart items to orders
-        orders = create_orders_from_cart(cart_items, data['delivery_address'], payment)
+        order_ids = create_orders_from_cart(payment.user_id, data['delivery_address'], payment)
         
-        db.session.add(payment)
         db.session.commit()
         
         return jsonify({
             'message': 'Paiement traité avec succès',
             'payment_id': payment.id,
             'transaction_id': payment.transaction_id,
-            'order_ids': [order.id for order in orders]
+            'order_ids': order_ids
         }), 201
         
+    except CheckoutError as e:
+        db.session.rollback()
+        return jsonify({'error': e.message}), e.status_code
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
-def process_credit_card_payment(data, amount):
-    """Process credit card payment (mock implementation)"""
-    required_fields = ['card_number', 'expiry_month', 'expiry_year', 'cvv']
-    
-    if not all(field in data for field in required_fields):
-        return {
-            'success': False,
-            'message': 'Informations de carte manquantes'
-        }
+def create_orders_from_cart(user_id, delivery_address, payment):
+    """Convert cart items to orders after successful payment, return the order ids"""
+    status = 'pending' if payment.payment_status == PaymentStatus.COMPLETED.value else 'awaiting_payment'
+    header, order_ids = checkout_cart(user_id, delivery_address, status, payment.id, payment.amount)
     
-    # Here you would integrate with your actual payment processor
-    # This is a mock implementation
-    return {
-        'success': True,
-        'transaction_id': f'CC-{datetime.now(UTC).strftime("%Y%m%d%H%M%S")}'
-    }
-
-def process_paypal_payment(data, amount):
-    """Process PayPal payment (mock implementation)"""
-    if 'paypal_token' not in data:
-        return {
-            'success': False,
-            'message': 'Token PayPal manquant'
-        }
-    
-    # Here you would integrate with PayPal's API
-    # This is a mock implementation
-    return {
-        'success': True,
-        'transaction_id': f'PP-{datetime.now(UTC).strftime("%Y%m%d%H%M%S")}'
-    }
-
-def process_cash_on_delivery(data, amount):
-    """Process cash on delivery request"""
-    # Validate delivery address
-    if 'delivery_address' not in data:
-        return {
-            'success': False,
-            'message': 'Adresse de livraison manquante'
-        }
-    
-    # Generate a COD reference number
-    return {
-        'success': True,
-        'transaction_id': f'COD-{datetime.now(UTC).strftime("%Y%m%d%H%M%S")}'
-    }
-
-def create_orders_from_cart(cart_items, delivery_address, payment):
-    """Convert cart items to orders after successful payment"""
-    orders = []
-    
-    for cart_item in cart_items:
-        order = Order(
-            buyer_id=cart_item.user_id,
-            product_id=cart_item.product_id,
-            quantity=cart_item.quantity,
-            total_price=cart_item.total_price,
-            delivery_address=delivery_address,
-            status='pending' if payment.payment_status == PaymentStatus.COMPLETED.value else 'awaiting_payment'
-        )
-        db.session.add(order)
-        db.session.delete(cart_item)
-        orders.append(order)
-    
-    return orders
+    return order_ids
 
 @app.route('/api/payment/<int:payment_id>/status', methods=['GET'])
-@jwt_required()
+@auth_required()
 def get_payment_status(payment_id):
     current_user_id = get_jwt_identity()
     payment = Payment.query.get_or_404(payment_id)
     
     if int(payment.user_id) != int(current_user_id):
         return jsonify({'error': 'Non autorisé'}), 403
+    if payment_processor.expire(payment):
+        db.session.refresh(payment)
     
-    return jsonify({
+    response = jsonify({
         'payment_id': payment.id,
         'status': payment.payment_status,
         'method': payment.payment_method,
         'amount': payment.amount,
         'transaction_id': payment.transaction_id,
+        'failure_reason': payment.failure_reason,
         'created_at': payment.created_at.isoformat()
     })
+    if payment.payment_status == PaymentStatus.PENDING.value:
+        # Le client peut revenir dans une seconde
+        response.headers['Retry-After'] = '1'
+    return response
 
 @app.route('/api/payment/confirm-delivery/<int:payment_id>', methods=['POST'])
-@jwt_required()
+@auth_required()
 def confirm_delivery_payment(payment_id):
     current_user_id = get_jwt_identity()
     payment = Payment.query.get_or_404(payment_id)
     
+    if int(payment.user_id) != int(current_user_id):
+        return jsonify({'error': 'Non autorisé'}), 403
+    
     if payment.payment_method != PaymentMethod.CASH_ON_DELIVERY.value:
         return jsonify({'error': 'Méthode de paiement non valide'}), 400
     
-    if payment.payment_status != PaymentStatus.AWAITING_DELIVERY.value:
+    # Update payment status, once even if two confirmations race
+    updated = db.session.execute(
+        db.update(Payment)
+        .where(Payment.id == payment.id, Payment.payment_status == PaymentStatus.AWAITING_DELIVERY.value)
+        .values(payment_status=PaymentStatus.COMPLETED.value)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if not updated:
         return jsonify({'error': 'Statut de paiement non valide'}), 400
     
-    # Update payment status
-    payment.payment_status = PaymentStatus.COMPLETED.value
-    
-    # Update related orders
-    orders = Order.query.filter_by(buyer_id=current_user_id).all()
-    for order in orders:
-        if order.status == 'awaiting_payment':
-            order.status = 'pending'
+    # Update the orders of this payment in one statement, through ix_order_payment_id
+    seller_id = db.select(Product.seller_id).where(Product.id == Order.product_id).scalar_subquery()
+    confirmed = db.session.execute(
+        db.update(Order)
+        .where(Order.payment_id == payment.id, Order.status == 'awaiting_payment')
+        .values(status='pending')
+        .returning(seller_id, Order.product_id, Order.quantity, Order.total_price, Order.created_at)
+        .execution_options(synchronize_session=False)
+    ).all()
+    migrated_at = None if confirmed else applied_at(ORDER_PAYMENT_MIGRATION)
+    if migrated_at and payment.created_at < migrated_at:
+        # Paiement antérieur à Order.payment_id, commandes que le backfill n'a pas pu rattacher :
+        # comme avant, celles de l'acheteur en attente de paiement, rattachées à ce paiement
+        confirmed = db.session.execute(
+            db.update(Order)
+            .where(
+                Order.buyer_id == payment.user_id,
+                Order.payment_id.is_(None),
+                Order.status == 'awaiting_payment',
+                Order.created_at < migrated_at
+            )
+            .values(status='pending', payment_id=payment.id)
+            .returning(seller_id, Order.product_id, Order.quantity, Order.total_price, Order.created_at)
+            .execution_options(synchronize_session=False)
+        ).all()
+    rollups.record_status_change([
+        rollups.Sale(seller, product_id, 'awaiting_payment', quantity, total_price, created_at)
+        for seller, product_id, quantity, total_price, created_at in confirmed
+    ], 'pending')
     
     db.session.commit()
     
     return jsonify({'message': 'Paiement à la livraison confirmé'})
 
-import base64
 from io import BytesIO
-from PIL import Image
-
-def compress_image(image_data, max_size_kb=500):
-    """Compress image to a maximum size"""
-    img = Image.open(BytesIO(image_data))
-    
-    # Initialize quality
-    quality = 95
-    output = BytesIO()
-    
-    # Compress until size is under max_size_kb
-    while quality > 5:
-        output = BytesIO()
-        img.save(output, format='JPEG', quality=quality)
-        if len(output.getvalue()) <= max_size_kb * 1024:
-            break
-        quality -= 5
-        
-    return output.getvalue()
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from PIL import UnidentifiedImageError
+
+def backfill_image_hashes():
+    """Compute image_hash for products stored before the column existed"""
+    products = Product.query.options(db.undefer(Product.product_image)).filter(
+        Product.image_hash.is_(None),
+        Product.product_image.isnot(None)
+    ).all()
+
+    for product in products:
+        product.image_hash = image_digest(product.product_image)
+
+    if products:
+        db.session.commit()
+
+@app.route('/api/products/<int:product_id>/image', methods=['GET'])
+def get_product_image(product_id):
+    size = request.args.get('size', 'full')
+    if size not in IMAGE_SIZES:
+        return jsonify({'error': "Taille d'image non valide"}), 400
+
+    row = db.session.query(Product.image_hash).filter_by(id=product_id).first()
+    if row is None or row.image_hash is None:
+        abort(404)
+
+    # WebP seulement si le client le demande explicitement
+    best = request.accept_mimetypes.best_match(['image/jpeg', 'image/webp'])
+    fmt = 'webp' if best == 'image/webp' else 'jpeg'
+
+    key = derivative_key(row.image_hash, size, fmt)
+    path = image_store.path(key)
+    if path is None:
+        # Dérivés pas encore générés (voir generate_derivatives.py) : image d'origine
+        key = row.image_hash
+        path = image_store.path(key)
+
+    # Les URLs versionnées ne changent jamais de contenu
+    versioned = request.args.get('v') == row.image_hash
+    max_age = IMAGE_CACHE_MAX_AGE if versioned else 0
+
+    if request.if_none_match.contains(key):
+        response = app.response_class(status=304)
+        response.set_etag(key)
+        response.cache_control.public = True
+        response.cache_control.max_age = max_age
+    elif path:
+        response = send_file(
+            path,
+            mimetype=read_mimetype(path),
+            etag=key,
+            max_age=max_age,
+            conditional=True
+        )
+    else:
+        # Image pas encore migrée hors de la base (voir migrate_images.py)
+        image_data = db.session.query(Product.product_image).filter_by(id=product_id).scalar()
+        if image_data is None:
+            abort(404)
+        response = send_file(
+            BytesIO(image_data),
+            mimetype=image_mimetype(image_data),
+            etag=key,
+            max_age=max_age,
+            conditional=True
+        )
+
+    response.cache_control.immutable = versioned
+    response.vary.add('Accept')
+    return response
+
+def store_image(data):
+    """Compress an uploaded image, store it with its derivatives and return its hash"""
+    # Compress image and build derivatives in the image worker pool
+    future = image_pool(app.config['IMAGE_WORKERS']).submit(process_upload, data)
+    image_data, derivatives = future.result(timeout=app.config['IMAGE_PROCESSING_TIMEOUT'])
+
+    image_hash = image_store.save(image_data)
+    save_derivatives(image_store, image_hash, image_data, derivatives)
+    return image_hash
 
 @app.route('/api/products', methods=['POST'])
-@jwt_required()
+@auth_required('farmer', fresh=True)
 def create_product():
-    current_user_id = int(get_jwt_identity())
-    user = User.query.get(current_user_id)
-    
-    if user.user_type != 'farmer':
-        return jsonify({'error': 'Non autorisé'}), 403
+    current_user_id = current_user.id
         
     # Handle multipart form data
     if 'product_image' not in request.files:
@@ -509,8 +715,12 @@ def create_product():
     if not file.content_type.startswith('image/'):
         return jsonify({'error': 'Le fichier doit être une image'}), 400
     
-    # Read and compress image
-    image_data = compress_image(file.read())
+    try:
+        image_hash = store_image(file.read())
+    except FutureTimeoutError:
+        return jsonify({'error': "Traitement de l'image trop long, réessayez plus tard"}), 503
+    except UnidentifiedImageError:
+        return jsonify({'error': 'Image illisible'}), 400
     
     # Get other product data
     data = request.form
@@ -524,7 +734,7 @@ def create_product():
         seller_id=current_user_id,
         peeling_available=data.get('peeling_available', 'false').lower() == 'true',
         peeling_price=float(data.get('peeling_price', 0)),
-        product_image=image_data,
+        image_hash=image_hash,
         validated_by_admin=False,
         image_url=data.get('image_url')
     )
@@ -535,11 +745,8 @@ def create_product():
     return jsonify({'message': 'Produit créé avec succès, en attente de validation'}), 201
 
 @app.route('/api/admin/products/<int:product_id>/validate', methods=['POST'])
-@jwt_required()
+@auth_required(admin=True)
 def validate_product(product_id):
-    if not is_admin():
-        return jsonify({'error': 'Accès non autorisé'}), 403
-    
     product = Product.query.get_or_404(product_id)
     
     if product.validated_by_admin:
@@ -548,6 +755,7 @@ def validate_product(product_id):
     product.validated_by_admin = True
     product.validation_date = datetime.now(UTC)
     db.session.commit()
+    catalog_cache.invalidate()
     
     # Notify seller that their product has been validated
     # (You could implement notification system here)
@@ -559,7 +767,21 @@ def validate_product(product_id):
     })
 
 # Modified get_products endpoint to only return validated products for regular users
+def farmer_products_validators():
+    try:
+        verify_jwt_in_request()
+    except Exception:
+        # Token invalide : la vue renvoie elle-même le 401
+        return None
+
+    current_user_id = get_jwt_identity()
+    count, last_modified = Product.query.filter_by(seller_id=current_user_id)\
+        .with_entities(db.func.count(Product.id), db.func.max(Product.updated_at))\
+        .one()
+    return (current_user_id, count, last_modified), last_modified
+
 @app.route('/api/farmer/products', methods=['GET'])
+@conditional(farmer_products_validators, collection=True)
 def get_farmer_products():
     try:
         # Verify JWT token and get farmer's ID
@@ -567,37 +789,18 @@ def get_farmer_products():
         current_user_id = get_jwt_identity()
         
         # Get all products for the current farmer
-        products = Product.query.filter_by(seller_id=current_user_id).all()
+        query = Product.query.filter_by(seller_id=current_user_id)
+        if wants_ndjson():
+            return ndjson_response(query.order_by(Product.id), serialize_farmer_product)
+        products = query.all()
         
-        return jsonify([{
-            'id': p.id,
-            'name': p.name,
-            'description': p.description,
-            'price': p.price,
-            'quantity': p.quantity,
-            'unit': p.unit,
-            'seller_id': p.seller_id,
-            'peeling_available': p.peeling_available,
-            'peeling_price': p.peeling_price,
-            'image_data': base64.b64encode(p.product_image).decode('utf-8') if p.product_image else None,
-            'validated_by_admin': p.validated_by_admin,
-            'validation_date': p.validation_date.isoformat() if p.validation_date else None
-        } for p in products]), 200
+        return jsonify([serialize_farmer_product(p) for p in products]), 200
         
     except Exception as e:
         return jsonify({'error': 'Authentication required or invalid token'}), 401
 
-@app.route('/api/products', methods=['GET'])
-def get_products():
-    # Check if the request is from an admin
-    is_admin_request = False
-    
-    query = Product.query
-    if not is_admin_request:
-        query = query.filter_by(validated_by_admin=True)
-    
-    products = query.all()
-    return jsonify([{
+def serialize_farmer_product(p):
+    return {
         'id': p.id,
         'name': p.name,
         'description': p.description,
@@ -607,10 +810,175 @@ def get_products():
         'seller_id': p.seller_id,
         'peeling_available': p.peeling_available,
         'peeling_price': p.peeling_price,
-        'image_data': base64.b64encode(p.product_image).decode('utf-8') if p.product_image else None,
+        **product_image_fields(p),
         'validated_by_admin': p.validated_by_admin,
         'validation_date': p.validation_date.isoformat() if p.validation_date else None
-    } for p in products])
+    }
+
+def import_image(data):
+    """store_image for the images of an import, errors are reported on the row"""
+    try:
+        return store_image(data)
+    except FutureTimeoutError:
+        raise RowError("Traitement de l'image trop long")
+    except UnidentifiedImageError:
+        raise RowError('Image illisible')
+
+@app.route('/api/farmer/products/import', methods=['POST'])
+@auth_required('farmer', fresh=True)
+def import_products():
+    """Create or update the farmer's products from a CSV or NDJSON file
+
+    The file is the request body (Content-Type text/csv or
+    application/x-ndjson), or the 'products' part of a multipart form
+    whose 'images' part is a ZIP of the images named in the image column.
+    Rows are matched to existing products by id or sku.
+    """
+    load_image = None
+    if request.mimetype == 'multipart/form-data':
+        upload = request.files.get('products')
+        if upload is None:
+            return jsonify({'error': 'Fichier de produits requis'}), 400
+        fmt, stream = detect_format(upload.mimetype, upload.filename), upload.stream
+        if 'images' in request.files:
+            try:
+                load_image = ArchiveImages(request.files['images'].stream, import_image)
+            except RowError as e:
+                return jsonify({'error': str(e)}), 400
+    else:
+        fmt, stream = detect_format(request.mimetype), request.stream
+    if fmt is None:
+        return jsonify({'error': 'Format non pris en charge (CSV ou NDJSON)'}), 415
+
+    summary = ProductImporter(current_user.id, load_image=load_image).run(read_rows(stream, fmt))
+    if summary['created'] or summary['updated']:
+        catalog_cache.invalidate()
+    return jsonify(summary)
+
+@app.route('/api/farmer/products', methods=['PATCH'])
+@auth_required('farmer')
+def patch_products():
+    """Update the price and/or quantity of many products
+
+    The body is a JSON list, or NDJSON, of {id or sku, price, quantity}.
+    """
+    if request.mimetype == 'application/json':
+        items = request.get_json(silent=True)
+        if not isinstance(items, list):
+            return jsonify({'error': 'Liste de produits attendue'}), 400
+        rows = (
+            (number, item if isinstance(item, dict) else RowError('Objet JSON attendu'))
+            for number, item in enumerate(items, 1)
+        )
+    else:
+        fmt = detect_format(request.mimetype)
+        if fmt is None:
+            return jsonify({'error': 'Format non pris en charge (JSON, CSV ou NDJSON)'}), 415
+        rows = read_rows(request.stream, fmt)
+
+    summary = ProductImporter(current_user.id, fields=PATCH_FIELDS, create=False).run(rows)
+    if summary['updated']:
+        catalog_cache.invalidate()
+    return jsonify(summary)
+
+@app.route('/api/farmer/products/export', methods=['GET'])
+@auth_required('farmer')
+def export_products():
+    """The farmer's catalog as a streamed CSV (default) or NDJSON (?format=ndjson) file"""
+    fmt = request.args.get('format', 'csv')
+    if fmt not in FORMATS:
+        return jsonify({'error': 'Format non pris en charge (csv ou ndjson)'}), 400
+
+    response = Response(stream_with_context(export_rows(current_user.id, fmt)), mimetype=FORMATS[fmt])
+    response.headers['Content-Disposition'] = f'attachment; filename=products.{fmt}'
+    return response
+
+def catalog_validators():
+    count, last_modified = db.session.query(db.func.count(Product.id), db.func.max(Product.updated_at))\
+        .filter(Product.validated_by_admin == True)\
+        .one()
+    return (count, last_modified), last_modified
+
+@app.route('/api/products', methods=['GET'])
+@conditional(catalog_validators, private=False, collection=True)
+def get_products():
+    """Public catalog of the validated products
+
+    ?fields=id,name,price limits the returned (and loaded) columns.
+    With ?limit= or ?cursor= the catalog is paginated by keyset on
+    ?sort=created_at|-created_at|price|-price (default -created_at) and
+    the response becomes {'products': [...], 'next_cursor': ...}.
+    Serialized responses are kept in the catalog cache.
+    """
+    cache_key = tuple(sorted(request.args.items(multi=True)))
+    try:
+        # Le résultat reste en cache jusqu'à la prochaine écriture : pas de réplique en retard
+        with db.session().primary_reads():
+            body = catalog_cache.get_or_build(cache_key, build_catalog)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    return app.response_class(body, mimetype='application/json')
+
+def build_catalog():
+    fields = parse_fields(request.args.get('fields'))
+    column, descending = parse_sort(request.args.get('sort', '-created_at'))
+
+    query = Product.query.filter_by(validated_by_admin=True)\
+        .options(db.load_only(*columns_for(fields, column)))
+
+    if 'limit' not in request.args and 'cursor' not in request.args:
+        products = query.order_by(Product.id).all()
+        return app.json.dumps([serialize_product(p, fields) for p in products])
+
+    limit = max(1, min(request.args.get('limit', DEFAULT_PAGE_SIZE, type=int), MAX_PAGE_SIZE))
+    products, next_cursor = keyset_page(query, column, descending, request.args.get('cursor'), limit)
+
+    return app.json.dumps({
+        'products': [serialize_product(p, fields) for p in products],
+        'next_cursor': next_cursor
+    })
+
+
+def parse_bool_arg(name):
+    value = request.args.get(name)
+    if value is None or value == '':
+        return None
+    return value.lower() in ('1', 'true', 'yes')
+
+@app.route('/api/products/search', methods=['GET'])
+def search_catalog():
+    """Full-text search in the validated products
+
+    ?q= words to find (prefixes, accents ignored), filters ?min_price=,
+    ?max_price=, ?unit=, ?peeling_available=, ?in_stock=, plus ?fields=
+    and keyset pagination with ?limit= / ?cursor= as in /api/products.
+    """
+    try:
+        fields = parse_fields(request.args.get('fields'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    filters = {
+        'min_price': request.args.get('min_price', type=float),
+        'max_price': request.args.get('max_price', type=float),
+        'unit': request.args.get('unit'),
+        'peeling_available': parse_bool_arg('peeling_available'),
+        'in_stock': parse_bool_arg('in_stock')
+    }
+    limit = max(1, min(request.args.get('limit', DEFAULT_PAGE_SIZE, type=int), MAX_PAGE_SIZE))
+
+    try:
+        products, next_cursor = search_products(
+            request.args.get('q'), columns_for(fields), filters, request.args.get('cursor'), limit
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    return jsonify({
+        'products': [serialize_product(p, fields) for p in products],
+        'next_cursor': next_cursor
+    })
 
 
 ###################################################################
@@ -620,12 +988,12 @@ def get_products():
 def admin_login():
     data = request.get_json()
     admin = Admin.query.filter_by(email=data['email']).first()
+    db.session.close()
     
-    if admin and check_password_hash(admin.password, data['password']):
+    if admin and check_password(Admin, admin, data['password']):
         access_token = create_access_token(
             identity=str(admin.id), 
-            additional_claims={'is_admin': True}, 
-            expires_delta=timedelta(hours=2)  
+            additional_claims=admin_claims()
         )
 
         return jsonify({
@@ -636,88 +1004,86 @@ def admin_login():
     
     return jsonify({'error': 'Email ou mot de passe incorrect'}), 401
 
-from flask_jwt_extended import verify_jwt_in_request, get_jwt
+from flask_jwt_extended import verify_jwt_in_request
 
-def is_admin():
-    verify_jwt_in_request()
-    claims = get_jwt()
-    return claims.get('is_admin', False)
 
+def statistics_validators():
+    last_modified = rollups.last_modified()
+    # Les statistiques mensuelles changent avec le mois courant
+    current_month = datetime.now(UTC).strftime('%Y-%m')
+    return (last_modified, current_month), last_modified
 
 @app.route('/api/admin/statistics', methods=['GET'])
-@jwt_required()
+@auth_required(admin=True)
+@conditional(statistics_validators)
 def get_statistics():
-    if not is_admin():
-        return jsonify({'error': 'Accès non autorisé'}), 403
-    
-    # Statistiques des utilisateurs
-    total_users = User.query.count()
-    total_farmers = User.query.filter_by(user_type='farmer').count()
-    total_merchants = User.query.filter_by(user_type='merchant').count()
-    total_customers = User.query.filter_by(user_type='customer').count()
-    
-    # Statistiques des ventes
-    total_orders = Order.query.count()
-    total_sales = db.session.query(db.func.sum(Order.total_price)).scalar() or 0
-    
-    # Statistiques par statut de commande
-    orders_by_status = db.session.query(
-        Order.status, 
-        db.func.count(Order.id)
-    ).group_by(Order.status).all()
-    
-    # Statistiques mensuelles
-    current_month = datetime.now(UTC).replace(day=1)
-    monthly_sales = db.session.query(
-        db.func.sum(Order.total_price)
-    ).filter(Order.created_at >= current_month).scalar() or 0
-    
-    monthly_orders = Order.query.filter(
-        Order.created_at >= current_month
-    ).count()
-    
-    # Top vendeurs
-    top_sellers = db.session.query(
-        User.name,
-        db.func.count(Order.id).label('total_orders'),
-        db.func.sum(Order.total_price).label('total_sales')
-    ).join(Product, Product.seller_id == User.id)\
-     .join(Order, Order.product_id == Product.id)\
-     .group_by(User.id)\
-     .order_by(db.text('total_sales DESC'))\
-     .limit(5)\
-     .all()
-    
+    # Lu dans les agrégats tenus à jour par les écritures (voir rollups.py)
+    return jsonify(rollups.dashboard())
+
+def parse_date_arg(name):
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f'Date non valide pour {name}: {value}')
+
+def sales_analytics_validators():
+    last_modified = rollups.last_modified()
+    if request.args.get('to'):
+        return (last_modified,), last_modified
+    # Sans ?to= la période finit aujourd'hui : la série change à minuit, même sans vente
+    today = datetime.now(UTC).date()
+    midnight = datetime.combine(today, datetime.min.time())
+    return (last_modified, today.isoformat()), latest(last_modified, midnight)
+
+@app.route('/api/admin/analytics/sales', methods=['GET'])
+@auth_required(admin=True)
+@conditional(sales_analytics_validators)
+def get_sales_analytics():
+    """Sales time series read from the daily rollups
+
+    ?bucket=day|week|month, period ?from= / ?to= (YYYY-MM-DD, inclusive,
+    by default the last 30 days, 12 weeks or 12 months), filters
+    ?seller_id=, ?product_id= and ?status=.
+    """
+    bucket = request.args.get('bucket', 'day')
+    if bucket not in rollups.BUCKETS:
+        return jsonify({'error': f'Granularité non valide: {bucket}'}), 400
+
+    try:
+        end = parse_date_arg('to') or datetime.now(UTC).date()
+        start = parse_date_arg('from') or end - timedelta(days=rollups.DEFAULT_SPANS[bucket] - 1)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if start > end:
+        return jsonify({'error': 'La date de début doit précéder la date de fin'}), 400
+    if (end - start).days > rollups.MAX_SPAN:
+        return jsonify({'error': 'Période trop longue'}), 400
+
+    series = rollups.sales_series(
+        start, end, bucket,
+        seller_id=request.args.get('seller_id', type=int),
+        product_id=request.args.get('product_id', type=int),
+        status=request.args.get('status')
+    )
     return jsonify({
-        'users': {
-            'total': total_users,
-            'farmers': total_farmers,
-            'merchants': total_merchants,
-            'customers': total_customers
-        },
-        'sales': {
-            'total_orders': total_orders,
-            'total_revenue': total_sales,
-            'orders_by_status': dict(orders_by_status),
-            'monthly': {
-                'revenue': monthly_sales,
-                'orders': monthly_orders
-            }
-        },
-        'top_sellers': [{
-            'name': seller.name,
-            'total_orders': seller.total_orders,
-            'total_sales': float(seller.total_sales)
-        } for seller in top_sellers]
+        'bucket': bucket,
+        'from': start.isoformat(),
+        'to': end.isoformat(),
+        'series': series,
+        'totals': {
+            'orders': sum(point['orders'] for point in series),
+            'quantity': sum(point['quantity'] for point in series),
+            'revenue': round(sum(point['revenue'] for point in series), 2)
+        }
     })
 
 # Gestion des utilisateurs
 @app.route('/api/admin/users', methods=['GET'])
-@jwt_required()
+@auth_required(admin=True)
 def get_all_users():
-    if not is_admin():
-        return jsonify({'error': 'Accès non autorisé'}), 403
-    
     page = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', 10, type=int)
     user_type = request.args.get('user_type')
@@ -725,31 +1091,34 @@ def get_all_users():
     query = User.query
     if user_type:
         query = query.filter_by(user_type=user_type)
+    if wants_ndjson():
+        # Tous les utilisateurs, sans pagination
+        return ndjson_response(query.order_by(User.id), serialize_user)
     
     users = query.paginate(page=page, per_page=per_page)
     
     return jsonify({
-        'users': [{
-            'id': u.id,
-            'email': u.email,
-            'name': u.name,
-            'user_type': u.user_type,
-            'phone': u.phone,
-            'address': u.address,
-            'created_at': u.created_at.isoformat(),
-            'active': u.active if hasattr(u, 'active') else True
-        } for u in users.items],
+        'users': [serialize_user(u) for u in users.items],
         'total_pages': users.pages,
         'current_page': page,
         'total_users': users.total
     })
 
+def serialize_user(u):
+    return {
+        'id': u.id,
+        'email': u.email,
+        'name': u.name,
+        'user_type': u.user_type,
+        'phone': u.phone,
+        'address': u.address,
+        'created_at': u.created_at.isoformat(),
+        'active': u.active
+    }
+
 @app.route('/api/admin/users/<int:user_id>', methods=['GET'])
-@jwt_required()
+@auth_required(admin=True)
 def get_user_details(user_id):
-    if not is_admin():
-        return jsonify({'error': 'Accès non autorisé'}), 403
-    
     user = User.query.get_or_404(user_id)
     
     # Obtenir les statistiques de l'utilisateur
@@ -772,7 +1141,7 @@ def get_user_details(user_id):
         'phone': user.phone,
         'address': user.address,
         'created_at': user.created_at.isoformat(),
-        'active': user.active if hasattr(user, 'active') else True
+        'active': user.active
     }
     
     if user.user_type == 'farmer':
@@ -789,30 +1158,56 @@ def get_user_details(user_id):
     return jsonify(user_data)
 
 @app.route('/api/admin/users/<int:user_id>/status', methods=['PUT'])
-@jwt_required()
+@auth_required(admin=True)
 def update_user_status(user_id):
-    if not is_admin():
-        return jsonify({'error': 'Accès non autorisé'}), 403
-    
     user = User.query.get_or_404(user_id)
     data = request.get_json()
-    print(type(data['active']))
     
-    if 'active' in data:
+    if isinstance(data.get('active'), bool):
         user.active = data['active']
+        if not user.active:
+            # Les jetons déjà émis portent encore active=True
+            revoke_user(user.id, app.config['JWT_ACCESS_TOKEN_EXPIRES'])
         db.session.commit()
+        principal_cache.invalidate(user.id)
+        revocation_list.mark_stale()
         status = 'activé' if data['active'] else 'désactivé'
         return jsonify({'message': f'Compte utilisateur {status} avec succès'})
     
     return jsonify({'error': 'Données invalides'}), 400
 
+@app.route('/api/admin/catalog-cache', methods=['GET'])
+@auth_required(admin=True)
+def get_catalog_cache_stats():
+    return jsonify(catalog_cache.stats())
+
+@app.route('/api/admin/revocations', methods=['GET'])
+@auth_required(admin=True)
+def get_revocation_stats():
+    return jsonify(revocation_list.stats())
+
+@app.route('/api/admin/payments', methods=['GET'])
+@auth_required(admin=True)
+def get_payment_stats():
+    return jsonify(payment_processor.stats())
+
+@app.route('/api/admin/idempotency', methods=['GET'])
+@auth_required(admin=True)
+def get_idempotency_stats():
+    return jsonify(idempotency_store.stats())
+
+@app.route('/api/admin/cart-sweeper', methods=['GET'])
+@auth_required(admin=True)
+def get_cart_sweeper_stats():
+    return jsonify(cart_sweeper.stats())
+
 # Script pour créer un admin (à exécuter une fois)
 def create_admin():
     with app.app_context():
         if not Admin.query.filter_by(email='admin@example.com').first():
             admin = Admin(
                 email='admin@example.com',
-                password=generate_password_hash('admin123'),
+                password=password_hasher.hash('admin123'),
                 name='Admin Principal'
             )
             db.session.add(admin)
@@ -820,40 +1215,66 @@ def create_admin():
             print('Admin créé avec succès')
 
 @app.route('/api/admin/products/pending', methods=['GET'])
-@jwt_required()
+@auth_required(admin=True)
 def get_pending_products():
-    if not is_admin():
-        return jsonify({'error': 'Accès non autorisé'}), 403
-    
     page = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', 10, type=int)
     
-    products = Product.query.filter_by(validated_by_admin=False)\
-        .paginate(page=page, per_page=per_page)
+    if page < 1 or per_page < 1:
+        abort(404)
+    
+    # Pas de paginate() : son COUNT sélectionne toutes les colonnes, image comprise
+    query = Product.query.filter_by(validated_by_admin=False)
+    # Vendeur chargé dans la même requête (une seule colonne)
+    listing = query.options(db.joinedload(Product.seller).load_only(User.name)).order_by(Product.id)
+    if wants_ndjson():
+        # Tous les produits en attente, sans pagination
+        return ndjson_response(listing, serialize_pending_product)
+
+    total = query.with_entities(db.func.count(Product.id)).scalar()
+    products = listing.limit(per_page).offset((page - 1) * per_page).all()
     
     return jsonify({
-        'products': [{
-            'id': p.id,
-            'name': p.name,
-            'description': p.description,
-            'price': p.price,
-            'quantity': p.quantity,
-            'unit': p.unit,
-            'seller_id': p.seller_id,
-            'seller_name': p.seller.name,
-            'peeling_available': p.peeling_available,
-            'peeling_price': p.peeling_price,
-            'image_data': base64.b64encode(p.product_image).decode('utf-8') if p.product_image else None,
-            'created_at': p.created_at.isoformat()
-        } for p in products.items],
-        'total_pages': products.pages,
+        'products': [serialize_pending_product(p) for p in products],
+        'total_pages': math.ceil(total / per_page),
         'current_page': page,
-        'total_products': products.total
+        'total_products': total
     })
 
+def serialize_pending_product(p):
+    return {
+        'id': p.id,
+        'name': p.name,
+        'description': p.description,
+        'price': p.price,
+        'quantity': p.quantity,
+        'unit': p.unit,
+        'seller_id': p.seller_id,
+        'seller_name': p.seller.name,
+        'peeling_available': p.peeling_available,
+        'peeling_price': p.peeling_price,
+        **product_image_fields(p),
+        'created_at': p.created_at.isoformat()
+    }
+
 
 # print(app.url_map)
 
+# Lancé par python main.py, le module est réimporté sous ce nom dans les workers
+# forkserver des images : pas de migration ni de threads de fond là-bas
+if __name__ != '__mp_main__':
+    with app.app_context():
+        upgrade_schema()
+        ensure_search_index()
+        backfill_image_hashes()
+        rollups.ensure_rollups()
+
+    if replica_sync:
+        replica_sync.start()
+
+    if app.config['CART_SWEEPER_ENABLED']:
+        cart_sweeper.start()
+
 if __name__ == '__main__':
     app.run(debug=True)
 
@@ -0,0 +1,48 @@
+"""Move the product images stored in the database to the image store
+
+One-shot migration: every Product.product_image blob is written to the
+image store, the column is cleared and the database file is vacuumed.
+Safe to run again, already migrated products are skipped.
+
+    python migrate_images.py
+"""
+from sqlalchemy import text
+from main import app, image_store
+from models import db, Product
+
+BATCH_SIZE = 50
+
+def migrate_images():
+    moved = 0
+    last_id = 0
+
+    while True:
+        # Un lot à la fois pour ne pas charger toutes les images en mémoire
+        products = Product.query.options(db.undefer(Product.product_image))\
+            .filter(Product.id > last_id, Product.product_image.isnot(None))\
+            .order_by(Product.id)\
+            .limit(BATCH_SIZE)\
+            .all()
+        if not products:
+            break
+
+        for product in products:
+            product.image_hash = image_store.save(product.product_image)
+            product.product_image = None
+        db.session.commit()
+
+        moved += len(products)
+        last_id = products[-1].id
+
+    return moved
+
+if __name__ == '__main__':
+    with app.app_context():
+        moved = migrate_images()
+        print(f'{moved} image(s) déplacée(s) vers {app.config["IMAGE_STORE_PATH"]}')
+
+        # Rendre au système de fichiers les pages libérées par les images
+        db.session.remove()
+        with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+            conn.execute(text('VACUUM'))
+        print('Base de données compactée')
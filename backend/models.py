@@ -1,8 +1,14 @@
 from enum import Enum
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime, UTC
+from routing import RoutingSession
 
-db = SQLAlchemy()
+# Les lectures peuvent partir vers une réplique, voir routing.py
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+def utcnow():
+    # Callable default: evaluated for each row, not once at import
+    return datetime.now(UTC)
 
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -12,7 +18,8 @@ class User(db.Model):
     name = db.Column(db.String(100), nullable=False)
     phone = db.Column(db.String(20))
     address = db.Column(db.String(200))
-    created_at = db.Column(db.DateTime, default=datetime.now(UTC))
+    active = db.Column(db.Boolean, nullable=False, default=True, server_default=db.true())
+    created_at = db.Column(db.DateTime, default=utcnow)
     products = db.relationship('Product', backref='seller', lazy=True)
     orders = db.relationship('Order', backref='buyer', lazy=True)
 
@@ -23,51 +30,83 @@ class Product(db.Model):
     price = db.Column(db.Float, nullable=False)
     quantity = db.Column(db.Integer, nullable=False)
     unit = db.Column(db.String(20), nullable=False)  # kg, piece, etc.
-    seller_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    seller_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    sku = db.Column(db.String(64))  # référence du vendeur, clé des imports en masse
     peeling_available = db.Column(db.Boolean, default=False)
     peeling_price = db.Column(db.Float)
     image_url = db.Column(db.String(255))
-    product_image = db.Column(db.LargeBinary)  # For storing the actual image data
-    validated_by_admin = db.Column(db.Boolean, default=False)
+    product_image = db.deferred(db.Column(db.LargeBinary), raiseload=True)  # Legacy, images now live in the image store
+    image_hash = db.Column(db.String(64), index=True)  # sha256 of product_image, used as ETag / version
+    validated_by_admin = db.Column(db.Boolean, default=False, index=True)
     validation_date = db.Column(db.DateTime)
-    created_at = db.Column(db.DateTime, default=datetime.now(UTC))
-    updated_at = db.Column(db.DateTime, default=datetime.now(UTC), onupdate=datetime.now(UTC))
+    created_at = db.Column(db.DateTime, default=utcnow)
+    updated_at = db.Column(db.DateTime, default=utcnow, onupdate=utcnow)
+
+    __table_args__ = (
+        # Catalogue : produits validés triés par date ou par prix
+        db.Index('ix_product_validated_created_at', 'validated_by_admin', 'created_at'),
+        db.Index('ix_product_validated_price', 'validated_by_admin', 'price'),
+        db.Index('ix_product_seller_id_sku', 'seller_id', 'sku', unique=True),
+    )
 
 class Cart(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False, index=True)
     quantity = db.Column(db.Integer, nullable=False)
     total_price = db.Column(db.Float, nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.now(UTC))
-    updated_at = db.Column(db.DateTime, default=datetime.now(UTC), onupdate=datetime.now(UTC))
+    created_at = db.Column(db.DateTime, default=utcnow)
+    updated_at = db.Column(db.DateTime, default=utcnow, onupdate=utcnow)
+    expires_at = db.Column(db.DateTime, index=True)  # Stock reservation released after this date
 
     # Relationships
     user = db.relationship('User', backref=db.backref('cart_items', lazy=True))
     product = db.relationship('Product', backref=db.backref('cart_entries', lazy=True))
 
+    __table_args__ = (
+        db.Index('ix_cart_user_id_product_id', 'user_id', 'product_id'),
+    )
+
     # Method to update total price based on quantity and product price
     def update_total_price(self):
         self.total_price = self.quantity * self.product.price
 
+class OrderHeader(db.Model):
+    """One checkout: the Order rows pointing to it are its lines"""
+    id = db.Column(db.Integer, primary_key=True)
+    buyer_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    delivery_address = db.Column(db.String(200), nullable=False)
+    total_price = db.Column(db.Float, nullable=False)
+    line_count = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, default=utcnow)
+
+    lines = db.relationship('Order', backref='header', lazy=True)
+
 class Order(db.Model):
     id = db.Column(db.Integer, primary_key=True)
+    header_id = db.Column(db.Integer, db.ForeignKey('order_header.id'), index=True)  # None for orders placed one by one
+    payment_id = db.Column(db.Integer, db.ForeignKey('payment.id'), index=True)  # None for orders not paid through /api/payment
     buyer_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False, index=True)
     quantity = db.Column(db.Integer, nullable=False)
     total_price = db.Column(db.Float, nullable=False)
     peeling_requested = db.Column(db.Boolean, default=False)
-    status = db.Column(db.String(20), default='pending')  # pending, confirmed, preparing, delivered
+    status = db.Column(db.String(20), default='pending', index=True)  # pending, confirmed, preparing, delivered
     delivery_address = db.Column(db.String(200), nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.now(UTC))
-    updated_at = db.Column(db.DateTime, default=datetime.now(UTC), onupdate=datetime.now(UTC))
+    created_at = db.Column(db.DateTime, default=utcnow, index=True)
+    updated_at = db.Column(db.DateTime, default=utcnow, onupdate=utcnow)
+
+    __table_args__ = (
+        # Commandes d'un acheteur, les plus récentes d'abord
+        db.Index('ix_order_buyer_id_created_at', 'buyer_id', 'created_at'),
+    )
 
 class Admin(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     email = db.Column(db.String(120), unique=True, nullable=False)
     password = db.Column(db.String(255), nullable=False)
     name = db.Column(db.String(100), nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.now(UTC))
+    created_at = db.Column(db.DateTime, default=utcnow)
 
 class PaymentMethod(Enum):
     CREDIT_CARD = "credit_card"
@@ -82,10 +121,68 @@ class PaymentStatus(Enum):
 
 class Payment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
     amount = db.Column(db.Float, nullable=False)
     payment_method = db.Column(db.String(20), nullable=False)
     payment_status = db.Column(db.String(20), default=PaymentStatus.PENDING.value)
     transaction_id = db.Column(db.String(100), unique=True)
-    created_at = db.Column(db.DateTime, default=datetime.now(UTC))
-    updated_at = db.Column(db.DateTime, default=datetime.now(UTC), onupdate=datetime.now(UTC))
\ No newline at end of file
+    failure_reason = db.Column(db.String(200))  # message du prestataire ou du panier, pour le client
+    created_at = db.Column(db.DateTime, default=utcnow)
+    updated_at = db.Column(db.DateTime, default=utcnow, onupdate=utcnow)
+
+class Revocation(db.Model):
+    """Revoked JWTs: one token (kind 'token', value = jti) or every token
+    of a user issued up to revoked_at (kind 'user', value = user id)"""
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(10), nullable=False)
+    value = db.Column(db.String(64), nullable=False)
+    revoked_at = db.Column(db.DateTime, nullable=False, default=utcnow, index=True)
+    # Au-delà, les jetons concernés ont expiré d'eux-mêmes et la ligne peut être supprimée
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+class IdempotencyKey(db.Model):
+    """Response of a request sent with an Idempotency-Key header, see idempotency.py"""
+    __tablename__ = 'idempotency_key'
+    user_id = db.Column(db.Integer, primary_key=True)
+    key = db.Column(db.String(255), primary_key=True)
+    fingerprint = db.Column(db.String(64), nullable=False)  # sha256 méthode + chemin + corps
+    status_code = db.Column(db.Integer)  # None tant que la première requête est en cours
+    body = db.Column(db.LargeBinary)
+    headers = db.Column(db.JSON)
+    locked_at = db.Column(db.DateTime, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+# Agrégats du tableau de bord admin, tenus à jour par rollups.py
+class StatCounter(db.Model):
+    name = db.Column(db.String(50), primary_key=True)  # 'users.farmer', 'orders.status.pending', ...
+    value = db.Column(db.Float, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=utcnow, onupdate=utcnow)
+
+class MonthlySales(db.Model):
+    month = db.Column(db.String(7), primary_key=True)  # YYYY-MM
+    orders = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=utcnow, onupdate=utcnow)
+
+class SellerSales(db.Model):
+    seller_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    orders = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0, index=True)
+    updated_at = db.Column(db.DateTime, default=utcnow, onupdate=utcnow)
+
+    seller = db.relationship('User')
+
+class DailySales(db.Model):
+    day = db.Column(db.Date, primary_key=True)
+    seller_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    product_id = db.Column(db.Integer, primary_key=True)  # pas de clé étrangère : l'historique survit au produit
+    status = db.Column(db.String(20), primary_key=True)
+    orders = db.Column(db.Integer, nullable=False, default=0)
+    quantity = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=utcnow, onupdate=utcnow)
+
+    __table_args__ = (
+        db.Index('ix_daily_sales_seller_day', 'seller_id', 'day'),
+        db.Index('ix_daily_sales_product_day', 'product_id', 'day'),
+    )
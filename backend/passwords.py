@@ -0,0 +1,71 @@
+"""Password hashing off the request threads
+
+scrypt / pbkdf2 take tens to hundreds of milliseconds of CPU. Hashing
+runs in a small thread pool (hashlib releases the GIL while it works),
+so a burst of logins uses at most PASSWORD_HASH_WORKERS cores and the
+other requests keep theirs. The pool refuses work beyond
+PASSWORD_HASH_QUEUE waiting hashes instead of letting the backlog grow.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from werkzeug.security import check_password_hash, generate_password_hash
+
+class HasherBusy(Exception):
+    """Too many hashes waiting (or too slow), the request should be retried later"""
+
+class PasswordHasher:
+    """Hash and check passwords in a bounded thread pool"""
+
+    def __init__(self, method='scrypt:32768:8:1', max_workers=2, max_queue=32, timeout=10):
+        self.method = method
+        # Préfixe tel que werkzeug l'écrit : 'scrypt' devient 'scrypt:32768:8:1', 'pbkdf2' 'pbkdf2:sha256:...'
+        self.prefix = generate_password_hash('', method).split('$', 1)[0]
+        self.timeout = timeout
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='password-hash')
+        # Places en cours de calcul + en attente
+        self._slots = threading.BoundedSemaphore(max_workers + max_queue)
+
+    def _run(self, function, *args):
+        if not self._slots.acquire(blocking=False):
+            raise HasherBusy()
+        try:
+            future = self._pool.submit(function, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            raise HasherBusy()
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, password_hash, password):
+        return self._run(check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        """Whether a stored hash was made with other parameters than the configured ones"""
+        return password_hash.split('$', 1)[0] != self.prefix
+
+    def verify_and_rehash(self, password_hash, password):
+        """Check a password against its stored hash
+
+        Returns (matched, new hash or None): when the stored hash was made
+        with other parameters, the password is hashed again with the
+        current ones and the caller stores the new hash.
+        """
+        if not self.verify(password_hash, password):
+            return False, None
+        if self.needs_rehash(password_hash):
+            return True, self.hash(password)
+        return True, None
+
+def create_password_hasher(config):
+    return PasswordHasher(
+        method=config['PASSWORD_HASH_METHOD'],
+        max_workers=config['PASSWORD_HASH_WORKERS'],
+        max_queue=config['PASSWORD_HASH_QUEUE'],
+        timeout=config['PASSWORD_HASH_TIMEOUT']
+    )
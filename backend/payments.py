@@ -0,0 +1,212 @@
+"""Payment providers and the pool settling payments in the background
+
+process_payment only validates the request and records a pending
+payment with its transaction id. The call to the gateway, which can
+take seconds, runs in the PaymentProcessor's thread pool. When the
+charge succeeds, the worker turns the cart into orders and marks the
+payment completed, or failed with the reason. Clients poll
+/api/payment/<id>/status. Cash on delivery involves no gateway and is
+settled in the request.
+
+The payment details (card number, PayPal token) are only passed to the
+worker, never stored.
+"""
+import logging
+import random
+import time
+import uuid
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from models import db, Payment, PaymentMethod, PaymentStatus, utcnow
+from checkout import CheckoutError, checkout_cart
+
+logger = logging.getLogger(__name__)
+
+ChargeResult = namedtuple('ChargeResult', 'success message')
+
+def new_transaction_id(prefix):
+    """Transaction id unique across workers and attempts"""
+    return f'{prefix}-{uuid.uuid4().hex}'
+
+class PaymentProvider:
+    """A payment gateway
+
+    validate() runs in the request and must be fast. charge() and
+    refund() run in the worker pool and may block on the network.
+    """
+    prefix = 'TX'
+    required_fields = ()
+    missing_message = 'Informations de paiement manquantes'
+
+    def validate(self, data):
+        """Error message for the user, or None when the request is complete"""
+        if not all(field in data for field in self.required_fields):
+            return self.missing_message
+        return None
+
+    def details(self, data):
+        """Part of the request sent to the gateway"""
+        return {field: data[field] for field in self.required_fields}
+
+    def charge(self, transaction_id, amount, details):
+        raise NotImplementedError
+
+    def refund(self, transaction_id, amount):
+        raise NotImplementedError
+
+class FakeProvider(PaymentProvider):
+    """Local stand-in for a gateway, for development and load tests
+
+    Each call takes latency seconds (+/- jitter) and fails with
+    probability failure_rate.
+    """
+
+    def __init__(self, prefix, required_fields, missing_message, latency=0.5, jitter=0.0, failure_rate=0.0):
+        self.prefix = prefix
+        self.required_fields = required_fields
+        self.missing_message = missing_message
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.charges = 0
+        self.refunds = 0
+
+    def _wait(self):
+        delay = self.latency + random.uniform(-self.jitter, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+    def charge(self, transaction_id, amount, details):
+        self._wait()
+        self.charges += 1
+        if random.random() < self.failure_rate:
+            return ChargeResult(False, 'Paiement refusé par le prestataire')
+        return ChargeResult(True, None)
+
+    def refund(self, transaction_id, amount):
+        self._wait()
+        self.refunds += 1
+
+def fake_providers(config):
+    options = {
+        'latency': config['PAYMENT_FAKE_LATENCY'],
+        'jitter': config['PAYMENT_FAKE_JITTER'],
+        'failure_rate': config['PAYMENT_FAKE_FAILURE_RATE'],
+    }
+    return {
+        PaymentMethod.CREDIT_CARD: FakeProvider(
+            'CC', ('card_number', 'expiry_month', 'expiry_year', 'cvv'),
+            'Informations de carte manquantes', **options
+        ),
+        PaymentMethod.PAYPAL: FakeProvider('PP', ('paypal_token',), 'Token PayPal manquant', **options),
+    }
+
+PAYMENT_PROVIDERS = {
+    'fake': fake_providers,
+}
+
+class PaymentProcessor:
+    """Thread pool charging the pending payments"""
+
+    def __init__(self, app, providers, max_workers=4, intent_timeout=120):
+        self.app = app
+        self.providers = providers
+        self.intent_timeout = intent_timeout
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='payment')
+        self.completed = 0
+        self.failed = 0
+
+    def provider(self, method):
+        return self.providers.get(method)
+
+    def submit(self, payment_id, delivery_address, details):
+        """Settle a committed pending payment in the background"""
+        self._pool.submit(self._settle, payment_id, delivery_address, details)
+
+    def _settle(self, payment_id, delivery_address, details):
+        try:
+            with self.app.app_context():
+                self.settle(payment_id, delivery_address, details)
+        except Exception:
+            logger.exception('Settling payment %s failed', payment_id)
+
+    def settle(self, payment_id, delivery_address, details):
+        payment = db.session.get(Payment, payment_id)
+        if payment is None or payment.payment_status != PaymentStatus.PENDING.value:
+            return
+        provider = self.providers[PaymentMethod(payment.payment_method)]
+        user_id, amount, transaction_id = payment.user_id, payment.amount, payment.transaction_id
+        # Pas de connexion tenue pendant l'appel au prestataire
+        db.session.close()
+
+        try:
+            result = provider.charge(transaction_id, amount, details)
+        except Exception:
+            logger.exception('Charge of payment %s failed', payment_id)
+            result = ChargeResult(False, 'Prestataire de paiement indisponible')
+        if not result.success:
+            self._finish(payment_id, PaymentStatus.FAILED, result.message)
+            return
+
+        # Débité : toute erreur à partir d'ici rembourse le client
+        try:
+            checkout_cart(user_id, delivery_address, 'pending', payment_id, amount)
+            if self._finish(payment_id, PaymentStatus.COMPLETED):
+                return
+            # Expiré entre-temps : pas de commande pour un paiement déclaré échoué
+            reason = None
+        except CheckoutError as e:
+            reason = e.message
+        except Exception:
+            logger.exception('Checkout of payment %s failed', payment_id)
+            reason = 'Erreur lors de la création de la commande'
+        db.session.rollback()
+        provider.refund(transaction_id, amount)
+        if reason is not None:
+            self._finish(payment_id, PaymentStatus.FAILED, reason)
+
+    def _finish(self, payment_id, status, reason=None):
+        """Store the outcome of a pending payment, with the orders if any
+
+        Returns False, without committing, when the payment was no longer
+        pending.
+        """
+        updated = db.session.execute(
+            db.update(Payment)
+            .where(Payment.id == payment_id, Payment.payment_status == PaymentStatus.PENDING.value)
+            .values(payment_status=status.value, failure_reason=reason, updated_at=utcnow())
+        ).rowcount
+        if not updated:
+            return False
+        db.session.commit()
+        if status == PaymentStatus.COMPLETED:
+            self.completed += 1
+        else:
+            self.failed += 1
+        return True
+
+    def expire(self, payment):
+        """Fail a payment left pending past intent_timeout (its worker is gone)"""
+        deadline = utcnow() - timedelta(seconds=self.intent_timeout)
+        if payment.payment_status != PaymentStatus.PENDING.value or payment.created_at > deadline.replace(tzinfo=None):
+            return False
+        return self._finish(payment.id, PaymentStatus.FAILED, 'Délai de paiement dépassé')
+
+    def stats(self):
+        return {
+            'completed': self.completed,
+            'failed': self.failed,
+            'queued': self._pool._work_queue.qsize(),
+            'providers': {method.value: type(provider).__name__ for method, provider in self.providers.items()}
+        }
+
+def create_payment_processor(app):
+    """Build the pool and the providers selected by PAYMENT_PROVIDER in the app config"""
+    config = app.config
+    return PaymentProcessor(
+        app,
+        PAYMENT_PROVIDERS[config['PAYMENT_PROVIDER']](config),
+        max_workers=config['PAYMENT_WORKERS'],
+        intent_timeout=config['PAYMENT_INTENT_TIMEOUT'],
+    )
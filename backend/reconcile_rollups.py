@@ -0,0 +1,28 @@
+"""Check the dashboard rollups against the base tables and rebuild them
+
+The rollups are recomputed from the user, order and product tables and
+compared to the stored values; every difference is printed. With
+--rebuild (or when differences are found and --check is not given) the
+stored rollups are replaced by the recomputed ones.
+
+    python reconcile_rollups.py            # vérifie et corrige
+    python reconcile_rollups.py --check    # vérifie seulement, code 1 si écart
+    python reconcile_rollups.py --rebuild  # reconstruit sans condition
+"""
+import sys
+from main import app
+from rollups import compute_rollups, diff_rollups, rebuild_rollups, stored_rollups
+
+if __name__ == '__main__':
+    check_only = '--check' in sys.argv
+    with app.app_context():
+        differences = diff_rollups(compute_rollups(), stored_rollups())
+        for difference in differences:
+            print(difference)
+        print(f'{len(differences)} écart(s) trouvé(s)')
+
+        if check_only:
+            sys.exit(1 if differences else 0)
+        if differences or '--rebuild' in sys.argv:
+            rebuild_rollups()
+            print('Agrégats reconstruits')
@@ -0,0 +1,111 @@
+"""Revoked JWTs, checked from memory
+
+The Revocation table holds the revoked tokens (logout) and the revoked
+users (deactivated accounts: every token issued up to revoked_at). Each
+worker keeps the unexpired rows in memory, so checking a token is a set
+lookup. The copy is refreshed with the rows revoked since the previous
+refresh, at most every REVOCATION_REFRESH_INTERVAL seconds, which bounds
+the time before a revocation made by another worker is seen.
+"""
+import threading
+import time
+from datetime import UTC, datetime, timedelta
+from models import db, Revocation, utcnow
+
+TOKEN = 'token'
+USER = 'user'
+
+# Relecture en recouvrement : une ligne peut être validée un peu après son revoked_at
+REFRESH_OVERLAP = timedelta(seconds=60)
+
+def _epoch(value):
+    # SQLite rend des datetimes naïfs, en UTC
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=UTC)
+    return value.timestamp()
+
+class RevocationList:
+    """In-memory copy of the unexpired revocations"""
+
+    def __init__(self, refresh_interval=2):
+        self.refresh_interval = refresh_interval
+        self._tokens = {}  # jti -> expiration (epoch)
+        self._users = {}  # user id -> (revoked_at, expiration) (epoch)
+        self._since = None
+        self._next_refresh = 0
+        self._lock = threading.Lock()
+        self.refreshes = 0
+
+    def is_revoked(self, jwt_payload):
+        """token_in_blocklist_loader check"""
+        self._maybe_refresh()
+        if jwt_payload.get('jti') in self._tokens:
+            return True
+        if jwt_payload.get('is_admin'):
+            return False  # les ids admin et user se recouvrent
+        user = self._users.get(jwt_payload['sub'])
+        return user is not None and jwt_payload['iat'] <= user[0]
+
+    def mark_stale(self):
+        """Refresh on the next check (after a revocation committed by this worker)"""
+        self._next_refresh = 0
+
+    def _maybe_refresh(self):
+        if time.monotonic() < self._next_refresh:
+            return
+        with self._lock:
+            if time.monotonic() < self._next_refresh:
+                return
+            self.refresh()
+            self._next_refresh = time.monotonic() + self.refresh_interval
+
+    def refresh(self):
+        started = utcnow()
+        query = db.session.query(Revocation.kind, Revocation.value, Revocation.revoked_at, Revocation.expires_at)\
+            .filter(Revocation.expires_at > started)
+        if self._since is not None:
+            query = query.filter(Revocation.revoked_at >= self._since - REFRESH_OVERLAP)
+        # Lu sur le primaire : une réplique en retard retarderait la révocation
+        with db.session().primary_reads():
+            rows = query.all()
+
+        now = started.timestamp()
+        tokens = {jti: expires for jti, expires in self._tokens.items() if expires > now}
+        users = {user: entry for user, entry in self._users.items() if entry[1] > now}
+        for kind, value, revoked_at, expires_at in rows:
+            if kind == TOKEN:
+                tokens[value] = _epoch(expires_at)
+            else:
+                entry = (_epoch(revoked_at), _epoch(expires_at))
+                users[value] = max(users.get(value, entry), entry)
+        self._tokens, self._users = tokens, users
+        self._since = started
+        self.refreshes += 1
+
+    def stats(self):
+        return {
+            'tokens': len(self._tokens),
+            'users': len(self._users),
+            'refreshes': self.refreshes,
+            'refresh_interval': self.refresh_interval
+        }
+
+revocation_list = RevocationList()
+
+def revoke_token(jwt_payload):
+    """Revoke one token (logout), effective once the session is committed"""
+    purge_expired()
+    db.session.add(Revocation(
+        kind=TOKEN,
+        value=jwt_payload['jti'],
+        expires_at=datetime.fromtimestamp(jwt_payload['exp'], UTC)
+    ))
+
+def revoke_user(user_id, token_lifetime):
+    """Revoke every token issued so far to a user, effective once the session is committed"""
+    purge_expired()
+    now = utcnow()
+    db.session.add(Revocation(kind=USER, value=str(user_id), revoked_at=now, expires_at=now + token_lifetime))
+
+def purge_expired():
+    db.session.execute(db.delete(Revocation).where(Revocation.expires_at <= utcnow()))
@@ -0,0 +1,323 @@
+"""Incrementally maintained aggregates of the admin dashboard
+
+The write paths call record_*() inside their own transaction, so the
+rollups commit or roll back together with the rows they describe. The
+dashboard then reads a handful of small rows instead of scanning the
+user, order and product tables, and the sales analytics read the daily
+buckets of DailySales.
+
+compute_rollups() recomputes everything from the base tables; it is
+used by reconcile_rollups.py to check and rebuild the stored values.
+"""
+from collections import defaultdict, namedtuple
+from datetime import date, timedelta
+from functools import lru_cache
+from models import db, User, Order, Product, StatCounter, MonthlySales, SellerSales, DailySales, utcnow
+
+TOP_SELLERS = 5
+BUCKETS = ('day', 'week', 'month')
+
+# Une commande telle que vue par les agrégats
+Sale = namedtuple('Sale', 'seller_id product_id status quantity total_price created_at')
+
+def month_key(moment):
+    return moment.strftime('%Y-%m')
+
+def _month_of(column):
+    if db.engine.dialect.name == 'postgresql':
+        return db.func.to_char(column, 'YYYY-MM')
+    return db.func.strftime('%Y-%m', column)
+
+def _insert(model):
+    if db.engine.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(model)
+
+@lru_cache(maxsize=None)
+def _upsert(dialect, model, keys, deltas):
+    """INSERT ... ON CONFLICT DO UPDATE adding the deltas to the row identified by keys
+
+    Built once per table: the statement only takes bound parameters, so
+    its compiled form is reused from the SQLAlchemy cache.
+    """
+    stmt = _insert(model)
+    return stmt.on_conflict_do_update(
+        index_elements=list(keys),
+        set_={
+            **{column: getattr(model, column) + stmt.excluded[column] for column in deltas},
+            'updated_at': stmt.excluded.updated_at
+        }
+    )
+
+def _increment(model, keys, deltas, rows):
+    """Add the deltas to the rows identified by keys, in a single executemany
+
+    rows maps the tuple of key values to the tuple of deltas.
+    """
+    if not rows:
+        return
+    now = utcnow()
+    db.session.execute(
+        _upsert(db.engine.dialect.name, model, keys, deltas),
+        [{**dict(zip(keys, key)), **dict(zip(deltas, values)), 'updated_at': now} for key, values in rows.items()]
+    )
+
+def increment_counters(amounts):
+    """Add amounts (counter name -> amount) to the counters"""
+    _increment(StatCounter, ('name',), ('value',), {(name,): (amount,) for name, amount in amounts.items()})
+
+def record_user(user_type):
+    increment_counters({'users.total': 1, f'users.{user_type}': 1})
+
+def _record_daily(sales, sign=1, status=None):
+    """Add (sign=1) or remove (sign=-1) sales from the daily buckets"""
+    by_key = defaultdict(lambda: [0, 0, 0.0])
+    for sale in sales:
+        if sale.seller_id is None:
+            continue  # produit supprimé depuis, absent des agrégats par vendeur
+        key = (sale.created_at.date(), sale.seller_id, sale.product_id, status or sale.status)
+        by_key[key][0] += sign
+        by_key[key][1] += sign * sale.quantity
+        by_key[key][2] += sign * sale.total_price
+    _increment(DailySales, ('day', 'seller_id', 'product_id', 'status'), ('orders', 'quantity', 'revenue'), by_key)
+
+def record_orders(sales):
+    """Account for new orders, given as Sale tuples"""
+    counters = defaultdict(int)
+    by_month = defaultdict(lambda: [0, 0.0])
+    by_seller = defaultdict(lambda: [0, 0.0])
+
+    # Un seul executemany par table d'agrégats, quel que soit le nombre de commandes
+    for sale in sales:
+        counters['orders.total'] += 1
+        counters['orders.revenue'] += sale.total_price
+        counters[f'orders.status.{sale.status}'] += 1
+        by_month[(month_key(sale.created_at),)][0] += 1
+        by_month[(month_key(sale.created_at),)][1] += sale.total_price
+        by_seller[(sale.seller_id,)][0] += 1
+        by_seller[(sale.seller_id,)][1] += sale.total_price
+
+    if not counters:
+        return
+
+    increment_counters(counters)
+    _increment(MonthlySales, ('month',), ('orders', 'revenue'), by_month)
+    _increment(SellerSales, ('seller_id',), ('orders', 'revenue'), by_seller)
+    _record_daily(sales)
+
+def record_status_change(sales, new_status):
+    """Move orders (Sale tuples with their old status) to new_status"""
+    counters = defaultdict(int)
+    for sale in sales:
+        counters[f'orders.status.{sale.status}'] -= 1
+        counters[f'orders.status.{new_status}'] += 1
+    increment_counters(counters)
+    if sales:
+        _record_daily(sales, -1)
+        _record_daily(sales, 1, new_status)
+
+def dashboard(now=None):
+    """Admin statistics, read from the rollups"""
+    now = now or utcnow()
+    counters = {row.name: row.value for row in StatCounter.query.all()}
+    month = db.session.get(MonthlySales, month_key(now))
+    top_sellers = db.session.query(User.name, SellerSales.orders, SellerSales.revenue)\
+        .join(User, User.id == SellerSales.seller_id)\
+        .order_by(SellerSales.revenue.desc())\
+        .limit(TOP_SELLERS)\
+        .all()
+
+    prefix = 'orders.status.'
+    return {
+        'users': {
+            'total': int(counters.get('users.total', 0)),
+            'farmers': int(counters.get('users.farmer', 0)),
+            'merchants': int(counters.get('users.merchant', 0)),
+            'customers': int(counters.get('users.customer', 0))
+        },
+        'sales': {
+            'total_orders': int(counters.get('orders.total', 0)),
+            'total_revenue': counters.get('orders.revenue', 0),
+            'orders_by_status': {
+                name[len(prefix):]: int(value)
+                for name, value in counters.items()
+                if name.startswith(prefix) and value
+            },
+            'monthly': {
+                'revenue': month.revenue if month else 0,
+                'orders': month.orders if month else 0
+            }
+        },
+        'top_sellers': [{
+            'name': seller.name,
+            'total_orders': seller.orders,
+            'total_sales': float(seller.revenue)
+        } for seller in top_sellers]
+    }
+
+def bucket_start(day, bucket):
+    if bucket == 'week':
+        return day - timedelta(days=day.weekday())
+    if bucket == 'month':
+        return day.replace(day=1)
+    return day
+
+def _next_bucket(start, bucket):
+    if bucket == 'week':
+        return start + timedelta(days=7)
+    if bucket == 'month':
+        return (start + timedelta(days=32)).replace(day=1)
+    return start + timedelta(days=1)
+
+# Période par défaut de chaque granularité, en jours
+DEFAULT_SPANS = {'day': 30, 'week': 12 * 7, 'month': 365}
+MAX_SPAN = 10 * 366
+
+def sales_series(start, end, bucket='day', seller_id=None, product_id=None, status=None):
+    """Orders, quantity and revenue per bucket between start and end (dates, inclusive)
+
+    Reads the daily buckets grouped by day, weeks (starting on Monday)
+    and months are summed from them. Empty buckets are returned with
+    zeros so the series can be charted as is.
+    """
+    query = db.session.query(
+        DailySales.day,
+        db.func.sum(DailySales.orders),
+        db.func.sum(DailySales.quantity),
+        db.func.sum(DailySales.revenue)
+    ).filter(DailySales.day >= start, DailySales.day <= end)
+    if seller_id is not None:
+        query = query.filter(DailySales.seller_id == seller_id)
+    if product_id is not None:
+        query = query.filter(DailySales.product_id == product_id)
+    if status is not None:
+        query = query.filter(DailySales.status == status)
+
+    totals = defaultdict(lambda: [0, 0, 0.0])
+    for day, orders, quantity, revenue in query.group_by(DailySales.day):
+        bucket_totals = totals[bucket_start(day, bucket)]
+        bucket_totals[0] += orders
+        bucket_totals[1] += quantity
+        bucket_totals[2] += revenue
+
+    series = []
+    current = bucket_start(start, bucket)
+    while current <= end:
+        orders, quantity, revenue = totals.get(current, (0, 0, 0.0))
+        series.append({
+            'period': current.isoformat(),
+            'orders': orders,
+            'quantity': quantity,
+            'revenue': round(revenue, 2)
+        })
+        current = _next_bucket(current, bucket)
+    return series
+
+def last_modified():
+    """Most recent change of the rollups, used as validator of the dashboard"""
+    return max(filter(None, [
+        db.session.query(db.func.max(StatCounter.updated_at)).scalar(),
+        db.session.query(db.func.max(MonthlySales.updated_at)).scalar(),
+        db.session.query(db.func.max(SellerSales.updated_at)).scalar(),
+        db.session.query(db.func.max(DailySales.updated_at)).scalar(),
+    ]), default=None)
+
+def compute_rollups():
+    """Rollups recomputed from scratch from the base tables
+
+    Returns (counters, months, sellers, days) as plain dicts.
+    """
+    counters = {'users.total': User.query.count()}
+    for user_type, count in db.session.query(User.user_type, db.func.count(User.id)).group_by(User.user_type):
+        counters[f'users.{user_type}'] = count
+
+    orders, revenue = db.session.query(db.func.count(Order.id), db.func.sum(Order.total_price)).one()
+    counters['orders.total'] = orders
+    counters['orders.revenue'] = revenue or 0
+    for status, count in db.session.query(Order.status, db.func.count(Order.id)).group_by(Order.status):
+        counters[f'orders.status.{status}'] = count
+
+    months = {}
+    month = _month_of(Order.created_at)
+    for key, count, amount in db.session.query(month, db.func.count(Order.id), db.func.sum(Order.total_price))\
+            .group_by(month):
+        months[key] = (count, amount or 0)
+
+    sellers = {}
+    for seller_id, count, amount in db.session.query(Product.seller_id, db.func.count(Order.id), db.func.sum(Order.total_price))\
+            .join(Product, Product.id == Order.product_id)\
+            .group_by(Product.seller_id):
+        sellers[seller_id] = (count, amount or 0)
+
+    days = {}
+    day = db.func.date(Order.created_at)
+    for key, seller_id, product_id, status, count, quantity, amount in db.session.query(
+        day, Product.seller_id, Order.product_id, Order.status,
+        db.func.count(Order.id), db.func.sum(Order.quantity), db.func.sum(Order.total_price)
+    ).join(Product, Product.id == Order.product_id)\
+     .group_by(day, Product.seller_id, Order.product_id, Order.status):
+        if key is None:
+            continue
+        if isinstance(key, str):
+            key = date.fromisoformat(key)
+        days[(key, seller_id, product_id, status)] = (count, quantity or 0, amount or 0)
+
+    return counters, months, sellers, days
+
+def stored_rollups():
+    counters = {row.name: row.value for row in StatCounter.query.all()}
+    months = {row.month: (row.orders, row.revenue) for row in MonthlySales.query.all()}
+    sellers = {row.seller_id: (row.orders, row.revenue) for row in SellerSales.query.all()}
+    days = {
+        (row.day, row.seller_id, row.product_id, row.status): (row.orders, row.quantity, row.revenue)
+        for row in DailySales.query.all()
+    }
+    return counters, months, sellers, days
+
+def _same(a, b):
+    if isinstance(a, tuple):
+        return all(_same(x, y) for x, y in zip(a, b))
+    return abs((a or 0) - (b or 0)) < 1e-6
+
+def diff_rollups(expected, stored):
+    """Differences between two (counters, months, sellers, days) tuples, as strings"""
+    differences = []
+    for label, wanted, actual in zip(('counter', 'month', 'seller', 'day'), expected, stored):
+        for key in sorted(set(wanted) | set(actual), key=str):
+            zero = {'counter': 0, 'day': (0, 0, 0)}.get(label, (0, 0))
+            if not _same(wanted.get(key, zero), actual.get(key, zero)):
+                differences.append(f'{label} {key}: attendu {wanted.get(key, zero)}, stocké {actual.get(key, zero)}')
+    return differences
+
+def rebuild_rollups():
+    """Replace the stored rollups by values recomputed from the base tables"""
+    counters, months, sellers, days = compute_rollups()
+    StatCounter.query.delete()
+    MonthlySales.query.delete()
+    SellerSales.query.delete()
+    DailySales.query.delete()
+    db.session.add_all([StatCounter(name=name, value=value) for name, value in counters.items()])
+    db.session.add_all([
+        MonthlySales(month=month, orders=count, revenue=amount)
+        for month, (count, amount) in months.items() if month
+    ])
+    db.session.add_all([
+        SellerSales(seller_id=seller_id, orders=count, revenue=amount)
+        for seller_id, (count, amount) in sellers.items()
+    ])
+    db.session.add_all([
+        DailySales(day=day, seller_id=seller_id, product_id=product_id, status=status,
+                   orders=count, quantity=quantity, revenue=amount)
+        for (day, seller_id, product_id, status), (count, quantity, amount) in days.items()
+    ])
+    db.session.commit()
+
+def ensure_rollups():
+    """Build the rollups the first time the application runs with them"""
+    if not db.session.query(StatCounter.name).first():
+        rebuild_rollups()
+    elif not db.session.query(DailySales.day).first() and db.session.query(Order.id).first():
+        # Buckets journaliers ajoutés après les autres agrégats
+        rebuild_rollups()
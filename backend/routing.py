@@ -0,0 +1,191 @@
+"""Read/write routing between the primary database and read replicas
+
+The replicas are the SQLALCHEMY_BINDS named replica_*. A session sends
+its SELECTs to a replica when it runs in a GET/HEAD request, or inside
+replica_reads(), and everything else to the primary:
+- INSERT/UPDATE/DELETE, flushes and raw SQL always go to the primary.
+- Once a session has written, the rest of it stays on the primary.
+- primary_reads() keeps a block on the primary; results that are cached
+  must not be built from a lagging replica.
+- A client that committed a write in the last READ_YOUR_WRITES_SECONDS
+  keeps reading from the primary, so it sees its own changes despite
+  the replication lag. The time of the write travels with the client:
+  the response of a write sets the last_write cookie and the
+  X-Last-Write header, and the next requests send one of them back.
+  Every worker can tell without shared state, and clients behind the
+  same proxy are not mixed up.
+
+ReplicaSync copies a SQLite primary to SQLite replica files with the
+backup API. It is a local stand-in for real replication.
+"""
+import logging
+import random
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from flask import g, has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.sql.dml import UpdateBase
+from sqlalchemy.sql.selectable import Select
+
+logger = logging.getLogger(__name__)
+
+REPLICA_PREFIX = 'replica_'
+SAFE_METHODS = ('GET', 'HEAD')
+
+def replica_binds(urls):
+    """SQLALCHEMY_BINDS entries for a comma separated list of replica URLs"""
+    return {
+        f'{REPLICA_PREFIX}{number}': url.strip()
+        for number, url in enumerate(url for url in urls.split(',') if url.strip())
+    }
+
+WRITE_COOKIE = 'last_write'
+WRITE_HEADER = 'X-Last-Write'
+
+class RecentWriters:
+    """Read-your-writes marker carried by the client
+
+    record() notes a committed write of the current request, mark()
+    puts its time on the response. wrote_recently() reads it back from
+    the header (API clients) or the cookie (browsers on the same origin).
+    """
+
+    def __init__(self, window=10):
+        self.window = window
+
+    def record(self):
+        if has_request_context():
+            g.last_write = time.time()
+
+    def wrote_recently(self):
+        if not has_request_context():
+            return False
+        try:
+            wrote_at = float(request.headers.get(WRITE_HEADER) or request.cookies.get(WRITE_COOKIE))
+        except (TypeError, ValueError):
+            return False
+        # Tolère le décalage d'horloge entre serveurs dans les deux sens
+        return abs(time.time() - wrote_at) < self.window
+
+    def mark(self, response):
+        """after_request hook putting the time of the request's write on the response"""
+        wrote_at = g.pop('last_write', None)
+        if wrote_at is not None:
+            value = f'{wrote_at:.3f}'
+            response.headers[WRITE_HEADER] = value
+            response.set_cookie(WRITE_COOKIE, value, max_age=self.window, httponly=True, samesite='Lax')
+        return response
+
+recent_writers = RecentWriters()
+
+class RoutingSession(Session):
+    """Session sending the reads to a replica when it is safe to"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self._read_from_replica(clause):
+            return self._replica()
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _replica_keys(self):
+        return [key for key in self._db.engines if key and key.startswith(REPLICA_PREFIX)]
+
+    def _read_from_replica(self, clause):
+        if isinstance(clause, UpdateBase):
+            self.info['wrote'] = True
+            return False
+        if not isinstance(clause, Select) or self.info.get('wrote') or not self._replica_keys():
+            return False
+        if self.info.get('reads') is not None:
+            return self.info['reads'] == 'replica'
+        if not has_request_context() or request.method not in SAFE_METHODS:
+            return False
+        if 'recent_writer' not in self.info:
+            self.info['recent_writer'] = recent_writers.wrote_recently()
+        return not self.info['recent_writer']
+
+    def _replica(self):
+        # Une seule réplique par session, pour des lectures cohérentes entre elles
+        if 'replica' not in self.info:
+            self.info['replica'] = random.choice(self._replica_keys())
+        return self._db.engines[self.info['replica']]
+
+    @contextmanager
+    def _reads_from(self, target):
+        previous = self.info.get('reads')
+        self.info['reads'] = target
+        try:
+            yield self
+        finally:
+            self.info['reads'] = previous
+
+    def replica_reads(self):
+        """Send the reads of the block to a replica, outside of GET requests too (reports, scripts)"""
+        return self._reads_from('replica')
+
+    def primary_reads(self):
+        """Keep the reads of the block on the primary (e.g. results kept in a cache)"""
+        return self._reads_from('primary')
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _mark_written(session, flush_context):
+    session.info['wrote'] = True
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _record_write(session):
+    if session.info.pop('wrote', False):
+        # La suite de la session doit lire ce qu'elle vient d'écrire
+        session.info['recent_writer'] = True
+        recent_writers.record()
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def _forget_write(session):
+    session.info.pop('wrote', None)
+
+class ReplicaSync:
+    """Background thread copying a SQLite primary to SQLite replicas
+
+    Each copy uses the online backup API, so it is a consistent snapshot
+    taken without stopping the writers.
+    """
+
+    def __init__(self, primary_path, replica_paths, interval=5):
+        self.primary_path = primary_path
+        self.replica_paths = replica_paths
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+        self.syncs = 0
+        self.last_sync_at = None
+
+    def sync(self):
+        source = sqlite3.connect(self.primary_path)
+        try:
+            for path in self.replica_paths:
+                target = sqlite3.connect(path)
+                try:
+                    source.backup(target)
+                finally:
+                    target.close()
+        finally:
+            source.close()
+        self.syncs += 1
+        self.last_sync_at = time.time()
+
+    def start(self):
+        self.sync()  # les répliques ne doivent pas servir une base vide
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='replica-sync', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.sync()
+            except Exception:
+                logger.exception('Replica sync failed')
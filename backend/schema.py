@@ -0,0 +1,200 @@
+"""Versioned schema migrations
+
+Each migration has a version number and runs once, in its own
+transaction, in version order. The applied versions are recorded in
+the schema_migration table, so an existing database (like the committed
+legumes.db) is upgraded in place at startup, and a new one gets every
+table from create_all() and is simply stamped.
+
+To change the schema: update models.py, then append a migration that
+brings existing databases to the same state with add_column() /
+create_index(). Both are no-ops when the column or index already exists.
+"""
+import logging
+from bisect import bisect_left, bisect_right
+from datetime import timedelta
+from sqlalchemy import bindparam, inspect, text
+from models import db, Order, Payment, utcnow
+
+logger = logging.getLogger(__name__)
+
+schema_migration = db.Table(
+    'schema_migration',
+    db.Column('version', db.Integer, primary_key=True),
+    db.Column('description', db.String(200), nullable=False),
+    db.Column('applied_at', db.DateTime, nullable=False)
+)
+
+MIGRATIONS = []
+# Ajout de Order.payment_id, les commandes antérieures peuvent rester sans paiement
+ORDER_PAYMENT_MIGRATION = 5
+
+def migration(version, description):
+    def decorator(function):
+        MIGRATIONS.append((version, description, function))
+        MIGRATIONS.sort(key=lambda item: item[0])
+        return function
+    return decorator
+
+def add_column(conn, table_name, column_name):
+    """Add a column declared in models.py to an existing table"""
+    if column_name in {column['name'] for column in inspect(conn).get_columns(table_name)}:
+        return
+
+    column = db.metadata.tables[table_name].columns[column_name]
+    ddl = f'ALTER TABLE "{table_name}" ADD COLUMN "{column.name}" {column.type.compile(dialect=conn.dialect)}'
+    if column.server_default is not None:
+        default = column.server_default.arg
+        if not isinstance(default, str):
+            default = default.compile(dialect=conn.dialect)
+        ddl += f' DEFAULT {default}'
+    for foreign_key in column.foreign_keys:
+        ddl += f' REFERENCES "{foreign_key.column.table.name}" ("{foreign_key.column.name}")'
+    conn.execute(text(ddl))
+
+def create_index(conn, table_name, index_name):
+    """Create an index declared in models.py"""
+    for index in db.metadata.tables[table_name].indexes:
+        if index.name == index_name:
+            index.create(conn, checkfirst=True)
+            return
+    raise KeyError(f'Index {index_name} not declared on {table_name}')
+
+def analyze(conn):
+    # Statistiques du planificateur, pour qu'il choisisse les nouveaux index
+    if conn.dialect.name in ('sqlite', 'postgresql'):
+        conn.execute(text('ANALYZE'))
+
+@migration(1, 'Columns added before versioned migrations')
+def add_early_columns(conn):
+    add_column(conn, 'product', 'image_hash')
+    add_column(conn, 'cart', 'expires_at')
+    add_column(conn, 'order', 'header_id')
+    create_index(conn, 'cart', 'ix_cart_expires_at')
+    create_index(conn, 'order', 'ix_order_header_id')
+
+@migration(2, 'Indexes of the hot queries')
+def add_hot_query_indexes(conn):
+    create_index(conn, 'order', 'ix_order_buyer_id_created_at')
+    create_index(conn, 'order', 'ix_order_product_id')
+    create_index(conn, 'order', 'ix_order_status')
+    create_index(conn, 'order', 'ix_order_created_at')
+    create_index(conn, 'order_header', 'ix_order_header_buyer_id')
+    create_index(conn, 'product', 'ix_product_seller_id')
+    create_index(conn, 'product', 'ix_product_image_hash')
+    create_index(conn, 'product', 'ix_product_validated_by_admin')
+    create_index(conn, 'product', 'ix_product_validated_created_at')
+    create_index(conn, 'product', 'ix_product_validated_price')
+    create_index(conn, 'cart', 'ix_cart_user_id_product_id')
+    create_index(conn, 'cart', 'ix_cart_product_id')
+    create_index(conn, 'payment', 'ix_payment_user_id')
+    analyze(conn)
+
+@migration(3, 'Account status of the users')
+def add_user_active(conn):
+    add_column(conn, 'user', 'active')
+
+@migration(4, 'Failure reason of the payments')
+def add_payment_failure_reason(conn):
+    add_column(conn, 'payment', 'failure_reason')
+
+@migration(ORDER_PAYMENT_MIGRATION, 'Payment of the orders')
+def add_order_payment_id(conn):
+    add_column(conn, 'order', 'payment_id')
+    create_index(conn, 'order', 'ix_order_payment_id')
+    backfill_order_payments(conn)
+
+@migration(6, 'Seller references of the products')
+def add_product_sku(conn):
+    add_column(conn, 'product', 'sku')
+    create_index(conn, 'product', 'ix_product_seller_id_sku')
+
+# Écart max entre une commande et le paiement créé dans la même requête
+PAYMENT_MATCH_WINDOW = timedelta(seconds=5)
+
+def backfill_order_payments(conn):
+    """Link the existing orders to their payment by timestamps
+
+    process_payment created the orders and the payment in one request, a
+    few milliseconds apart: each order goes to its buyer's payment with
+    the closest created_at, within PAYMENT_MATCH_WINDOW. Orders placed
+    without a payment have none that close and keep a NULL payment_id.
+
+    When several payments are equally close the order keeps a NULL
+    payment_id too. The first versions of models.py evaluated the
+    created_at default once, at import: all the rows written by one
+    process have the same timestamp and cannot be told apart.
+    """
+    payments = {}
+    rows = conn.execute(
+        db.select(Payment.user_id, Payment.created_at, Payment.id)
+        .where(Payment.created_at.isnot(None))
+        .order_by(Payment.created_at)
+    )
+    for user_id, created_at, payment_id in rows:
+        times, ids = payments.setdefault(user_id, ([], []))
+        times.append(created_at)
+        ids.append(payment_id)
+
+    links = []
+    ambiguous = 0
+    orders = conn.execute(
+        db.select(Order.id, Order.buyer_id, Order.created_at)
+        .where(Order.payment_id.is_(None), Order.created_at.isnot(None))
+    )
+    for order_id, buyer_id, created_at in orders:
+        if buyer_id not in payments:
+            continue
+        times, ids = payments[buyer_id]
+        position = bisect_left(times, created_at)
+        nearest = min(
+            (i for i in (position - 1, position) if 0 <= i < len(times)),
+            key=lambda i: abs(times[i] - created_at)
+        )
+        distance = abs(times[nearest] - created_at)
+        if distance > PAYMENT_MATCH_WINDOW:
+            continue
+        # Paiements à la même distance, avant ou après la commande
+        ties = sum(
+            bisect_right(times, moment) - bisect_left(times, moment)
+            for moment in {created_at - distance, created_at + distance}
+        )
+        if ties > 1:
+            ambiguous += 1
+            continue
+        links.append({'order': order_id, 'payment': ids[nearest]})
+
+    if links:
+        conn.execute(
+            db.update(Order.__table__)
+            .where(Order.__table__.c.id == bindparam('order'))
+            .values(payment_id=bindparam('payment')),
+            links
+        )
+    logger.info('Linked %s orders to their payment, %s left unlinked as ambiguous', len(links), ambiguous)
+
+def applied_at(version):
+    """When a migration was applied, None if it was not (or the database was created with it)"""
+    return db.session.execute(
+        db.select(schema_migration.c.applied_at).where(schema_migration.c.version == version)
+    ).scalar()
+
+def applied_versions():
+    with db.engine.connect() as conn:
+        return set(conn.execute(db.select(schema_migration.c.version)).scalars())
+
+def pending_migrations():
+    applied = applied_versions()
+    return [item for item in MIGRATIONS if item[0] not in applied]
+
+def upgrade_schema():
+    """Create the missing tables and apply the pending migrations"""
+    db.create_all()
+
+    for version, description, function in pending_migrations():
+        with db.engine.begin() as conn:
+            function(conn)
+            conn.execute(schema_migration.insert().values(
+                version=version, description=description, applied_at=utcnow()
+            ))
+        logger.info('Applied schema migration %s: %s', version, description)
@@ -0,0 +1,135 @@
+import re
+from sqlalchemy import text
+from models import db, Product
+from catalog import decode_cursor, encode_cursor
+
+# Index FTS5 adossé à la table product (contenu externe, pas de texte dupliqué).
+# remove_diacritics : "legumes" trouve "légumes" ; prefix : requêtes par préfixe rapides.
+SEARCH_SCHEMA = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS product_search USING fts5(
+        name, description,
+        content='product', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='2 3'
+    )""",
+    # Triggers : l'index suit les créations, modifications et suppressions de produits
+    """CREATE TRIGGER IF NOT EXISTS product_search_insert AFTER INSERT ON product BEGIN
+        INSERT INTO product_search(rowid, name, description) VALUES (new.id, new.name, new.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS product_search_delete AFTER DELETE ON product BEGIN
+        INSERT INTO product_search(product_search, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS product_search_update AFTER UPDATE OF name, description ON product BEGIN
+        INSERT INTO product_search(product_search, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+        INSERT INTO product_search(rowid, name, description) VALUES (new.id, new.name, new.description);
+    END""",
+]
+
+# Poids bm25 des colonnes : le nom compte plus que la description
+NAME_WEIGHT = 10.0
+DESCRIPTION_WEIGHT = 1.0
+
+search_table = db.table('product_search', db.column('rowid'))
+
+def has_fts():
+    # FTS5 n'existe que sous SQLite, les autres bases passent par search_without_fts()
+    return db.engine.dialect.name == 'sqlite'
+
+def ensure_search_index():
+    """Create the FTS5 index and its triggers, and fill it the first time"""
+    if not has_fts():
+        return
+    with db.engine.begin() as conn:
+        exists = conn.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'product_search'"
+        )).first()
+        for statement in SEARCH_SCHEMA:
+            conn.execute(text(statement))
+        if not exists:
+            conn.execute(text("INSERT INTO product_search(product_search) VALUES ('rebuild')"))
+
+def rebuild_search_index():
+    if not has_fts():
+        return
+    with db.engine.begin() as conn:
+        conn.execute(text("INSERT INTO product_search(product_search) VALUES ('rebuild')"))
+
+def match_expression(query):
+    """FTS5 query where every word is a prefix, all words required
+
+    Words are quoted, so user input can never inject FTS5 operators.
+    """
+    words = re.findall(r'\w+', query)
+    return ' '.join(f'"{word}"*' for word in words)
+
+def search_without_fts(products, query):
+    """Filter and score of the search on databases without FTS5
+
+    Every word must appear in the name or the description (ILIKE, accents
+    are not folded); a word found in the name weighs like in bm25. Lower
+    scores rank first, as with bm25.
+    """
+    score = db.literal(0.0)
+    for word in re.findall(r'\w+', query):
+        pattern = '%' + word.replace('_', '\\_') + '%'
+        products = products.filter(db.or_(
+            Product.name.ilike(pattern, escape='\\'),
+            Product.description.ilike(pattern, escape='\\')
+        ))
+        score = score - db.case(
+            (Product.name.ilike(pattern, escape='\\'), NAME_WEIGHT),
+            else_=DESCRIPTION_WEIGHT
+        )
+    return products, score
+
+def search_products(query, fields_columns, filters, cursor, limit):
+    """Validated products matching query and filters, best match first
+
+    Keyset pagination on (score, id). Returns the products of the page
+    and the cursor of the next one (None on the last page).
+    """
+    products = Product.query.filter_by(validated_by_admin=True)\
+        .options(db.load_only(*fields_columns))
+
+    match = match_expression(query or '')
+    if match and not has_fts():
+        products, score = search_without_fts(products, query)
+    elif match:
+        ranked = db.select(
+            search_table.c.rowid.label('product_id'),
+            db.func.bm25(db.literal_column('product_search'), NAME_WEIGHT, DESCRIPTION_WEIGHT).label('score')
+        ).where(db.literal_column('product_search').op('MATCH')(match)).subquery()
+        score = ranked.c.score
+        products = products.join(ranked, ranked.c.product_id == Product.id)
+    else:
+        score = db.literal(0.0)
+
+    if filters.get('min_price') is not None:
+        products = products.filter(Product.price >= filters['min_price'])
+    if filters.get('max_price') is not None:
+        products = products.filter(Product.price <= filters['max_price'])
+    if filters.get('unit'):
+        products = products.filter(Product.unit == filters['unit'])
+    if filters.get('peeling_available') is not None:
+        products = products.filter(Product.peeling_available == filters['peeling_available'])
+    if filters.get('in_stock'):
+        products = products.filter(Product.quantity > 0)
+
+    if cursor:
+        after = db.tuple_(*decode_cursor(cursor, score))
+        products = products.filter(db.tuple_(score, Product.id) > after)
+
+    rows = products.add_columns(score.label('score'))\
+        .order_by(score, Product.id)\
+        .limit(limit + 1)\
+        .all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last_product, last_score = rows[-1]
+        next_cursor = encode_cursor(last_score, last_product.id)
+
+    return [product for product, _ in rows], next_cursor
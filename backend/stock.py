@@ -0,0 +1,38 @@
+"""Stock reservations
+
+Every change of Product.quantity made by buyers goes through here. The
+check and the decrement are a single conditional UPDATE, so concurrent
+buyers can never both take the last units: the database serializes the
+writes and the second one simply matches no row.
+
+The statements run in the caller's transaction, which commits or rolls
+back together with the cart / order rows.
+"""
+from models import db, Product
+
+def reserve(product_id, quantity):
+    """Take quantity units of a product, True if there was enough stock"""
+    result = db.session.execute(
+        db.update(Product)
+        .where(Product.id == product_id, Product.quantity >= quantity)
+        .values(quantity=Product.quantity - quantity)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
+
+def release(product_id, quantity):
+    """Give quantity units back to a product"""
+    db.session.execute(
+        db.update(Product)
+        .where(Product.id == product_id)
+        .values(quantity=Product.quantity + quantity)
+        .execution_options(synchronize_session=False)
+    )
+
+def adjust(product_id, quantity_diff):
+    """Reserve (diff > 0) or release (diff < 0) stock, True on success"""
+    if quantity_diff > 0:
+        return reserve(product_id, quantity_diff)
+    if quantity_diff < 0:
+        release(product_id, -quantity_diff)
+    return True
@@ -0,0 +1,35 @@
+"""Streamed NDJSON responses for the large listings
+
+A client opts in with Accept: application/x-ndjson or ?stream=1. The
+query is then iterated with yield_per (a server-side cursor where the
+database has one), and each row is written as one JSON line as soon as
+it is serialized, instead of building the whole list and its JSON in
+memory. Streamed listings are not paginated.
+"""
+from flask import Response, current_app, request, stream_with_context
+
+NDJSON = 'application/x-ndjson'
+# Lignes lues par aller-retour avec la base, et écrites par morceau de réponse
+STREAM_BATCH_SIZE = 500
+
+def wants_ndjson():
+    """Whether the client asked for a streamed NDJSON listing"""
+    if request.args.get('stream') in ('1', 'true'):
+        return True
+    return request.accept_mimetypes.best_match(['application/json', NDJSON]) == NDJSON
+
+def ndjson_response(query, serialize):
+    """Stream the rows of query, one serialize(row) JSON object per line"""
+    def generate():
+        dumps = current_app.json.dumps
+        lines = []
+        for number, row in enumerate(query.yield_per(STREAM_BATCH_SIZE), 1):
+            lines.append(dumps(serialize(row)))
+            # Première ligne envoyée tout de suite, puis par paquets
+            if number == 1 or len(lines) >= STREAM_BATCH_SIZE:
+                yield '\n'.join(lines) + '\n'
+                lines = []
+        if lines:
+            yield '\n'.join(lines) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype=NDJSON)
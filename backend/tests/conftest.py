@@ -0,0 +1,79 @@
+"""Fixtures of the backend tests
+
+The app is imported once, on a SQLite database of a temporary directory
+(main creates the schema at import). Each test makes its own users and
+products, so the tests do not depend on each other's rows.
+"""
+import itertools
+import os
+import sys
+import tempfile
+import pytest
+
+TMP_DIR = tempfile.mkdtemp(prefix='eswika-tests-')
+os.environ.update({
+    'DATABASE_URL': 'sqlite:///' + os.path.join(TMP_DIR, 'test.db'),
+    'IMAGE_STORE_PATH': os.path.join(TMP_DIR, 'images'),
+    'CATALOG_CACHE_VERSION_FILE': os.path.join(TMP_DIR, 'catalog_version'),
+    'CART_SWEEPER_ENABLED': 'false',
+})
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask_jwt_extended import create_access_token
+import main
+import rollups
+from auth import admin_claims, user_claims
+from models import db, Admin, User, Product
+
+_numbers = itertools.count(1)
+
+@pytest.fixture(scope='session')
+def app():
+    return main.app
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+@pytest.fixture
+def make_user(app):
+    """make_user(user_type) -> (user id, Authorization headers)"""
+    def make(user_type='customer'):
+        number = next(_numbers)
+        with app.app_context():
+            user = User(
+                email=f'{user_type}{number}@test.local', password='x', user_type=user_type,
+                name=f'{user_type} {number}', address=f'{number} rue des Tests'
+            )
+            db.session.add(user)
+            rollups.record_user(user_type)
+            db.session.commit()
+            token = create_access_token(identity=str(user.id), additional_claims=user_claims(user))
+            return user.id, {'Authorization': f'Bearer {token}'}
+    return make
+
+@pytest.fixture
+def admin_headers(app):
+    """Authorization headers of a new administrator"""
+    with app.app_context():
+        admin = Admin(email=f'admin{next(_numbers)}@test.local', password='x', name='Admin')
+        db.session.add(admin)
+        db.session.commit()
+        token = create_access_token(identity=str(admin.id), additional_claims=admin_claims())
+    return {'Authorization': f'Bearer {token}'}
+
+@pytest.fixture
+def make_product(app):
+    """make_product(seller_id, **columns) -> product id"""
+    def make(seller_id, **columns):
+        number = next(_numbers)
+        values = {
+            'name': f'Produit {number}', 'description': 'Test', 'price': 2.5,
+            'quantity': 100, 'unit': 'kg', 'validated_by_admin': True, **columns
+        }
+        with app.app_context():
+            product = Product(seller_id=seller_id, **values)
+            db.session.add(product)
+            db.session.commit()
+            return product.id
+    return make
@@ -0,0 +1,28 @@
+"""Conditional requests of the sales analytics"""
+from datetime import datetime, timedelta
+import main
+
+class Tomorrow(datetime):
+    @classmethod
+    def now(cls, tz=None):
+        return datetime.now(tz) + timedelta(days=1)
+
+def test_series_ending_today_changes_with_the_day(client, admin_headers, monkeypatch):
+    response = client.get('/api/admin/analytics/sales', headers=admin_headers)
+    assert response.status_code == 200
+    etag, last_modified = response.headers['ETag'], response.headers['Last-Modified']
+    assert client.get('/api/admin/analytics/sales', headers={**admin_headers, 'If-None-Match': etag}).status_code == 304
+
+    monkeypatch.setattr(main, 'datetime', Tomorrow)
+    response = client.get('/api/admin/analytics/sales', headers={**admin_headers, 'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.get_json()['to'] == Tomorrow.now(main.UTC).date().isoformat()
+    response = client.get('/api/admin/analytics/sales', headers={**admin_headers, 'If-Modified-Since': last_modified})
+    assert response.status_code == 200
+
+def test_series_with_an_end_date_keeps_its_validators(client, admin_headers, monkeypatch):
+    path = '/api/admin/analytics/sales?from=2025-01-01&to=2025-01-31'
+    etag = client.get(path, headers=admin_headers).headers['ETag']
+
+    monkeypatch.setattr(main, 'datetime', Tomorrow)
+    assert client.get(path, headers={**admin_headers, 'If-None-Match': etag}).status_code == 304
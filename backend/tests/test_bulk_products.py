@@ -0,0 +1,18 @@
+"""Rows of the bulk product import"""
+import pytest
+from bulk_products import IMPORT_FIELDS, RowError, clean_row
+
+def test_clean_row_converts_the_columns():
+    row = {'sku': 'TOM-1', 'name': ' Tomates ', 'price': '2.5', 'quantity': '10', 'unit': 'kg', 'peeling_available': 'oui'}
+    assert clean_row(row, IMPORT_FIELDS) == {
+        'sku': 'TOM-1', 'name': 'Tomates', 'price': 2.5, 'quantity': 10, 'unit': 'kg', 'peeling_available': True
+    }
+
+@pytest.mark.parametrize('image_url', ['https://cdn.example.com/tomates.jpg', '/static/images/tomates.jpg'])
+def test_clean_row_keeps_absolute_image_urls(image_url):
+    assert clean_row({'image_url': image_url}, IMPORT_FIELDS) == {'image_url': image_url}
+
+@pytest.mark.parametrize('image_url', ['javascript:alert(1)', 'data:image/png;base64,AAAA', 'tomates.jpg'])
+def test_clean_row_refuses_other_image_urls(image_url):
+    with pytest.raises(RowError):
+        clean_row({'image_url': image_url}, IMPORT_FIELDS)
@@ -0,0 +1,32 @@
+"""Checkout of a cart into one order header and its lines"""
+import rollups
+from models import db, Cart, Order
+
+def test_checkout_creates_the_lines_and_keeps_the_rollups_exact(app, client, make_user, make_product):
+    seller_id, _ = make_user('farmer')
+    buyer_id, headers = make_user('customer')
+    product_ids = [make_product(seller_id, price=3.0) for _ in range(3)]
+    for quantity, product_id in enumerate(product_ids, 1):
+        response = client.post('/api/cart/add', headers=headers, json={'product_id': product_id, 'quantity': quantity})
+        assert response.status_code == 201
+
+    response = client.post('/api/cart/checkout', headers=headers, json={'delivery_address': '1 rue du Marché'})
+    assert response.status_code == 201
+    body = response.get_json()
+
+    with app.app_context():
+        orders = Order.query.filter(Order.id.in_(body['order_ids'])).order_by(Order.id).all()
+        assert [order.product_id for order in orders] == product_ids
+        assert [order.quantity for order in orders] == [1, 2, 3]
+        assert {order.header_id for order in orders} == {body['order_id']}
+        assert Cart.query.filter_by(user_id=buyer_id).count() == 0
+        assert rollups.diff_rollups(rollups.compute_rollups(), rollups.stored_rollups()) == []
+
+        rollups.record_status_change([
+            rollups.Sale(seller_id, order.product_id, order.status, order.quantity, order.total_price, order.created_at)
+            for order in orders
+        ], 'delivered')
+        for order in orders:
+            order.status = 'delivered'
+        db.session.commit()
+        assert rollups.diff_rollups(rollups.compute_rollups(), rollups.stored_rollups()) == []
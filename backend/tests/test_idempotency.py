@@ -0,0 +1,60 @@
+"""Idempotency-Key on /api/cart/add"""
+import threading
+from models import db, Cart, Product
+
+def cart_add(client, headers, key, product_id, quantity):
+    return client.post('/api/cart/add', headers={**headers, 'Idempotency-Key': key},
+                       json={'product_id': product_id, 'quantity': quantity})
+
+def stock_and_cart(app, user_id, product_id):
+    with app.app_context():
+        cart = db.session.query(db.func.sum(Cart.quantity)).filter_by(user_id=user_id, product_id=product_id).scalar()
+        return db.session.get(Product, product_id).quantity, cart
+
+def test_retry_is_replayed_without_running_again(app, client, make_user, make_product):
+    seller_id, _ = make_user('farmer')
+    user_id, headers = make_user('customer')
+    product_id = make_product(seller_id, quantity=10)
+
+    first = cart_add(client, headers, 'retry-1', product_id, 3)
+    retry = cart_add(client, headers, 'retry-1', product_id, 3)
+
+    assert first.status_code == retry.status_code == 201
+    assert 'Idempotent-Replayed' not in first.headers
+    assert retry.headers['Idempotent-Replayed'] == 'true'
+    assert retry.get_json() == first.get_json()
+    assert stock_and_cart(app, user_id, product_id) == (7, 3)
+
+def test_key_reused_for_another_request_is_rejected(app, client, make_user, make_product):
+    seller_id, _ = make_user('farmer')
+    user_id, headers = make_user('customer')
+    product_id = make_product(seller_id, quantity=10)
+
+    assert cart_add(client, headers, 'reused-1', product_id, 3).status_code == 201
+    response = cart_add(client, headers, 'reused-1', product_id, 4)
+
+    assert response.status_code == 422
+    assert stock_and_cart(app, user_id, product_id) == (7, 3)
+
+def test_concurrent_duplicates_reserve_the_stock_once(app, make_user, make_product):
+    seller_id, _ = make_user('farmer')
+    user_id, headers = make_user('customer')
+    product_id = make_product(seller_id, quantity=10)
+    threads = 8
+    start = threading.Barrier(threads)
+    responses = []
+
+    def send():
+        client = app.test_client()
+        start.wait()
+        responses.append(cart_add(client, headers, 'double-click', product_id, 2))
+
+    workers = [threading.Thread(target=send) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    assert [response.status_code for response in responses] == [201] * threads
+    assert sum(response.headers.get('Idempotent-Replayed') == 'true' for response in responses) == threads - 1
+    assert stock_and_cart(app, user_id, product_id) == (8, 2)
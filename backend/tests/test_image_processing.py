@@ -0,0 +1,24 @@
+"""Compression and derivatives of the uploaded images"""
+from io import BytesIO
+from PIL import Image
+from image_processing import IMAGE_SIZES, process_upload
+
+def photo(width=3000, height=2000):
+    """Noisy photo, the worst case for the JPEG size"""
+    output = BytesIO()
+    Image.effect_noise((width, height), 60).convert('RGB').save(output, format='JPEG', quality=95)
+    return output.getvalue()
+
+def test_full_derivatives_are_not_larger_than_the_compressed_image():
+    compressed, derivatives = process_upload(photo(), max_size_kb=500)
+    # Le JPEG pleine taille est l'image compressée, pas un second encodage
+    assert derivatives[('full', 'jpeg')] == compressed
+    assert len(derivatives.get(('full', 'webp'), b'')) < len(compressed)
+
+def test_resized_derivatives():
+    compressed, derivatives = process_upload(photo(1200, 800))
+    for size, max_dimension in IMAGE_SIZES.items():
+        if max_dimension is None:
+            continue
+        for fmt in ('jpeg', 'webp'):
+            assert max(Image.open(BytesIO(derivatives[(size, fmt)])).size) == max_dimension
@@ -0,0 +1,23 @@
+"""Rehash decision of the password hasher"""
+from werkzeug.security import generate_password_hash
+from passwords import PasswordHasher
+
+def test_needs_rehash_compares_the_full_parameters():
+    hasher = PasswordHasher(method='pbkdf2:sha256:1000')
+    assert not hasher.needs_rehash(hasher.hash('secret'))
+    assert hasher.needs_rehash(generate_password_hash('secret', 'pbkdf2:sha256:2000'))
+    assert hasher.needs_rehash(generate_password_hash('secret', 'scrypt:16384:8:1'))
+
+def test_needs_rehash_with_a_method_given_without_parameters():
+    # werkzeug complète la méthode avec ses paramètres par défaut
+    hasher = PasswordHasher(method='pbkdf2')
+    assert hasher.prefix.startswith('pbkdf2:sha256:')
+    assert not hasher.needs_rehash(hasher.hash('secret'))
+
+def test_verify_and_rehash():
+    hasher = PasswordHasher(method='pbkdf2:sha256:1000')
+    old_hash = generate_password_hash('secret', 'pbkdf2:sha256:2000')
+    assert hasher.verify_and_rehash(old_hash, 'wrong') == (False, None)
+    matched, new_hash = hasher.verify_and_rehash(old_hash, 'secret')
+    assert matched and new_hash.startswith('pbkdf2:sha256:1000$')
+    assert hasher.verify_and_rehash(new_hash, 'secret') == (True, None)
@@ -0,0 +1,78 @@
+"""Settlement of the payments by the PaymentProcessor"""
+from datetime import timedelta
+import pytest
+import payments
+from models import db, Cart, Order, Payment, PaymentMethod, PaymentStatus, utcnow
+from payments import FakeProvider, PaymentProcessor
+
+@pytest.fixture
+def processor(app):
+    provider = FakeProvider('CC', (), 'Informations de carte manquantes', latency=0)
+    return PaymentProcessor(app, {PaymentMethod.CREDIT_CARD: provider}, max_workers=1, intent_timeout=120)
+
+@pytest.fixture
+def buyer(client, make_user, make_product):
+    """A customer with two units of a product at 2.5 in the cart"""
+    seller_id, _ = make_user('farmer')
+    product_id = make_product(seller_id, price=2.5)
+    buyer_id, headers = make_user('customer')
+    response = client.post('/api/cart/add', headers=headers, json={'product_id': product_id, 'quantity': 2})
+    assert response.status_code == 201
+    return buyer_id, headers
+
+def pending_payment(app, user_id, amount, created_at=None):
+    with app.app_context():
+        payment = Payment(
+            user_id=user_id, amount=amount, payment_method=PaymentMethod.CREDIT_CARD.value,
+            payment_status=PaymentStatus.PENDING.value, transaction_id=payments.new_transaction_id('CC'),
+            created_at=created_at or utcnow()
+        )
+        db.session.add(payment)
+        db.session.commit()
+        return payment.id
+
+def settle(app, processor, payment_id):
+    with app.app_context():
+        processor.settle(payment_id, '1 rue du Marché', {})
+        payment = db.session.get(Payment, payment_id)
+        return payment.payment_status, payment.failure_reason, Order.query.filter_by(payment_id=payment_id).count()
+
+def test_settle_creates_the_orders(app, processor, buyer):
+    payment_id = pending_payment(app, buyer[0], 5.0)
+    assert settle(app, processor, payment_id) == (PaymentStatus.COMPLETED.value, None, 1)
+    assert processor.providers[PaymentMethod.CREDIT_CARD].refunds == 0
+
+def test_settle_refunds_a_cart_changed_after_the_payment(app, processor, buyer):
+    payment_id = pending_payment(app, buyer[0], 10.0)
+    status, reason, orders = settle(app, processor, payment_id)
+    assert (status, orders) == (PaymentStatus.FAILED.value, 0)
+    assert reason == 'Le panier a changé pendant le paiement'
+    assert processor.providers[PaymentMethod.CREDIT_CARD].refunds == 1
+    with app.app_context():
+        assert Cart.query.filter_by(user_id=buyer[0]).count() == 1
+
+def test_settle_refunds_on_unexpected_errors(app, processor, buyer, monkeypatch):
+    def broken_checkout(*args):
+        raise RuntimeError('database is locked')
+    monkeypatch.setattr(payments, 'checkout_cart', broken_checkout)
+
+    payment_id = pending_payment(app, buyer[0], 5.0)
+    status, reason, orders = settle(app, processor, payment_id)
+    assert (status, reason, orders) == (PaymentStatus.FAILED.value, 'Erreur lors de la création de la commande', 0)
+    assert processor.providers[PaymentMethod.CREDIT_CARD].refunds == 1
+
+def test_stale_pending_payment_does_not_block_a_new_one(app, client, buyer):
+    buyer_id, headers = buyer
+    stale_id = pending_payment(app, buyer_id, 5.0, created_at=utcnow() - timedelta(hours=1))
+    data = {'payment_method': PaymentMethod.CASH_ON_DELIVERY.value, 'delivery_address': '1 rue du Marché'}
+
+    response = client.post('/api/payment/process', headers=headers, json=data)
+    assert response.status_code == 201
+    with app.app_context():
+        assert db.session.get(Payment, stale_id).payment_status == PaymentStatus.FAILED.value
+
+def test_recent_pending_payment_blocks_a_new_one(app, client, buyer):
+    buyer_id, headers = buyer
+    pending_payment(app, buyer_id, 5.0)
+    data = {'payment_method': PaymentMethod.CASH_ON_DELIVERY.value, 'delivery_address': '1 rue du Marché'}
+    assert client.post('/api/payment/process', headers=headers, json=data).status_code == 409
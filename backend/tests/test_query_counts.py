@@ -0,0 +1,100 @@
+"""Number of SQL statements of the listing endpoints
+
+Each listing loads its related rows in the same query (no lazy load per
+row), so the statements of a request do not grow with the number of
+rows. The bounds below hold for 50 rows as for one.
+"""
+import pytest
+from sqlalchemy import event
+import main
+from models import db, Order
+
+ROWS = 50
+
+class StatementCounter:
+    """Counts the statements sent to the database"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+
+    def _count(self, conn, cursor, statement, *args):
+        # Relecture périodique des révocations (revocation.py), sans lien avec la requête mesurée
+        if 'FROM revocation' not in statement:
+            self.count += 1
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self._count)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, 'before_cursor_execute', self._count)
+
+@pytest.fixture
+def count_statements(app, client):
+    """count_statements(path, headers) -> (response, number of statements)"""
+    def count(path, headers=None):
+        with app.app_context():
+            main.catalog_cache.invalidate()
+            engine = db.engine
+        with StatementCounter(engine) as counter:
+            response = client.get(path, headers=headers)
+        return response, counter.count
+    return count
+
+@pytest.fixture
+def farmer(make_user, make_product):
+    """A farmer with ROWS products"""
+    farmer_id, headers = make_user('farmer')
+    product_ids = [make_product(farmer_id) for _ in range(ROWS)]
+    return farmer_id, headers, product_ids
+
+def test_cart(client, make_user, farmer, count_statements):
+    _, _, product_ids = farmer
+    _, headers = make_user('customer')
+    for product_id in product_ids:
+        assert client.post('/api/cart/add', headers=headers, json={'product_id': product_id, 'quantity': 1}).status_code == 201
+
+    response, statements = count_statements('/api/cart', headers)
+    assert response.status_code == 200
+    assert len(response.get_json()) == ROWS
+    assert statements <= 2
+
+def test_orders(app, make_user, farmer, count_statements):
+    farmer_id, farmer_headers, product_ids = farmer
+    buyer_id, headers = make_user('customer')
+    with app.app_context():
+        db.session.add_all([
+            Order(buyer_id=buyer_id, product_id=product_id, quantity=1, total_price=2.5, delivery_address='1 rue du Marché')
+            for product_id in product_ids
+        ])
+        db.session.commit()
+
+    for user_headers in (headers, farmer_headers):
+        response, statements = count_statements('/api/orders', user_headers)
+        assert response.status_code == 200
+        assert len(response.get_json()) == ROWS
+        assert statements <= 2
+
+def test_farmer_products(farmer, count_statements):
+    _, headers, _ = farmer
+    response, statements = count_statements('/api/farmer/products', headers)
+    assert response.status_code == 200
+    assert len(response.get_json()) == ROWS
+    assert statements <= 2
+
+def test_pending_products(make_user, make_product, admin_headers, count_statements):
+    farmer_id, _ = make_user('farmer')
+    for _ in range(ROWS):
+        make_product(farmer_id, validated_by_admin=False)
+
+    response, statements = count_statements(f'/api/admin/products/pending?per_page={ROWS}', admin_headers)
+    assert response.status_code == 200
+    assert len(response.get_json()['products']) == ROWS
+    assert statements <= 2
+
+def test_catalog(farmer, count_statements):
+    response, statements = count_statements('/api/products')
+    assert response.status_code == 200
+    assert len(response.get_json()) >= ROWS
+    assert statements <= 2
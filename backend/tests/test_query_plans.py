@@ -0,0 +1,108 @@
+"""Query plans of the endpoints' statements
+
+Every statement a request sends is captured, then run again under
+EXPLAIN QUERY PLAN: none may scan a whole table among the indexed ones
+(a SEARCH through an index or the primary key is expected). A filter
+that loses its index, or a new query without one, fails the test.
+"""
+import re
+import pytest
+from sqlalchemy import event
+import main
+from models import db, Order
+
+# Tables dont les filtres chauds ont un index (schema.py, migration 2)
+INDEXED_TABLES = ('order', 'order_header', 'product', 'cart', 'payment')
+# SEARCH passe par un index ou la clé primaire, SCAN lit toute la table (ou tout un index)
+FULL_SCAN = re.compile(r'^SCAN (\w+)')
+
+class StatementCapture:
+    """Records the statements sent to the database, with their first parameters"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.statements = []
+
+    def _capture(self, conn, cursor, statement, parameters, context, executemany):
+        if executemany:
+            parameters = parameters[0]
+        self.statements.append((statement, parameters))
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self._capture)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, 'before_cursor_execute', self._capture)
+
+def full_scans(statements):
+    """(statement, plan line) for each scan of an indexed table"""
+    scans = []
+    with db.engine.connect() as conn:
+        for statement, parameters in statements:
+            if not statement.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE', 'INSERT', 'WITH')):
+                continue
+            for row in conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters):
+                detail = row[-1]
+                match = FULL_SCAN.match(detail)
+                if match and match.group(1).strip('"') in INDEXED_TABLES:
+                    scans.append((statement, detail))
+    return scans
+
+@pytest.fixture
+def plans(app, client):
+    """plans(method, path, **kwargs) -> (response, full scans of its statements)"""
+    def run(method, path, **kwargs):
+        with app.app_context():
+            main.catalog_cache.invalidate()
+            engine = db.engine
+        with StatementCapture(engine) as capture:
+            response = client.open(path, method=method, **kwargs)
+        with app.app_context():
+            return response, full_scans(capture.statements)
+    return run
+
+@pytest.fixture
+def shop(app, make_user, make_product):
+    """A farmer with validated and pending products, a customer with orders"""
+    farmer_id, farmer_headers = make_user('farmer')
+    product_ids = [make_product(farmer_id) for _ in range(5)]
+    make_product(farmer_id, validated_by_admin=False)
+    buyer_id, buyer_headers = make_user('customer')
+    with app.app_context():
+        db.session.add_all([
+            Order(buyer_id=buyer_id, product_id=product_id, quantity=1, total_price=2.5, delivery_address='1 rue du Marché')
+            for product_id in product_ids
+        ])
+        db.session.commit()
+    return {'farmer': farmer_headers, 'buyer': buyer_headers, 'product_ids': product_ids}
+
+@pytest.mark.parametrize('path, user', [
+    ('/api/products', None),
+    ('/api/products?limit=2&sort=price', None),
+    ('/api/products?limit=2&sort=-created_at', None),
+    ('/api/cart', 'buyer'),
+    ('/api/orders', 'buyer'),
+    ('/api/orders', 'farmer'),
+    ('/api/farmer/products', 'farmer'),
+])
+def test_listings_use_indexes(shop, plans, path, user):
+    response, scans = plans('GET', path, headers=shop[user] if user else None)
+    assert response.status_code == 200
+    assert scans == []
+
+def test_pending_products_use_indexes(shop, plans, admin_headers):
+    response, scans = plans('GET', '/api/admin/products/pending', headers=admin_headers)
+    assert response.status_code == 200
+    assert scans == []
+
+def test_cart_and_checkout_use_indexes(shop, plans):
+    headers = shop['buyer']
+    for product_id in shop['product_ids'][:2]:
+        response, scans = plans('POST', '/api/cart/add', headers=headers, json={'product_id': product_id, 'quantity': 1})
+        assert response.status_code == 201
+        assert scans == []
+
+    response, scans = plans('POST', '/api/cart/checkout', headers=headers, json={'delivery_address': '1 rue du Marché'})
+    assert response.status_code == 201
+    assert scans == []
@@ -0,0 +1,37 @@
+"""Token revocation on logout and on account deactivation"""
+from flask_jwt_extended import create_access_token
+from auth import admin_claims, user_claims
+from models import db, Admin, User
+
+def admin_with_id(app, admin_id):
+    """Authorization headers of the administrator with this id, created if needed"""
+    with app.app_context():
+        if db.session.get(Admin, admin_id) is None:
+            db.session.add(Admin(id=admin_id, email=f'admin-id{admin_id}@test.local', password='x', name='Admin'))
+            db.session.commit()
+        token = create_access_token(identity=str(admin_id), additional_claims=admin_claims())
+    return {'Authorization': f'Bearer {token}'}
+
+def test_logout_revokes_only_this_token(app, client, make_user):
+    user_id, headers = make_user('customer')
+    with app.app_context():
+        other_token = create_access_token(identity=str(user_id), additional_claims=user_claims(db.session.get(User, user_id)))
+
+    assert client.post('/api/logout', headers=headers).status_code == 200
+
+    assert client.get('/api/cart', headers=headers).status_code == 401
+    assert client.get('/api/cart', headers={'Authorization': f'Bearer {other_token}'}).status_code == 200
+
+def test_deactivated_user_tokens_are_revoked_but_not_the_admin_with_the_same_id(app, client, make_user, admin_headers):
+    user_id, headers = make_user('customer')
+    assert client.get('/api/cart', headers=headers).status_code == 200
+
+    response = client.put(f'/api/admin/users/{user_id}/status', headers=admin_headers, json={'active': False})
+    assert response.status_code == 200
+
+    response = client.get('/api/cart', headers=headers)
+    assert response.status_code == 401
+    assert response.get_json()['error'] == 'Session expirée, veuillez vous reconnecter'
+    # Ids admin et user se recouvrent : la révocation de l'utilisateur ne touche pas l'admin
+    same_id_admin = admin_with_id(app, user_id)
+    assert client.get('/api/admin/catalog-cache', headers=same_id_admin).status_code == 200
@@ -0,0 +1,89 @@
+"""Read/write routing with a replica bind
+
+A second app shares the models' db with a SQLite primary and an
+unsynced SQLite replica: a read served by the replica sees the state of
+the last ReplicaSync.sync(), not the later writes.
+"""
+import os
+import time
+import pytest
+from flask import Flask
+from conftest import TMP_DIR
+from models import db, Payment, PaymentMethod, PaymentStatus
+from routing import WRITE_COOKIE, WRITE_HEADER, ReplicaSync
+
+@pytest.fixture(scope='module')
+def replica_app():
+    primary = os.path.join(TMP_DIR, 'routing-primary.db')
+    replica = os.path.join(TMP_DIR, 'routing-replica.db')
+    app = Flask('routing-test')
+    app.config.update(
+        SQLALCHEMY_DATABASE_URI=f'sqlite:///{primary}',
+        SQLALCHEMY_BINDS={'replica_0': f'sqlite:///{replica}'},
+    )
+    db.init_app(app)
+    with app.app_context():
+        db.create_all(bind_key=None)
+    app.replica_sync = ReplicaSync(primary, [replica])
+    return app
+
+def pending_payment(app):
+    with app.app_context():
+        payment = Payment(
+            user_id=1, amount=5.0, payment_method=PaymentMethod.CREDIT_CARD.value,
+            payment_status=PaymentStatus.PENDING.value
+        )
+        db.session.add(payment)
+        db.session.commit()
+        payment_id = payment.id
+    app.replica_sync.sync()
+    return payment_id
+
+def status_of(payment_id):
+    return db.session.execute(db.select(Payment.payment_status).where(Payment.id == payment_id)).scalar()
+
+def test_get_reads_from_the_replica(replica_app):
+    payment_id = pending_payment(replica_app)
+    with replica_app.app_context():
+        db.session.execute(db.update(Payment).where(Payment.id == payment_id).values(payment_status='failed'))
+        db.session.commit()
+
+    with replica_app.test_request_context(method='GET'):
+        assert status_of(payment_id) == PaymentStatus.PENDING.value
+
+def test_reads_after_a_commit_stay_on_the_primary(replica_app):
+    payment_id = pending_payment(replica_app)
+    with replica_app.test_request_context(method='GET'):
+        # Comme get_payment_status : lecture, expire() (UPDATE + commit), relecture
+        assert status_of(payment_id) == PaymentStatus.PENDING.value
+        db.session.execute(db.update(Payment).where(Payment.id == payment_id).values(payment_status='failed'))
+        db.session.commit()
+        assert status_of(payment_id) == 'failed'
+
+def test_recent_write_marker_keeps_the_client_on_the_primary(replica_app):
+    payment_id = pending_payment(replica_app)
+    with replica_app.app_context():
+        db.session.execute(db.update(Payment).where(Payment.id == payment_id).values(payment_status='failed'))
+        db.session.commit()
+
+    now = time.time()
+    with replica_app.test_request_context(method='GET', headers={WRITE_HEADER: f'{now - 1:.3f}'}):
+        assert status_of(payment_id) == 'failed'
+    with replica_app.test_request_context(method='GET', headers={'Cookie': f'{WRITE_COOKIE}={now - 1:.3f}'}):
+        assert status_of(payment_id) == 'failed'
+    # Marqueur trop ancien, ou d'un autre client : la réplique
+    with replica_app.test_request_context(method='GET', headers={WRITE_HEADER: f'{now - 3600:.3f}'}):
+        assert status_of(payment_id) == PaymentStatus.PENDING.value
+
+def test_write_responses_carry_the_marker(client, make_user, make_product):
+    seller_id, _ = make_user('farmer')
+    product_id = make_product(seller_id)
+    _, headers = make_user('customer')
+
+    response = client.post('/api/cart/add', headers=headers, json={'product_id': product_id, 'quantity': 1})
+    assert response.status_code == 201
+    assert abs(float(response.headers[WRITE_HEADER]) - time.time()) < 5
+    assert f'{WRITE_COOKIE}=' in response.headers['Set-Cookie']
+
+    response = client.get('/api/cart', headers=headers)
+    assert WRITE_HEADER not in response.headers
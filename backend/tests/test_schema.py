@@ -0,0 +1,76 @@
+"""Backfill of Order.payment_id by the migrations"""
+from datetime import UTC, datetime, timedelta
+from models import db, Order, Payment, PaymentMethod, PaymentStatus
+from schema import backfill_order_payments
+
+START = datetime(2025, 1, 6, 10, 0, 0)
+
+def add_payment(user_id, created_at):
+    payment = Payment(
+        user_id=user_id, amount=5.0, payment_method=PaymentMethod.CASH_ON_DELIVERY.value,
+        payment_status=PaymentStatus.AWAITING_DELIVERY.value, created_at=created_at
+    )
+    db.session.add(payment)
+    db.session.flush()
+    return payment.id
+
+def add_order(user_id, product_id, created_at):
+    order = Order(
+        buyer_id=user_id, product_id=product_id, quantity=1, total_price=5.0,
+        delivery_address='1 rue du Marché', created_at=created_at
+    )
+    db.session.add(order)
+    db.session.flush()
+    return order.id
+
+def test_backfill_links_only_unambiguous_orders(app, make_user, make_product):
+    seller_id, _ = make_user('farmer')
+    product_id = make_product(seller_id)
+    single, baseline, between = (make_user('customer')[0] for _ in range(3))
+
+    with app.app_context():
+        # Paiement et commande de la même requête, puis une commande sans paiement
+        paid = add_payment(single, START)
+        linked_order = add_order(single, product_id, START + timedelta(milliseconds=8))
+        unpaid_order = add_order(single, product_id, START + timedelta(hours=1))
+        # Lignes écrites par les premiers models.py : created_at identiques
+        for _ in range(2):
+            add_payment(baseline, START)
+        baseline_orders = [add_order(baseline, product_id, START) for _ in range(3)]
+        # Deux paiements à égale distance de la commande
+        add_payment(between, START - timedelta(seconds=1))
+        add_payment(between, START + timedelta(seconds=1))
+        between_order = add_order(between, product_id, START)
+        db.session.commit()
+
+        with db.engine.begin() as conn:
+            backfill_order_payments(conn)
+
+        payment_of = dict(db.session.query(Order.id, Order.payment_id))
+        assert payment_of[linked_order] == paid
+        assert payment_of[unpaid_order] is None
+        assert [payment_of[order_id] for order_id in baseline_orders] == [None] * 3
+        assert payment_of[between_order] is None
+
+def test_confirming_a_payment_older_than_the_migration_confirms_its_unlinked_orders(app, client, make_user, make_product):
+    seller_id, _ = make_user('farmer')
+    product_id = make_product(seller_id)
+    buyer_id, headers = make_user('customer')
+
+    with app.app_context():
+        # Lignes de l'application d'origine : mêmes created_at, le backfill les laisse sans paiement
+        legacy_payment = add_payment(buyer_id, START)
+        legacy_orders = [add_order(buyer_id, product_id, START) for _ in range(2)]
+        Order.query.filter(Order.id.in_(legacy_orders)).update({'status': 'awaiting_payment'})
+        # Paiement récent sans commande rattachée : ne touche pas aux commandes anciennes
+        recent_payment = add_payment(buyer_id, datetime.now(UTC).replace(tzinfo=None))
+        db.session.commit()
+
+    assert client.post(f'/api/payment/confirm-delivery/{recent_payment}', headers=headers).status_code == 200
+    with app.app_context():
+        assert {order.status for order in Order.query.filter(Order.id.in_(legacy_orders))} == {'awaiting_payment'}
+
+    assert client.post(f'/api/payment/confirm-delivery/{legacy_payment}', headers=headers).status_code == 200
+    with app.app_context():
+        orders = Order.query.filter(Order.id.in_(legacy_orders)).all()
+        assert {(order.status, order.payment_id) for order in orders} == {('pending', legacy_payment)}
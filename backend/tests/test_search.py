@@ -0,0 +1,47 @@
+"""Full-text search of /api/products/search"""
+from models import db, Product
+
+def search_ids(client, query, **args):
+    response = client.get('/api/products/search', query_string={'q': query, 'limit': 100, **args})
+    assert response.status_code == 200
+    return [product['id'] for product in response.get_json()['products']]
+
+def test_accents_are_ignored(client, make_user, make_product):
+    seller_id, _ = make_user('farmer')
+    product_id = make_product(seller_id, name='Légumes Quimperois', description='Panier de saison')
+
+    assert product_id in search_ids(client, 'legumes quimperois')
+    assert product_id in search_ids(client, 'LÉGUMES quimpérois')
+
+def test_words_match_as_prefixes_and_are_all_required(client, make_user, make_product):
+    seller_id, _ = make_user('farmer')
+    product_id = make_product(seller_id, name='Légumes Brestois', description='Panier de saison')
+
+    assert product_id in search_ids(client, 'leg brest')
+    assert product_id in search_ids(client, 'brest sais')
+    assert product_id not in search_ids(client, 'leg brest tomates')
+
+def test_name_matches_rank_before_description_matches(client, make_user, make_product):
+    seller_id, _ = make_user('farmer')
+    in_description = make_product(seller_id, name='Panier Lorientais', description='Courgettes vertes')
+    in_name = make_product(seller_id, name='Courgettes Lorientaises', description='Du jardin')
+
+    assert search_ids(client, 'courgettes lorient') == [in_name, in_description]
+
+def test_index_follows_renamed_products(app, client, make_user, make_product):
+    seller_id, _ = make_user('farmer')
+    product_id = make_product(seller_id, name='Navets Vannetais')
+    with app.app_context():
+        db.session.get(Product, product_id).name = 'Radis Vannetais'
+        db.session.commit()
+
+    assert product_id in search_ids(client, 'radis vannet')
+    assert product_id not in search_ids(client, 'navets vannet')
+
+def test_fts_syntax_in_the_query_is_ignored(client, make_user, make_product):
+    seller_id, _ = make_user('farmer')
+    product_id = make_product(seller_id, name='Poireaux Malouins')
+
+    assert product_id in search_ids(client, '"poireaux* (malouins')
+    # Les opérateurs deviennent des mots à trouver
+    assert product_id not in search_ids(client, 'poireaux OR malouins')
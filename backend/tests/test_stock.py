@@ -0,0 +1,37 @@
+"""Stock reservation under concurrent /api/cart/add requests"""
+import threading
+from models import db, Cart, Product
+
+INITIAL_STOCK = 40
+THREADS = 8
+
+def test_concurrent_cart_add_never_oversells(app, make_user, make_product):
+    seller_id, _ = make_user('farmer')
+    product_id = make_product(seller_id, quantity=INITIAL_STOCK)
+    customers = [make_user('customer') for _ in range(THREADS)]
+    accepted = [0] * THREADS
+    statuses = set()
+    start = threading.Barrier(THREADS)
+
+    def buy(index, headers):
+        client = app.test_client()
+        start.wait()
+        while True:
+            response = client.post('/api/cart/add', headers=headers, json={'product_id': product_id, 'quantity': 1})
+            statuses.add(response.status_code)
+            if response.status_code != 201:
+                return
+            accepted[index] += 1
+
+    threads = [threading.Thread(target=buy, args=(index, headers)) for index, (_, headers) in enumerate(customers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert statuses == {201, 400}
+    assert sum(accepted) == INITIAL_STOCK
+    with app.app_context():
+        assert db.session.get(Product, product_id).quantity == 0
+        in_carts = db.session.query(db.func.sum(Cart.quantity)).filter(Cart.product_id == product_id).scalar()
+        assert in_carts == INITIAL_STOCK
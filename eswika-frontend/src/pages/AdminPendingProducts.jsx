@@ -1,6 +1,7 @@
 import React, { useState, useEffect } from 'react';
 import { Check, ChevronLeft, ChevronRight } from 'lucide-react';
 import axios from 'axios';
+import { productImageSrc } from '../services/api';
 
 const AdminPendingProducts = () => {
   const [products, setProducts] = useState([]);
@@ -113,10 +114,10 @@ const AdminPendingProducts = () => {
                       </div>
                     </div>
                     
-                    {product.image_data && (
+                    {product.image_url && (
                       <div className="lg:ml-6 mt-4 lg:mt-0">
                         <img
-                          src={`data:image/jpeg;base64,${product.image_data}`}
+                          src={productImageSrc(product, 'card')}
                           alt={product.name}
                           className="w-full lg:w-64 h-48 object-cover rounded-md"
                         />
@@ -4,7 +4,7 @@ import { Link } from 'react-router-dom';
 import Slider from 'react-slick';
 import "slick-carousel/slick/slick.css";
 import "slick-carousel/slick/slick-theme.css";
-import { api } from '../services/api';
+import { api, productImageSrc } from '../services/api';
 
 // Import your images
 import slide1 from './S1.jpg';
@@ -101,7 +101,7 @@ const Home = () => {
           {featuredProducts.map((product) => (
             <div key={product.id} className="border rounded-lg overflow-hidden shadow-lg">
               <img 
-  src={`http://localhost:5000${product.image_url}`} 
+  src={productImageSrc(product, 'card')} 
   alt={product.name}
   className="w-full h-48 object-cover"
   onError={(e) => {
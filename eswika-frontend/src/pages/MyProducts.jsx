@@ -2,6 +2,7 @@ import React, { useState, useEffect } from 'react';
 import { CheckCircle, XCircle, Edit, Trash2 } from 'lucide-react';
 import axios from 'axios';
 import { Link } from 'react-router-dom';
+import { productImageSrc } from '../services/api';
 
 const MyProducts = () => {
   const [products, setProducts] = useState([]);
@@ -93,9 +94,9 @@ const MyProducts = () => {
 
               {/* Image and Content */}
               <div className="p-4 pt-0">
-                {product.image_data && (
+                {product.image_url && (
                   <img
-                    src={`data:image/jpeg;base64,${product.image_data}`}
+                    src={productImageSrc(product, 'card')}
                     alt={product.name}
                     className="w-full h-48 object-cover mb-4 rounded-md"
                   />
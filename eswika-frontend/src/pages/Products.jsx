@@ -1,6 +1,6 @@
 import React, { useState, useEffect } from 'react';
 import { useNavigate } from 'react-router-dom';
-import { api } from '../services/api';
+import { api, productImageSrc } from '../services/api';
 import { useAuth } from '../context/AuthContext';
 import { PlusCircle, MinusCircle, ShoppingCart } from 'lucide-react';
 import axios from 'axios';
@@ -83,7 +83,7 @@ const Products = () => {
           <div key={product.id} className="border rounded-lg overflow-hidden shadow-lg">
             
             <img 
-              src={`http://localhost:5000${product.image_url}`}
+              src={productImageSrc(product, 'card')}
               alt={product.name}
               className="w-full h-48 object-cover"
               onError={(e) => {
@@ -1,7 +1,18 @@
 // src/services/api.js
 import axios from 'axios';
 
-const API_URL = 'http://localhost:5000/api';
+const SERVER_URL = 'http://localhost:5000';
+const API_URL = `${SERVER_URL}/api`;
+
+// Source d'une image produit : les URL absolues (imports en masse) sont servies telles quelles,
+// les images du serveur existent en tailles réduites (size=thumb|card)
+export const productImageSrc = (product, size) => {
+  if (/^https?:\/\//i.test(product.image_url)) {
+    return product.image_url;
+  }
+  const src = `${SERVER_URL}${product.image_url}`;
+  return product.image_version && size ? `${src}&size=${size}` : src;
+};
 
 const axiosInstance = axios.create({
   baseURL: API_URL,
@@ -24,6 +35,29 @@ axiosInstance.interceptors.request.use(
   }
 );
 
+// Lire ses propres écritures : l'heure de la dernière écriture (X-Last-Write)
+// est renvoyée au serveur, qui lit alors sur la base primaire et non sur une réplique
+const trackWrites = (instance) => {
+  instance.interceptors.request.use((config) => {
+    const lastWrite = sessionStorage.getItem('lastWrite');
+    if (lastWrite) {
+      config.headers['X-Last-Write'] = lastWrite;
+    }
+    return config;
+  });
+  instance.interceptors.response.use((response) => {
+    const lastWrite = response.headers['x-last-write'];
+    if (lastWrite) {
+      sessionStorage.setItem('lastWrite', lastWrite);
+    }
+    return response;
+  });
+};
+
+// Les pages appellent aussi axios directement
+trackWrites(axios);
+trackWrites(axiosInstance);
+
 // Response interceptor pour gérer les erreurs
 axiosInstance.interceptors.response.use(
   (response) => response,